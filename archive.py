@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Archive of fetched pages.
+Keeps every response the crawler receives (search and detail pages) with
+its URL, fetch time, status and headers, in a SQLite file. Bodies are
+content-addressed: each distinct body is stored once, compressed with zstd
+when the `zstandard` package is installed and with deflate (the gzip
+compression) otherwise, so that re-fetching an unchanged page costs one
+small row. Pages of the same kind share most of their markup, so the
+first page of each kind is kept as a preset dictionary for the others.
+Extraction can then be re-run offline with
+`crawler.py --reparse-from <archive>` after the selectors change.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+from frontier import LISTING
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_NAME = "pages.db"
+
+ZSTD_LEVEL = 3
+DEFLATE_LEVEL = 6
+
+# deflate only looks back this far, so longer dictionaries are truncated
+DEFLATE_WINDOW = 32 * 1024
+
+# Bytes of the file read through a memory map rather than read() calls
+MMAP_SIZE = 1 << 30
+
+# Seconds to wait for the write lock held by another crawler
+BUSY_TIMEOUT = 30.0
+
+
+class ArchivedResponse(NamedTuple):
+    url: str
+    kind: str
+    fetched_at: float
+    status: int
+    headers: Dict[str, str]
+    content: bytes
+
+
+class PageArchive:
+    """
+    Every archived response, indexed by kind and URL, and the distinct
+    bodies they point to, keyed by their SHA-256.
+    """
+    
+    def __init__(self, path: str = ARCHIVE_NAME):
+        self.path = path
+        self._lock = threading.Lock()
+        # The workers of a multi-process crawl share the archive, and
+        # Crawler.listings() crawls on another thread than the one that opened it
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        # Each store() is its own small transaction; in WAL mode they do
+        # not wait for an fsync
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS dictionaries (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL UNIQUE,
+                data BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bodies (
+                digest TEXT PRIMARY KEY,
+                codec TEXT NOT NULL,
+                dictionary INTEGER REFERENCES dictionaries (id),
+                size INTEGER NOT NULL,
+                data BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                digest TEXT NOT NULL REFERENCES bodies (digest)
+            );
+            CREATE INDEX IF NOT EXISTS idx_responses_kind_url ON responses (kind, url);
+        """)
+        self._migrate()
+        self._load_dictionaries()
+    
+    def _migrate(self):
+        """Move the detail pages of an archive written by older versions (one zlib body per URL)."""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(pages)")}
+        if 'body' not in columns:
+            return
+        try:
+            for url, fetched_at, data in self._conn.execute("SELECT url, fetched_at, body FROM pages ORDER BY rowid"):
+                content = zlib.decompress(data)
+                digest = hashlib.sha256(content).hexdigest()
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO bodies (digest, codec, size, data) VALUES (?, 'deflate', ?, ?)",
+                    (digest, len(content), data)
+                )
+                self._conn.execute(
+                    "INSERT INTO responses (url, kind, fetched_at, status, headers, digest) VALUES (?, ?, ?, 200, '{}', ?)",
+                    (url, LISTING, fetched_at, digest)
+                )
+            self._conn.execute("DROP TABLE pages")
+            self._conn.commit()
+        except sqlite3.Error:
+            self._conn.rollback()
+            raise
+    
+    def _load_dictionaries(self):
+        # kind -> dictionary id, and dictionary id -> raw content
+        self._kinds: Dict[str, int] = {}
+        self._dictionaries: Dict[int, bytes] = {}
+        # zstd (de)compressors, built once per dictionary
+        self._zstd: Dict[Tuple[str, Optional[int]], object] = {}
+        for dictionary_id, kind, data in self._conn.execute("SELECT id, kind, data FROM dictionaries"):
+            self._kinds[kind] = dictionary_id
+            self._dictionaries[dictionary_id] = data
+    
+    def _dictionary(self, kind: str, content: bytes) -> int:
+        """Id of the dictionary of `kind`, made from `content` if the kind has none yet."""
+        if kind not in self._kinds:
+            # Another crawler writing to the same archive may have made it first
+            self._conn.execute("INSERT OR IGNORE INTO dictionaries (kind, data) VALUES (?, ?)", (kind, content))
+            dictionary_id, data = self._conn.execute(
+                "SELECT id, data FROM dictionaries WHERE kind = ?", (kind,)
+            ).fetchone()
+            self._kinds[kind] = dictionary_id
+            self._dictionaries[dictionary_id] = data
+        return self._kinds[kind]
+    
+    def _zstd_codec(self, direction: str, dictionary: Optional[int]):
+        key = (direction, dictionary)
+        if key not in self._zstd:
+            if zstandard is None:
+                raise RuntimeError(f"{self.path} holds zstd-compressed pages; install the zstandard package to read it")
+            dict_data = None
+            if dictionary is not None:
+                dict_data = zstandard.ZstdCompressionDict(self._dictionaries[dictionary],
+                                                          dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+            if direction == 'compress':
+                self._zstd[key] = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data)
+            else:
+                self._zstd[key] = zstandard.ZstdDecompressor(dict_data=dict_data)
+        return self._zstd[key]
+    
+    def _compress(self, content: bytes, dictionary: int) -> Tuple[str, bytes]:
+        if zstandard is not None:
+            return 'zstd', self._zstd_codec('compress', dictionary).compress(content)
+        compressor = zlib.compressobj(DEFLATE_LEVEL, zdict=self._dictionaries[dictionary][-DEFLATE_WINDOW:])
+        return 'deflate', compressor.compress(content) + compressor.flush()
+    
+    def _decompress(self, codec: str, dictionary: Optional[int], data: bytes) -> bytes:
+        if dictionary is not None and dictionary not in self._dictionaries:
+            # Made by another crawler writing to the archive
+            self._load_dictionaries()
+        if codec == 'deflate':
+            if dictionary is None:
+                return zlib.decompress(data)
+            decompressor = zlib.decompressobj(zdict=self._dictionaries[dictionary][-DEFLATE_WINDOW:])
+            return decompressor.decompress(data) + decompressor.flush()
+        if codec == 'zstd':
+            return self._zstd_codec('decompress', dictionary).decompress(data)
+        raise ValueError(f"Unknown codec in {self.path}: {codec}")
+    
+    def store(self, url: str, response, kind: str = LISTING):
+        """Archive a requests.Response fetched from `url`; its body is only compressed the first time it is seen."""
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        with self._lock:
+            try:
+                if self._conn.execute("SELECT 1 FROM bodies WHERE digest = ?", (digest,)).fetchone() is None:
+                    dictionary = self._dictionary(kind, content)
+                    codec, data = self._compress(content, dictionary)
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO bodies (digest, codec, dictionary, size, data) VALUES (?, ?, ?, ?, ?)",
+                        (digest, codec, dictionary, len(content), data)
+                    )
+                self._conn.execute(
+                    "INSERT INTO responses (url, kind, fetched_at, status, headers, digest) VALUES (?, ?, ?, ?, ?, ?)",
+                    (url, kind, time.time(), response.status_code, json.dumps(dict(response.headers)), digest)
+                )
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn.rollback()
+                # Forget a dictionary created in the rolled back transaction
+                self._load_dictionaries()
+                raise
+    
+    def get(self, url: str, kind: str = LISTING) -> Optional[ArchivedResponse]:
+        """The latest response archived for `url`, or None."""
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT r.fetched_at, r.status, r.headers, b.codec, b.dictionary, b.data
+                FROM responses r JOIN bodies b ON b.digest = r.digest
+                WHERE r.kind = ? AND r.url = ?
+                ORDER BY r.id DESC LIMIT 1
+            """, (kind, url)).fetchone()
+            if row is None:
+                return None
+            fetched_at, status, headers, codec, dictionary, data = row
+            return ArchivedResponse(url, kind, fetched_at, status, json.loads(headers),
+                                    self._decompress(codec, dictionary, data))
+    
+    def __len__(self) -> int:
+        """Number of distinct detail page URLs."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(DISTINCT url) FROM responses WHERE kind = ?", (LISTING,)
+            ).fetchone()[0]
+    
+    def latest(self, kind: Optional[str] = None) -> Iterator[ArchivedResponse]:
+        """
+        Stream the latest response of each URL (of one kind, or of every
+        kind), ordered by kind and URL, without loading the archive in memory.
+        """
+        # The bare columns come from the row holding MAX(id)
+        with self._lock:
+            cursor = self._conn.execute("""
+                SELECT latest.url, latest.kind, latest.fetched_at, latest.status, latest.headers,
+                    b.codec, b.dictionary, b.data
+                FROM (
+                    SELECT url, kind, MAX(id), fetched_at, status, headers, digest FROM responses
+                    WHERE ? IS NULL OR kind = ?
+                    GROUP BY kind, url
+                ) latest
+                JOIN bodies b ON b.digest = latest.digest
+                ORDER BY latest.kind, latest.url
+            """, (kind, kind))
+        while True:
+            # The rows of a batch are decoded before the lock is released
+            with self._lock:
+                rows = cursor.fetchmany(100)
+                responses = [
+                    ArchivedResponse(url, kind, fetched_at, status, json.loads(headers),
+                                     self._decompress(codec, dictionary, data))
+                    for url, kind, fetched_at, status, headers, codec, dictionary, data in rows
+                ]
+            if not responses:
+                break
+            yield from responses
+    
+    def __iter__(self) -> Iterator[Tuple[str, bytes]]:
+        """Stream (url, content) of the latest copy of each detail page."""
+        for response in self.latest(LISTING):
+            yield response.url, response.content
+    
+    def stats(self) -> Dict[str, int]:
+        """Responses, distinct bodies, and their raw size and stored size (with the dictionaries) in bytes."""
+        with self._lock:
+            responses = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            bodies, content_bytes, stored_bytes = self._conn.execute("""
+                SELECT COUNT(*), COALESCE(SUM(size), 0),
+                    COALESCE(SUM(LENGTH(data)), 0) + (SELECT COALESCE(SUM(LENGTH(data)), 0) FROM dictionaries)
+                FROM bodies
+            """).fetchone()
+        return {'responses': responses, 'bodies': bodies, 'content_bytes': content_bytes, 'stored_bytes': stored_bytes}
+    
+    def report(self) -> str:
+        """One-line summary of the archive for the end-of-run output."""
+        s = self.stats()
+        ratio = s['content_bytes'] / s['stored_bytes'] if s['stored_bytes'] else 1
+        return (f"Archive {self.path}: {s['responses']} responses, {len(self)} detail pages, "
+                f"{s['bodies']} distinct bodies, {s['content_bytes'] / 1024:.1f} KiB stored in "
+                f"{s['stored_bytes'] / 1024:.1f} KiB ({ratio:.1f}x)")
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
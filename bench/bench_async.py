@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark the serial and async crawl engines against the local stub server.
+
+Both engines get the same politeness budget: the serial engine sleeps
+1/rate seconds between requests, the async engine is limited to `rate`
+requests per second per host.
+
+Usage:
+    python bench/bench_async.py [--coops-per-sector N] [--latency S] [--rate R] [--concurrency C]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import crawler  # noqa: E402
+from fhcq_stub import Catalogue, start_stub_server  # noqa: E402
+
+
+def run_engine(engine: str, server, base_url: str, args) -> dict:
+    """Run one full crawl against the stub and return its measurements."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        server.request_count = 0
+        argv = ['--engine', engine, '--base-url', base_url, '--db', db_path, '--no-cache',
+                '--concurrency', str(args.concurrency), '--rate', str(args.rate), '--burst', str(args.burst)]
+        crawler.REQUEST_DELAY = 1 / args.rate
+        
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            crawler.main(argv)
+        elapsed = time.perf_counter() - start
+        
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+        conn.close()
+    
+    return {
+        'engine': engine,
+        'seconds': elapsed,
+        'requests': server.request_count,
+        'rows': rows,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--coops-per-sector', type=int, default=8)
+    parser.add_argument('--per-page', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.05, help="Server latency per response in seconds")
+    parser.add_argument('--rate', type=float, default=20, help="Politeness budget in requests per second")
+    parser.add_argument('--burst', type=float, default=2)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--engines', default="serial,async", help="Comma-separated engines to run")
+    args = parser.parse_args()
+    
+    catalogue = Catalogue(args.coops_per_sector, args.per_page)
+    server, base_url = start_stub_server(catalogue, args.latency)
+    print(f"Stub catalogue: {len(catalogue.coops)} coops, latency {args.latency * 1000:.0f} ms, "
+          f"budget {args.rate:g} req/s, concurrency {args.concurrency}")
+    
+    try:
+        results = [run_engine(engine, server, base_url, args) for engine in args.engines.split(',')]
+    finally:
+        server.shutdown()
+    
+    print(f"\n{'engine':<8} {'seconds':>8} {'requests':>9} {'req/s':>7} {'rows':>6}")
+    for result in results:
+        print(f"{result['engine']:<8} {result['seconds']:>8.2f} {result['requests']:>9} "
+              f"{result['requests'] / result['seconds']:>7.1f} {result['rows']:>6}")
+    
+    # Lower bound set by the politeness budget alone
+    print(f"\nPoliteness floor for {results[-1]['requests']} requests: {results[-1]['requests'] / args.rate:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+End-to-end and per-stage crawl benchmark against the local stub server.
+
+Runs a full crawl of the stub catalogue (or of pages replayed from an
+archive written by `crawler.py --archive`), then times the crawler's
+stages on their own:
+
+- search: get_listing_urls() over every sector/dwelling type combination
+- extract: extract_listing_data() on a sample of detail pages (fetch and
+  parse), and the parse alone on the same pages
+- save: ListingWriter.save_listing() of --save-rows listings into a
+  fresh database
+
+The results are printed and, with --out, saved as JSON. --compare prints
+the change from a saved run and exits with status 1 when a metric got
+worse by more than --threshold.
+
+Usage:
+    python bench/bench_crawl.py [--coops-per-sector N | --replay ARCHIVE] [--latency S]
+                                [--error-rate P] [--drop-rate P] [--engine serial|async]
+                                [--out results.json] [--compare baseline.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import crawler  # noqa: E402
+from extractor import parse_listing_page  # noqa: E402
+from fhcq_stub import Catalogue, ReplayCatalogue, start_stub_server  # noqa: E402
+from frontier import Frontier  # noqa: E402
+from schema import init_schema  # noqa: E402
+
+# (section, metric, unit, whether higher is better), in report order
+METRICS = [
+    ('crawl', 'seconds', "s", False),
+    ('crawl', 'pages_per_second', "pages/s", True),
+    ('crawl', 'listings_per_second', "listings/s", True),
+    ('crawl', 'parse_ms_per_page', "ms", False),
+    ('crawl', 'db_rows_per_second', "rows/s", True),
+    ('search', 'pages_per_second', "pages/s", True),
+    ('search', 'ms_per_page', "ms", False),
+    ('extract', 'ms_per_page', "ms", False),
+    ('extract', 'parse_ms_per_page', "ms", False),
+    ('save', 'rows_per_second', "rows/s", True),
+]
+
+
+def _counter(report: Dict, name: str) -> float:
+    return sum(c['value'] for c in report['counters'] if c['name'] == name)
+
+
+def _histogram(report: Dict, name: str) -> Tuple[int, float]:
+    """Count and sum of a histogram over all its label sets."""
+    histograms = [h for h in report['histograms'] if h['name'] == name]
+    return sum(h['count'] for h in histograms), sum(h['sum'] for h in histograms)
+
+
+def run_crawl(server, base_url: str, args, tmp: str) -> Dict:
+    """One full crawl through crawler.main(), measured from its run report."""
+    db_path = os.path.join(tmp, "crawl.db")
+    report_path = os.path.join(tmp, "crawl.json")
+    argv = ['--engine', args.engine, '--base-url', base_url, '--db', db_path, '--no-cache',
+            '--metrics', report_path, '--concurrency', str(args.concurrency),
+            '--rate', str(args.rate), '--burst', str(args.concurrency)]
+    crawler.REQUEST_DELAY = 1 / args.rate
+    requests_before = server.request_count
+    
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        crawler.main(argv)
+    seconds = time.perf_counter() - start
+    
+    with open(report_path, encoding='utf-8') as f:
+        report = json.load(f)
+    parses, parse_seconds = _histogram(report, 'parse_seconds')
+    _, write_seconds = _histogram(report, 'db_write_seconds')
+    rows_written = _counter(report, 'db_rows_written_total')
+    
+    return {
+        'seconds': seconds,
+        'requests': server.request_count - requests_before,
+        'pages': report['pages_fetched'],
+        'listings': report['listings_saved'],
+        'pages_per_second': report['pages_fetched'] / seconds,
+        'listings_per_second': report['listings_saved'] / seconds,
+        'parse_ms_per_page': parse_seconds / parses * 1000 if parses else None,
+        'db_rows_per_second': rows_written / write_seconds if write_seconds else None,
+        'retries': report['transport']['retries'],
+        'errors': report['errors'],
+    }
+
+
+def run_search(server, stages: crawler.Crawler, tmp: str) -> Tuple[Dict, List[str]]:
+    """One pass of get_listing_urls() over every search; also returns the listing URLs found."""
+    conn = sqlite3.connect(os.path.join(tmp, "search.db"))
+    init_schema(conn)
+    frontier = Frontier(conn)
+    searches = stages.searches()
+    frontier.start(searches)
+    requests_before = server.request_count
+    
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for sector_id, dwelling_type in searches:
+            stages.get_listing_urls(frontier, sector_id, dwelling_type)
+    seconds = time.perf_counter() - start
+    
+    pages = server.request_count - requests_before
+    urls = sorted(frontier.memberships())
+    conn.close()
+    return {
+        'searches': len(searches),
+        'pages': pages,
+        'listing_urls': len(urls),
+        'seconds': seconds,
+        'pages_per_second': pages / seconds,
+        'ms_per_page': seconds / pages * 1000 if pages else None,
+    }, urls
+
+
+def run_extract(stages: crawler.Crawler, urls: List[str], repeat: int) -> Tuple[Dict, List[Dict]]:
+    """
+    extract_listing_data() on every URL, then parse_listing_page() alone
+    `repeat` times over the same pages. Also returns the extracted listings.
+    """
+    listings = []
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for url in urls:
+            listing_data = stages.extract_listing_data(url)
+            if listing_data:
+                listings.append(listing_data)
+    seconds = time.perf_counter() - start
+    
+    pages = []
+    for url in urls:
+        try:
+            pages.append((url, stages.fetch(url).content))
+        except requests.RequestException:
+            pass
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for url, content in pages:
+            parse_listing_page(content, url)
+    parse_seconds = time.perf_counter() - start
+    
+    parses = len(pages) * repeat
+    return {
+        'pages': len(urls),
+        'extracted': len(listings),
+        'ms_per_page': seconds / len(urls) * 1000 if urls else None,
+        'parse_ms_per_page': parse_seconds / parses * 1000 if parses else None,
+    }, listings
+
+
+def run_save(listings: List[Dict], rows: int, tmp: str) -> Dict:
+    """save_listing() of `rows` listings (the extracted ones under new URLs) into a crawler database."""
+    conn = crawler.init_database(os.path.join(tmp, "save.db"))
+    rng = random.Random(0)
+    sectors = list(crawler.SECTORS.values())
+    batch = [
+        (dict(listings[i % len(listings)], url=f"{listings[i % len(listings)]['url']}-{i}"),
+         [(rng.choice(sectors), rng.choice(crawler.DWELLING_TYPES))])
+        for i in range(rows)
+    ]
+    
+    start = time.perf_counter()
+    writer = crawler.ListingWriter(conn)
+    for listing_data, memberships in batch:
+        writer.save_listing(listing_data, memberships)
+    writer.close()
+    seconds = time.perf_counter() - start
+    
+    saved = conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+    conn.close()
+    return {'rows': saved, 'seconds': seconds, 'rows_per_second': saved / seconds}
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Print the change of every metric from `baseline`; returns the metrics that got worse beyond `threshold`."""
+    regressions = []
+    print(f"\n{'metric':<28} {'baseline':>10} {'now':>10} {'change':>8}")
+    for section, name, unit, higher_is_better in METRICS:
+        old = baseline['results'].get(section, {}).get(name)
+        new = results.get(section, {}).get(name)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > threshold:
+            flag = "  worse"
+            regressions.append(f"{section}.{name}")
+        print(f"{section + '.' + name:<28} {old:>10.2f} {new:>10.2f} {change:>+7.1%}{flag}")
+    return regressions
+
+
+def print_results(results: Dict):
+    for section, name, unit, _ in METRICS:
+        value = results.get(section, {}).get(name)
+        if value is not None:
+            print(f"{section + '.' + name:<28} {value:>10.2f} {unit}")
+    crawl = results['crawl']
+    print(f"\nCrawl: {crawl['requests']} requests, {crawl['listings']:.0f} listings, {crawl['retries']} retries"
+          + (", errors: " + ", ".join(f"{k} {v:.0f}" for k, v in sorted(crawl['errors'].items()))
+             if crawl['errors'] else ""))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--coops-per-sector', type=int, default=50)
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--replay', metavar='ARCHIVE', default=None,
+                        help="Replay the pages of an archive written by crawler.py --archive instead of the catalogue")
+    parser.add_argument('--latency', type=float, default=0.0, help="Server latency per response in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with a 503")
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help="Share of requests whose connection is dropped without a response")
+    parser.add_argument('--engine', choices=['serial', 'async'], default='async')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=10000, help="Crawler rate limit in requests per second")
+    parser.add_argument('--sample', type=int, default=200, help="Detail pages timed by the extract stage")
+    parser.add_argument('--repeat', type=int, default=5, help="Parses of each sampled page")
+    parser.add_argument('--save-rows', type=int, default=10000, help="Listings written by the save stage")
+    parser.add_argument('--out', default=None, help="Save the results to this JSON file")
+    parser.add_argument('--compare', metavar='BASELINE', default=None,
+                        help="Compare with the results saved by an earlier run")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Relative change counted as a regression by --compare (default: %(default)s)")
+    args = parser.parse_args(argv)
+    
+    if args.replay:
+        catalogue = ReplayCatalogue(args.replay)
+        description = f"{len(catalogue)} pages replayed from {args.replay}"
+    else:
+        catalogue = Catalogue(args.coops_per_sector, args.per_page)
+        description = f"stub catalogue of {len(catalogue.coops)} coops"
+    server, base_url = start_stub_server(catalogue, args.latency, validators=False,
+                                         error_rate=args.error_rate, drop_rate=args.drop_rate)
+    print(f"{description}, latency {args.latency * 1000:.0f} ms, {args.error_rate:.0%} errors, "
+          f"{args.drop_rate:.0%} dropped; {args.engine} engine, concurrency {args.concurrency}")
+    
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            print("Crawling...")
+            results['crawl'] = run_crawl(server, base_url, args, tmp)
+            # The stages run on their own, with the methods of a Crawler
+            stages = crawler.Crawler(base_url=base_url, request_delay=1 / args.rate)
+            print("Timing the stages...")
+            results['search'], urls = run_search(server, stages, tmp)
+            results['extract'], listings = run_extract(stages, urls[:args.sample], args.repeat)
+            if listings:
+                results['save'] = run_save(listings, args.save_rows, tmp)
+    finally:
+        server.shutdown()
+    
+    print()
+    print_results(results)
+    
+    if args.out:
+        config = {k: v for k, v in vars(args).items() if k not in ('out', 'compare', 'threshold')}
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'config': config,
+                'results': results,
+            }, f, indent=2)
+            f.write("\n")
+        print(f"\nResults written to {args.out}")
+    
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metrics worse than the baseline by more than {args.threshold:.0%}: "
+                  + ", ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
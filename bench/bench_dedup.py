@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Benchmark the duplicate detection on a synthetic database.
+Gives every synthetic listing a postal code, then copies a share of them
+under new slugs as the site would list a cooperative twice: the name
+respelled (case, accents, "Coop" prefix), the phone number formatted
+differently or missing, the email in capitals or missing, the street
+abbreviated. Runs dedup.dedup_listings() and reports its time, the
+candidate pairs the blocking produced against the pairs an all-pairs
+comparison would score (timed on a sample), and the precision and recall
+of the duplicates found against the copies made.
+
+Usage:
+    python bench/bench_dedup.py [--db PATH] [--rows N] [--duplicates FRACTION]
+
+Without --db, a synthetic database is generated in a temporary directory;
+with --db, the database is modified.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dedup import candidate_pairs, dedup_listings, load_listings, similar_names  # noqa: E402
+from geocode import normalize_address  # noqa: E402
+from make_synthetic_db import generate  # noqa: E402
+from schema import init_schema  # noqa: E402
+
+# Letters used in Canadian postal codes
+POSTAL_LETTERS = "ABCEGHJKLMNPRSTVWXYZ"
+
+# Listings scored pair by pair to estimate the cost of an all-pairs comparison
+ALL_PAIRS_SAMPLE = 300
+
+
+def postal_code(rng: random.Random) -> str:
+    """A Montreal-looking postal code (H1A 1A1 to H9Z 9Z9)."""
+    return (f"H{rng.randint(1, 9)}{rng.choice(POSTAL_LETTERS)} "
+            f"{rng.randint(0, 9)}{rng.choice(POSTAL_LETTERS)}{rng.randint(0, 9)}")
+
+
+def respell(name: str, rng: random.Random) -> str:
+    variant = rng.randrange(4)
+    if variant == 0:
+        return name.upper()
+    if variant == 1:
+        return normalize_address(name).title()
+    if variant == 2:
+        return f"Coop {name}"
+    return f"{name} inc."
+
+
+def reformat_phone(phone, rng: random.Random):
+    digits = "".join(c for c in phone or '' if c.isdigit())
+    if len(digits) != 10 or rng.random() < 0.2:
+        return None
+    return rng.choice((f"({digits[:3]}) {digits[3:6]}-{digits[6:]}", f"1-{digits[:3]}-{digits[3:6]}-{digits[6:]}",
+                       f"{digits[:3]}.{digits[3:6]}.{digits[6:]}", digits))
+
+
+def add_duplicates(conn: sqlite3.Connection, fraction: float, seed: int = 0):
+    """
+    Give every listing a postal code and copy `fraction` of the active ones
+    under new ids. Returns {copy id: id of the listing it copies}.
+    """
+    rng = random.Random(seed)
+    conn.create_function('postal_code', 1, lambda _: postal_code(rng))
+    conn.execute("UPDATE listings SET address = address || ' ' || postal_code(id)")
+    
+    active = [row[0] for row in conn.execute("SELECT id FROM listings WHERE is_active = 1")]
+    next_id = conn.execute("SELECT MAX(id) FROM listings").fetchone()[0] + 1
+    copies = {}
+    for source_id in rng.sample(active, int(len(active) * fraction)):
+        row = conn.execute("""
+            SELECT name, address, email, phone, has_car_parking, has_bike_parking, zone, sector, dwelling_type
+            FROM listings WHERE id = ?
+        """, (source_id,)).fetchone()
+        name, address, email, phone = row[:4]
+        email = None if email is None or rng.random() < 0.3 else email.upper()
+        phone = reformat_phone(phone, rng)
+        address = address.replace("Saint-", "St-").replace("boulevard", "boul.")
+        if email is None and phone is None:
+            address = address.replace(", Montréal", ", app. 1, Montréal")
+        conn.execute("""
+            INSERT INTO listings
+            (id, name, address, email, phone, url, has_car_parking, has_bike_parking, zone, sector, dwelling_type)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (next_id, respell(name, rng), address, email, phone,
+              f"https://fhcq.coop/fr/cooperatives/synthetic-copy-{next_id}", *row[4:]))
+        conn.execute("""
+            INSERT INTO listing_dwelling_types (listing_id, dwelling_type)
+            SELECT ?, dwelling_type FROM listing_dwelling_types WHERE listing_id = ?
+        """, (next_id, source_id))
+        copies[next_id] = source_id
+        next_id += 1
+    conn.commit()
+    return copies
+
+
+def run(path: str, fraction: float):
+    conn = sqlite3.connect(path)
+    init_schema(conn)
+    copies = add_duplicates(conn, fraction)
+    listings = load_listings(conn)
+    print(f"Database: {path}, {len(listings)} active listings, {len(copies)} of them copies\n")
+    
+    times = []
+    for _ in range(3):
+        start = time.perf_counter()
+        result = dedup_listings(conn)
+        times.append(time.perf_counter() - start)
+    print(f"dedup_listings(): {sorted(times)[1] * 1000:.0f} ms (median of 3)")
+    
+    start = time.perf_counter()
+    pairs = len(candidate_pairs(listings))
+    blocking_ms = (time.perf_counter() - start) * 1000
+    sample = listings[:ALL_PAIRS_SAMPLE]
+    start = time.perf_counter()
+    for i, a in enumerate(sample):
+        for b in sample[i + 1:]:
+            if len(a.keys.items() & b.keys.items()) < 2:
+                similar_names(a.name, b.name)
+    per_pair = (time.perf_counter() - start) / (len(sample) * (len(sample) - 1) / 2)
+    all_pairs = len(listings) * (len(listings) - 1) // 2
+    print(f"Blocking: {pairs} candidate pairs in {blocking_ms:.0f} ms; all pairs: {all_pairs} "
+          f"(about {all_pairs * per_pair / 3600:.1f} hours at {per_pair * 1e6:.1f} µs per pair)")
+    
+    found = dict(conn.execute("SELECT listing_id, canonical_id FROM listing_duplicates"))
+    correct = sum(1 for copy_id, source_id in copies.items() if found.get(copy_id) == source_id)
+    print(f"Found {result['duplicates']} duplicates of {result['clusters']} cooperatives: "
+          f"precision {correct / max(len(found), 1):.1%}, recall {correct / max(len(copies), 1):.1%}")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help="Existing database to modify (default: generate one)")
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--duplicates', type=float, default=0.02, help="Share of the listings copied")
+    args = parser.parse_args()
+    
+    if args.db:
+        run(args.db, args.duplicates)
+        return
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.db")
+        generate(path, args.rows)
+        run(path, args.duplicates)
+
+
+if __name__ == "__main__":
+    main()
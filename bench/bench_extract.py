@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the detail page extractor.
+Compares the original BeautifulSoup implementation (bench/legacy_extract.py)
+with the lxml extractor over a corpus of saved detail pages: per-page parse
+time, and the peak Python heap allocated while parsing one page
+(tracemalloc; the libxml2 tree behind lxml lives outside the Python heap
+and is not counted). Also checks that both produce the same dictionaries.
+
+The peak stands in for allocation counts: CPython does not count the
+allocations made, and tracemalloc only sees the blocks still alive, which
+after a parse are those of the returned dictionary. The soup, and the page
+text the old extractor rebuilt for each fallback, are freed by then.
+Their combined size while alive is what the peak measures.
+
+Usage:
+    python bench/bench_extract.py [--corpus DIR] [--save-corpus DIR] [--repeat N]
+
+Without --corpus, detail pages are rendered from the stub catalogue.
+"""
+
+import argparse
+import glob
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from extractor import parse_listing_page  # noqa: E402
+from fhcq_stub import Catalogue  # noqa: E402
+from legacy_extract import parse_listing_page_bs4  # noqa: E402
+
+PARSERS = [
+    ('bs4 (before)', parse_listing_page_bs4),
+    ('lxml (after)', parse_listing_page),
+]
+
+
+def load_corpus(args) -> list:
+    """Return a list of (name, page bytes)."""
+    if args.corpus:
+        paths = sorted(glob.glob(os.path.join(args.corpus, '*.html')))
+        return [(os.path.basename(path), open(path, 'rb').read()) for path in paths]
+    
+    catalogue = Catalogue(args.coops_per_sector)
+    corpus = []
+    for slug in catalogue.coops:
+        title, main = catalogue.detail_page(slug)
+        corpus.append((f"{slug}.html", Catalogue.layout(title, main).encode('utf-8')))
+    
+    if args.save_corpus:
+        os.makedirs(args.save_corpus, exist_ok=True)
+        for name, content in corpus:
+            with open(os.path.join(args.save_corpus, name), 'wb') as f:
+                f.write(content)
+    return corpus
+
+
+def measure(parser, corpus, repeat: int) -> dict:
+    """Time every page `repeat` times, then measure the peak heap once per page."""
+    times = []
+    for _ in range(repeat):
+        for name, content in corpus:
+            start = time.perf_counter()
+            parser(content, name)
+            times.append(time.perf_counter() - start)
+    
+    peaks = []
+    tracemalloc.start()
+    for name, content in corpus:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        parser(content, name)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    
+    times.sort()
+    return {
+        'mean_ms': statistics.mean(times) * 1000,
+        'p50_ms': times[len(times) // 2] * 1000,
+        'p95_ms': times[int(len(times) * 0.95)] * 1000,
+        'pages_per_s': len(times) / sum(times),
+        'peak_kib': statistics.mean(peaks) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help="Directory of saved detail pages (*.html)")
+    parser.add_argument('--save-corpus', help="Write the generated corpus to this directory")
+    parser.add_argument('--coops-per-sector', type=int, default=25)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    
+    corpus = load_corpus(args)
+    if not corpus:
+        sys.exit(f"No pages found in {args.corpus}")
+    total_kib = sum(len(content) for _, content in corpus) / 1024
+    print(f"Corpus: {len(corpus)} detail pages, {total_kib:.0f} KiB")
+    
+    mismatches = [name for name, content in corpus
+                  if parse_listing_page_bs4(content, name) != parse_listing_page(content, name)]
+    print(f"Output differences: {len(mismatches)}" + (f" ({', '.join(mismatches[:5])})" if mismatches else ""))
+    
+    print(f"\n{'parser':<14} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'pages/s':>8} {'peak KiB':>9}")
+    results = {}
+    for label, func in PARSERS:
+        result = results[label] = measure(func, corpus, args.repeat)
+        print(f"{label:<14} {result['mean_ms']:>8.2f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+              f"{result['pages_per_s']:>8.0f} {result['peak_kib']:>9.0f}")
+    
+    before, after = (results[label] for label, _ in PARSERS)
+    print(f"\nSpeedup: {before['mean_ms'] / after['mean_ms']:.1f}x, "
+          f"peak heap: {after['peak_kib'] / before['peak_kib'] * 100:.0f}% of before")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark the listing history on a synthetic database.
+Simulates --runs crawls, each rewriting every listing as the crawler does
+(an upsert with unchanged values, which records nothing) and changing a
+share of them (phone, parking, address, dwelling types, or listed
+status). Reports the size of the history against the snapshot per run it
+replaces, and the latency of diffs and of listings as of an old run.
+
+Usage:
+    python bench/bench_history.py [--db PATH] [--rows N] [--runs N] [--change FRACTION]
+
+Without --db, a synthetic database is generated in a temporary directory;
+with --db, the database is modified.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from history import diff_runs, finish_run, listing_as_of, start_run  # noqa: E402
+from make_synthetic_db import generate  # noqa: E402
+from schema import init_schema  # noqa: E402
+
+
+def table_bytes(conn: sqlite3.Connection, *names: str):
+    """Bytes used by the given tables and indexes, or None without the dbstat table."""
+    try:
+        return conn.execute(
+            f"SELECT SUM(pgsize) FROM dbstat WHERE name IN ({', '.join('?' * len(names))})", names
+        ).fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return None
+
+
+def change_listings(conn: sqlite3.Connection, rng: random.Random, ids, count: int):
+    """Change one field of `count` random listings."""
+    for listing_id in rng.sample(ids, count):
+        kind = rng.randrange(5)
+        if kind == 0:
+            conn.execute("UPDATE listings SET phone = ? WHERE id = ?",
+                         (f"514-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}", listing_id))
+        elif kind == 1:
+            conn.execute("UPDATE listings SET has_car_parking = 1 - has_car_parking WHERE id = ?", (listing_id,))
+        elif kind == 2:
+            conn.execute("UPDATE listings SET address = address || ' (bureau ' || ? || ')' WHERE id = ?",
+                         (rng.randint(1, 99), listing_id))
+        elif kind == 3:
+            conn.execute("UPDATE listings SET is_active = 1 - is_active WHERE id = ?", (listing_id,))
+        else:
+            dwelling_type = rng.choice((5, 6, 7))
+            if conn.execute("DELETE FROM listing_dwelling_types WHERE listing_id = ? AND dwelling_type = ?",
+                            (listing_id, dwelling_type)).rowcount == 0:
+                conn.execute("INSERT INTO listing_dwelling_types (listing_id, dwelling_type) VALUES (?, ?)",
+                             (listing_id, dwelling_type))
+
+
+def run(path: str, runs: int, change: float, seed: int = 0):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    init_schema(conn)
+    ids = [row[0] for row in conn.execute("SELECT id FROM listings")]
+    listings_bytes = table_bytes(conn, 'listings', 'listing_dwelling_types')
+    print(f"Database: {path}, {len(ids)} listings, {runs} runs changing {change:.1%} of them each\n")
+    
+    first_run = None
+    write_times = []
+    for _ in range(runs):
+        run_id = start_run(conn)
+        first_run = first_run or run_id
+        start = time.perf_counter()
+        # What every crawl does: write each listing back, mostly unchanged
+        conn.execute("""
+            UPDATE listings SET name = name, address = address, email = email, phone = phone,
+                zone = zone, sector = sector, has_car_parking = has_car_parking,
+                has_bike_parking = has_bike_parking, is_active = is_active
+        """)
+        change_listings(conn, rng, ids, int(len(ids) * change))
+        conn.commit()
+        write_times.append(time.perf_counter() - start)
+        finish_run(conn, run_id)
+    last_run = run_id
+    
+    rows = conn.execute("SELECT COUNT(*) FROM listing_history WHERE run_id >= ?", (first_run,)).fetchone()[0]
+    history_bytes = table_bytes(conn, 'listing_history', 'idx_listing_history_run')
+    print(f"Rewrite of every listing + changes: {sorted(write_times)[len(write_times) // 2] * 1000:.0f} ms "
+          f"per run (median)")
+    print(f"History: {rows} rows", end="")
+    if history_bytes is not None:
+        print(f", {history_bytes / 1024 / 1024:.1f} MiB ({history_bytes / max(rows, 1):.0f} bytes per change); "
+              f"a snapshot per run would take {listings_bytes * runs / 1024 / 1024:.1f} MiB")
+    else:
+        print(" (this SQLite has no dbstat table to measure sizes)")
+    
+    def timed(label, func, repeat=5):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            times.append((time.perf_counter() - start) * 1000)
+        print(f"{label:<40} {sorted(times)[len(times) // 2]:>8.2f} ms  {result:>7} rows")
+    
+    print()
+    timed(f"diff {last_run - 1} {last_run} (one run)", lambda: sum(1 for _ in diff_runs(conn, last_run - 1, last_run)))
+    timed(f"diff {first_run - 1} {last_run} (every run)",
+          lambda: sum(1 for _ in diff_runs(conn, first_run - 1, last_run)), repeat=3)
+    sample = rng.sample(ids, 200)
+    timed(f"200 listings as of run {first_run}",
+          lambda: sum(1 for listing_id in sample if listing_as_of(conn, listing_id, first_run)))
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help="Existing database to modify (default: generate one)")
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--change', type=float, default=0.01, help="Share of the listings changed per run")
+    args = parser.parse_args()
+    
+    if args.db:
+        run(args.db, args.runs, args.change)
+        return
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.db")
+        generate(path, args.rows)
+        run(path, args.runs, args.change)
+
+
+if __name__ == "__main__":
+    main()
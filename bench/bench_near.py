@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark distance queries on a synthetic database.
+Runs each query of QUERIES through the R*Tree (query_db.near_query, the 20
+nearest listings within the distance, then all of them) and through the
+baseline that computes the distance of every listing with coordinates,
+and reports latency and match counts, which must agree (up to points
+within a metre of the circle, since the index stores single precision
+coordinates).
+
+Usage:
+    python bench/bench_near.py [--db PATH] [--rows N] [--repeat N]
+
+Without --db, a synthetic database is generated in a temporary directory.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_search import timed  # noqa: E402
+from geocode import haversine_km, register_math_functions  # noqa: E402
+from make_synthetic_db import generate  # noqa: E402
+from query_db import near_query  # noqa: E402
+from schema import init_schema  # noqa: E402
+
+# (description, latitude, longitude, km)
+QUERIES = [
+    ("Mont-Royal metro, 0.5 km", 45.5246, -73.5817, 0.5),
+    ("Mont-Royal metro, 2 km", 45.5246, -73.5817, 2),
+    ("Jean-Talon market, 1 km", 45.5364, -73.6147, 1),
+    ("Downtown, 5 km", 45.5017, -73.5673, 5),
+    ("Outside the island, 2 km", 45.3000, -73.2000, 2),
+]
+
+
+def scan_query(latitude: float, longitude: float, km: float):
+    """Baseline: the distance of every active listing with coordinates."""
+    sql = """
+        SELECT id, distance_km FROM (
+            SELECT id, haversine_km(?, ?, latitude, longitude) AS distance_km
+            FROM listings
+            WHERE is_active = 1 AND latitude IS NOT NULL AND longitude IS NOT NULL
+        )
+        WHERE distance_km <= ?
+        ORDER BY distance_km, id
+    """
+    return sql, (latitude, longitude, km)
+
+
+def run(path: str, repeat: int):
+    conn = sqlite3.connect(path)
+    init_schema(conn)
+    register_math_functions(conn)
+    conn.create_function("haversine_km", 4, haversine_km, deterministic=True)
+    total = conn.execute("SELECT COUNT(*) FROM listings_rtree").fetchone()[0]
+    print(f"Database: {path}, {total} listings with coordinates\n")
+    print(f"{'query':<26} {'top20 p50':>9} {'all p50':>8} {'all max':>8} {'matches':>8}   "
+          f"{'scan p50':>9} {'scan max':>9} {'matches':>8}")
+    
+    for name, latitude, longitude, km in QUERIES:
+        sql, params = near_query(latitude, longitude, km, limit=20)
+        top_p50, _ = timed(conn, sql, params, repeat)
+        sql, params = near_query(latitude, longitude, km)
+        all_p50, all_max = timed(conn, sql, params, repeat)
+        rtree_ids = {row[0] for row in conn.execute(sql, params)}
+        
+        sql, params = scan_query(latitude, longitude, km)
+        scan_p50, scan_max = timed(conn, sql, params, repeat)
+        scan = dict(conn.execute(sql, params).fetchall())
+        
+        # Points only one side found must lie on the circle
+        wrong = [
+            listing_id for listing_id in rtree_ids ^ scan.keys()
+            if abs(haversine_km(latitude, longitude, *conn.execute(
+                "SELECT latitude, longitude FROM listings WHERE id = ?", (listing_id,)
+            ).fetchone()) - km) > 0.001
+        ]
+        flag = f"  {len(wrong)} MISMATCHES" if wrong else ""
+        print(f"{name:<26} {top_p50:>9.2f} {all_p50:>8.2f} {all_max:>8.2f} {len(rtree_ids):>8}   "
+              f"{scan_p50:>9.2f} {scan_max:>9.2f} {len(scan):>8}{flag}")
+    
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help="Existing database to query (default: generate one)")
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    if args.db:
+        run(args.db, args.repeat)
+        return
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.db")
+        generate(path, args.rows)
+        run(path, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark full-text search against LIKE scans on a synthetic database.
+Runs each search of SEARCHES through the FTS5 index (query_db.search_query,
+top 20 by relevance) and through the equivalent LIKE '%term%' filter over
+names, addresses and notes, and reports latency and match counts. LIKE is
+neither accent-insensitive nor prefix-only, so its counts can differ.
+
+Usage:
+    python bench/bench_search.py [--db PATH] [--rows N] [--repeat N]
+
+Without --db, a synthetic database is generated in a temporary directory.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from make_synthetic_db import generate  # noqa: E402
+from query_db import match_expression, search_query  # noqa: E402
+from schema import init_schema  # noqa: E402
+
+SEARCHES = [
+    ["lumiere"],
+    ["Érab"],
+    ["soleil", "fleuve"],
+    ["sherb"],
+    ["metro"],
+    ["cote", "ensol"],
+]
+
+
+def like_query(terms):
+    """Baseline: every term must appear somewhere in the name, address or notes."""
+    condition = """(name LIKE ? OR address LIKE ?
+        OR id IN (SELECT listing_id FROM notes WHERE note LIKE ?))"""
+    sql = f"SELECT id FROM listings WHERE is_active = 1 AND {' AND '.join([condition] * len(terms))} ORDER BY name LIMIT 20"
+    params = tuple(f"%{term}%" for term in terms for _ in range(3))
+    count_sql = sql.replace("SELECT id", "SELECT COUNT(*)").replace(" ORDER BY name LIMIT 20", "")
+    return sql, params, count_sql
+
+
+def timed(conn, sql, params, repeat):
+    """Median and worst latency in ms of running a query to completion."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return times[len(times) // 2], times[-1]
+
+
+def run(path: str, repeat: int):
+    conn = sqlite3.connect(path)
+    init_schema(conn)
+    total = conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+    print(f"Database: {path}, {total} listings\n")
+    print(f"{'search':<18} {'fts p50':>8} {'fts max':>8} {'matches':>8}   {'like p50':>9} {'like max':>9} {'matches':>8}")
+    
+    for terms in SEARCHES:
+        sql, params = search_query(terms, limit=20)
+        fts_p50, fts_max = timed(conn, sql, params, repeat)
+        fts_count = conn.execute(
+            "SELECT COUNT(*) FROM listings_fts WHERE listings_fts MATCH ?", (match_expression(terms),)
+        ).fetchone()[0]
+        
+        sql, params, count_sql = like_query(terms)
+        like_p50, like_max = timed(conn, sql, params, repeat)
+        like_count = conn.execute(count_sql, params).fetchone()[0]
+        
+        print(f"{' '.join(terms):<18} {fts_p50:>8.2f} {fts_max:>8.2f} {fts_count:>8}   "
+              f"{like_p50:>9.2f} {like_max:>9.2f} {like_count:>8}")
+    
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help="Existing database to search (default: generate one)")
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    if args.db:
+        run(args.db, args.repeat)
+        return
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.db")
+        generate(path, args.rows)
+        run(path, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark the import time of the command line modules.
+Runs `python -X importtime -c "import <module>"` in fresh interpreters
+and reports the median cumulative import time of query_db and crawler,
+the modules that cost the most, and whether a heavy dependency (requests,
+BeautifulSoup, lxml, tabulate) was loaded: those are imported by the code
+paths that use them, so that a query only pays for SQLite. Exits with
+status 1 when a module is over its budget or loads one of them.
+
+Usage:
+    python bench/bench_startup.py [--runs N] [--top N]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Median cumulative import time allowed, in milliseconds
+IMPORT_BUDGET_MS = {
+    'query_db': 80,
+    'crawler': 200,
+}
+
+# Packages only the fetching, parsing and table output code paths import
+LAZY_MODULES = ('requests', 'urllib3', 'bs4', 'lxml', 'tabulate')
+
+
+def import_times(code: str) -> Dict[str, float]:
+    """Run `code` in a fresh interpreter; the cumulative import time in ms of every module it imported."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def loaded_modules(module: str) -> List[str]:
+    """The LAZY_MODULES that importing `module` loads."""
+    result = subprocess.run(
+        [sys.executable, '-c', f"import sys, {module}; print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return result.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7, help="Interpreters started per module")
+    parser.add_argument('--top', type=int, default=8, help="Slowest imports listed per module")
+    args = parser.parse_args()
+    
+    # Modules the interpreter imports at startup (site and its .pth files)
+    startup = import_times("pass")
+    print(f"Interpreter startup imports: {len(startup)} modules\n")
+    
+    failures = []
+    for module, budget in IMPORT_BUDGET_MS.items():
+        runs = [import_times(f"import {module}") for _ in range(args.runs)]
+        median = statistics.median(times[module] for times in runs)
+        print(f"{module}: {median:.1f} ms (median of {args.runs}, budget {budget} ms)")
+        
+        # Direct and indirect imports, by their median over the runs
+        names = set.intersection(*(set(times) for times in runs)) - set(startup) - {module}
+        slowest = sorted(((statistics.median(times[name] for times in runs), name) for name in names),
+                         reverse=True)[:args.top]
+        for ms, name in slowest:
+            print(f"  {ms:6.1f} ms  {name}")
+        
+        loaded = loaded_modules(module)
+        if loaded:
+            print(f"  loads {', '.join(loaded)}")
+            failures.append(f"{module} loads {', '.join(loaded)}")
+        if median > budget:
+            failures.append(f"{module} over budget ({median:.1f} ms > {budget} ms)")
+    
+    if failures:
+        print("\n✗ " + "; ".join(failures))
+        sys.exit(1)
+    print("\n✓ Within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark multi-process crawls against the local stub server.
+
+Runs `crawler.py --workers N` for each N, with the async engine at a low
+concurrency so that a single worker is limited by the server latency
+rather than by the rate limit, which all the workers share. Throughput
+should then grow with the workers until it reaches the rate limit, with
+every crawl making the same requests and saving the same listings.
+
+Usage:
+    python bench/bench_workers.py [--workers 1,2,4] [--coops-per-sector N] [--latency S] [--rate R]
+"""
+
+import argparse
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+from fhcq_stub import Catalogue, start_stub_server  # noqa: E402
+
+
+def run_workers(workers: int, server, base_url: str, args) -> dict:
+    """Run one full crawl in `workers` processes and return its measurements."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        server.request_count = 0
+        command = [sys.executable, os.path.join(ROOT, 'crawler.py'), '--workers', str(workers),
+                   '--engine', 'async', '--base-url', base_url, '--db', db_path, '--no-cache',
+                   '--concurrency', str(args.concurrency), '--rate', str(args.rate), '--burst', str(args.burst)]
+        
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - start
+        
+        conn = sqlite3.connect(db_path)
+        rows = conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+        pending = conn.execute("SELECT COUNT(*) FROM crawl_frontier WHERE status != 'done'").fetchone()[0]
+        conn.close()
+    
+    return {
+        'workers': workers,
+        'seconds': elapsed,
+        'requests': server.request_count,
+        'rows': rows,
+        'unfinished': pending,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default="1,2,4", help="Comma-separated worker counts to run")
+    parser.add_argument('--coops-per-sector', type=int, default=20)
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.1, help="Server latency per response in seconds")
+    parser.add_argument('--rate', type=float, default=50, help="Rate limit shared by the workers, in requests/s")
+    parser.add_argument('--burst', type=float, default=2)
+    parser.add_argument('--concurrency', type=int, default=2, help="Requests in flight per worker")
+    args = parser.parse_args()
+    
+    catalogue = Catalogue(args.coops_per_sector, args.per_page)
+    server, base_url = start_stub_server(catalogue, args.latency)
+    print(f"Stub catalogue: {len(catalogue.coops)} coops, latency {args.latency * 1000:.0f} ms, "
+          f"shared budget {args.rate:g} req/s, concurrency {args.concurrency} per worker")
+    
+    try:
+        results = [run_workers(int(n), server, base_url, args) for n in args.workers.split(',')]
+    finally:
+        server.shutdown()
+    
+    print(f"\n{'workers':<8} {'seconds':>8} {'requests':>9} {'req/s':>7} {'rows':>6} {'unfinished':>10}")
+    for result in results:
+        print(f"{result['workers']:<8} {result['seconds']:>8.2f} {result['requests']:>9} "
+              f"{result['requests'] / result['seconds']:>7.1f} {result['rows']:>6} {result['unfinished']:>10}")
+    
+    # Lower bound set by the shared rate limit alone
+    print(f"\nRate limit floor for {results[-1]['requests']} requests: {results[-1]['requests'] / args.rate:.2f} s")
+    if len({(r['requests'], r['rows']) for r in results}) > 1 or any(r['unfinished'] for r in results):
+        print("✗ The crawls differ: some pages were fetched twice or left unfinished")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
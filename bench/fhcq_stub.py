@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Local stub of the FHCQ cooperatives website.
+Serves a deterministic catalogue of search result pages and detail pages
+so the crawler can be benchmarked without touching fhcq.coop, or replays
+the pages recorded by `crawler.py --archive`. Latency and failures (503
+responses, connections dropped without a response) can be injected.
+
+The markup follows the structure the crawler's selectors target on the
+live site (listing cards, rel="next" pagination, <address>, mailto:/tel:
+links and the coop--features icon paragraph). A few listings deliberately
+omit some of those elements so that the extraction fallbacks get exercised.
+The catalogue also answers Nominatim-style geocoding requests for the
+addresses of its coops (GEOCODE_PATH), for `geocode.py`.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from archive import PageArchive  # noqa: E402
+from crawler import SECTORS, DWELLING_TYPES  # noqa: E402
+from geocode import normalize_address  # noqa: E402
+
+SEARCH_PATH = "/fr/cooperatives"
+GEOCODE_PATH = "/geocode/search"
+LAST_MODIFIED = "Mon, 06 Oct 2025 12:00:00 GMT"
+
+# The coops are spread over this (min_lat, max_lat, min_lon, max_lon) box,
+# roughly the island of Montreal
+AREA = (45.41, 45.70, -73.97, -73.47)
+
+# Pages linked on each side of the current one by the pagination, besides
+# the first and the last page
+PAGINATION_WINDOW = 2
+
+STREETS = ["rue Saint-Denis", "avenue du Parc", "boulevard Rosemont", "rue Fleury Est",
+           "rue Jarry Ouest", "avenue Laurier", "rue Notre-Dame Ouest", "boulevard Gouin"]
+WORDS = ["Coopérative", "d'habitation", "Les", "Jardins", "du", "Soleil", "Vieux", "Moulin",
+         "Tournesol", "Château", "Rivière", "Érables", "Village", "Pivot", "Cité", "Nord"]
+
+
+class Catalogue:
+    """
+    A deterministic set of fake cooperatives.
+    Each sector gets `coops_per_sector` coops, and each coop offers a
+    random non-empty subset of the dwelling types, so the same detail URL
+    shows up under several dwelling type searches like on the real site.
+    """
+    
+    def __init__(self, coops_per_sector: int = 8, per_page: int = 10, seed: int = 0):
+        self.per_page = per_page
+        self.coops: Dict[str, Dict] = {}
+        self.by_search: Dict[Tuple[int, int], List[str]] = {}
+        # normalized address -> slug, built by the first geocoding request
+        self._addresses: Optional[Dict[str, str]] = None
+        
+        rng = random.Random(seed)
+        for sector_id in SECTORS:
+            for n in range(coops_per_sector):
+                slug = f"coop-{sector_id}-{n}"
+                dwelling_types = [d for d in DWELLING_TYPES if rng.random() < 0.6] or [rng.choice(DWELLING_TYPES)]
+                self.coops[slug] = self._make_coop(rng, slug, sector_id, n)
+                for dwelling_type in dwelling_types:
+                    self.by_search.setdefault((sector_id, dwelling_type), []).append(slug)
+    
+    @staticmethod
+    def _make_coop(rng: random.Random, slug: str, sector_id: int, n: int) -> Dict:
+        name = " ".join(["Coopérative d'habitation"] + rng.sample(WORDS[2:], 2)) + f" {sector_id}-{n}"
+        postal = f"H{rng.randint(1, 9)}{rng.choice('ABCEGHJKLMNPRSTVXY')} {rng.randint(1, 9)}{rng.choice('ABCEGHJKLMNPRSTVXY')}{rng.randint(1, 9)}"
+        phone = f"514{rng.randint(200, 999)}{rng.randint(1000, 9999)}"
+        return {
+            'slug': slug,
+            'name': name,
+            'street': f"{rng.randint(100, 9999)} {rng.choice(STREETS)}",
+            'postal': postal,
+            'email': f"info@{slug}.example.org",
+            'phone': phone,
+            'car': rng.random() < 0.4,
+            'bike': rng.random() < 0.7,
+            # Markup variants: 0 = complete page, 1 = no <address>, 2 = no
+            # mailto/tel links, 3 = no coop--features paragraph.
+            'variant': n % 4 if n % 3 == 0 else 0,
+            'description': " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))),
+        }
+    
+    def search_page(self, sector_id: int, dwelling_type: int, page: int) -> Tuple[str, str]:
+        """Return the title and main content of a search results page."""
+        slugs = self.by_search.get((sector_id, dwelling_type), [])
+        start = (page - 1) * self.per_page
+        page_slugs = slugs[start:start + self.per_page]
+        last_page = max(1, -(-len(slugs) // self.per_page))
+        
+        cards = "\n".join(
+            f'<article class="coop-card"><h3><a href="{SEARCH_PATH}/{slug}">{self.coops[slug]["name"]}</a></h3>'
+            f'<p class="coop-card__sector">{SECTORS[sector_id]}</p></article>'
+            for slug in page_slugs
+        )
+        
+        pagination = ""
+        if last_page > 1:
+            links = []
+            window = range(max(1, page - PAGINATION_WINDOW), min(last_page, page + PAGINATION_WINDOW) + 1)
+            for p in sorted({1, last_page, *window}):
+                query = urllib.parse.urlencode({
+                    'q[sector_id_eq]': sector_id, 'q[dwelling_types_id_eq]': dwelling_type, 'page': p,
+                })
+                links.append(f'<li class="page"><a href="{SEARCH_PATH}?{query}">{p}</a></li>')
+            if page < last_page:
+                query = urllib.parse.urlencode({
+                    'q[sector_id_eq]': sector_id, 'q[dwelling_types_id_eq]': dwelling_type, 'page': page + 1,
+                })
+                links.append(f'<li class="next"><a rel="next" href="{SEARCH_PATH}?{query}">Suivant ›</a></li>')
+            pagination = f'<nav class="pagination"><ul>{"".join(links)}</ul></nav>'
+        
+        return "Coopératives | FHCQ", (f"""
+<h1>Trouver une coopérative</h1>
+<p class="results-count">{len(slugs)} coopératives trouvées</p>
+<section class="results">
+{cards}
+</section>
+{pagination}""")
+
+    def detail_page(self, slug: str) -> Optional[Tuple[str, str]]:
+        """Return the title and main content of a detail page, or None."""
+        coop = self.coops.get(slug)
+        if coop is None:
+            return None
+        
+        variant = coop['variant']
+        formatted_phone = f"({coop['phone'][:3]}) {coop['phone'][3:6]}-{coop['phone'][6:]}"
+        
+        if variant == 1:
+            address = f"<p>{coop['street']}, Montréal (Québec) {coop['postal']}</p>"
+        else:
+            address = f"<address>{coop['street']}<br>Montréal (Québec) <span>{coop['postal']}</span></address>"
+        
+        if variant == 2:
+            contact = f"<p>Courriel : {coop['email']}</p><p>Téléphone : {formatted_phone}</p>"
+        else:
+            contact = (f'<p><a href="mailto:{coop["email"]}">{coop["email"]}</a></p>'
+                       f'<p><a href="tel:1{coop["phone"]}">{formatted_phone}</a></p>')
+        
+        car_class = "icon icon-car-side" + ("" if coop['car'] else " disabled")
+        bike_class = "icon icon-bicycle" + ("" if coop['bike'] else " disabled")
+        icons = f'<span class="{car_class}" title="Stationnement"></span><span class="{bike_class}" title="Vélos"></span>'
+        if variant == 3:
+            features = f"<div class=\"amenities\">{icons}</div>"
+        else:
+            features = f'<p class="coop--features">{icons}</p>'
+        
+        return f"{coop['name']} | FHCQ", (f"""
+<h1>{coop['name']}</h1>
+{address}
+{features}
+<section class="contact">{contact}</section>
+<div class="description"><p>{coop['description']}</p></div>""")
+
+    @staticmethod
+    def coordinates(slug: str) -> Tuple[float, float]:
+        """Deterministic position of a coop, derived from its slug."""
+        digest = hashlib.sha1(slug.encode('utf-8')).digest()
+        min_lat, max_lat, min_lon, max_lon = AREA
+        return (min_lat + (max_lat - min_lat) * int.from_bytes(digest[:4], 'big') / 2 ** 32,
+                min_lon + (max_lon - min_lon) * int.from_bytes(digest[4:8], 'big') / 2 ** 32)
+    
+    def geocode(self, address: str) -> bytes:
+        """Nominatim-style JSON results for an address: the coop at that address, if any."""
+        if self._addresses is None:
+            self._addresses = {
+                normalize_address(f"{coop['street']} Montréal (Québec) {coop['postal']}"): slug
+                for slug, coop in self.coops.items()
+            }
+        slug = self._addresses.get(normalize_address(address))
+        if slug is None:
+            return b"[]"
+        lat, lon = self.coordinates(slug)
+        return json.dumps([{'lat': f"{lat:.7f}", 'lon': f"{lon:.7f}", 'display_name': address}]).encode('utf-8')
+    
+    def page(self, path: str, query: str) -> Optional[Tuple[str, bytes]]:
+        """Return the ETag and body of the page at `path`?`query`, or None."""
+        params = dict(urllib.parse.parse_qsl(query))
+        if path == GEOCODE_PATH:
+            body = self.geocode(params.get('q', ''))
+            return '"%s"' % hashlib.sha1(body).hexdigest(), body
+        if path == SEARCH_PATH:
+            try:
+                page = self.search_page(
+                    int(params.get('q[sector_id_eq]', 0)),
+                    int(params.get('q[dwelling_types_id_eq]', 0)),
+                    int(params.get('page', 1)),
+                )
+            except ValueError:
+                return None
+        elif path.startswith(SEARCH_PATH + "/"):
+            page = self.detail_page(path[len(SEARCH_PATH) + 1:])
+        else:
+            return None
+        
+        if page is None:
+            return None
+        title, main = page
+        # Like an application-level ETag: derived from the content, not from
+        # the rendered page, which changes with every CSRF token.
+        etag = '"%s"' % hashlib.sha1((title + main).encode('utf-8')).hexdigest()
+        return etag, self.layout(title, main).encode('utf-8')
+    
+    @staticmethod
+    def layout(title: str, main: str) -> str:
+        """Wrap page content in the site layout (with a per-request CSRF token)."""
+        return f"""<!DOCTYPE html>
+<html lang="fr">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<meta name="csrf-token" content="{random.getrandbits(64):x}">
+<link rel="stylesheet" href="/assets/application.css">
+</head>
+<body>
+<header class="site-header"><a href="/fr">FHCQ</a>
+<nav><ul><li class="menu-item"><a href="/fr/a-propos">À propos</a></li></ul></nav></header>
+<main>
+{main}
+</main>
+<footer><p>Fédération de l'habitation coopérative du Québec</p></footer>
+</body>
+</html>"""
+
+
+class ReplayCatalogue:
+    """
+    The latest copy of every page of an archive written by
+    `crawler.py --archive`, held in memory and looked up by path and query
+    (in any parameter order). Absolute links to the recorded site are made
+    relative, so that a crawl of the stub never leaves it.
+    """
+    
+    def __init__(self, archive_path: str):
+        if not os.path.exists(archive_path):
+            raise FileNotFoundError(f"No archive at {archive_path}")
+        self.pages: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Tuple[str, bytes]] = {}
+        archive = PageArchive(archive_path)
+        try:
+            for response in archive.latest():
+                if response.status != 200:
+                    continue
+                parts = urllib.parse.urlsplit(response.url)
+                origin = f"{parts.scheme}://{parts.netloc}/".encode('ascii')
+                body = response.content.replace(origin, b"/")
+                etag = response.headers.get('ETag') or '"%s"' % hashlib.sha1(body).hexdigest()
+                self.pages[self._key(parts.path, parts.query)] = (etag, body)
+        finally:
+            archive.close()
+    
+    @staticmethod
+    def _key(path: str, query: str) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+        return path, tuple(sorted(urllib.parse.parse_qsl(query)))
+    
+    def __len__(self) -> int:
+        return len(self.pages)
+    
+    def page(self, path: str, query: str) -> Optional[Tuple[str, bytes]]:
+        """Return the ETag and body recorded for `path`?`query`, or None."""
+        return self.pages.get(self._key(path, query))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Serves the catalogue attached to the server, over keep-alive
+    connections, gzip-compressed for clients that accept it. A random
+    share of the requests, drawn from the server's seeded generator, gets
+    a 503 or has its connection closed without a response.
+    """
+    
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY the
+    # body waits for the client's delayed ACK on a kept-alive connection
+    disable_nagle_algorithm = True
+    
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+        if server.latency:
+            time.sleep(server.latency)
+        
+        if server.error_rate or server.drop_rate:
+            with server.lock:
+                roll = server.rng.random()
+            if roll < server.drop_rate:
+                with server.lock:
+                    server.drop_count += 1
+                self.close_connection = True
+                return
+            if roll < server.drop_rate + server.error_rate:
+                with server.lock:
+                    server.error_count += 1
+                self.send_error(503)
+                return
+        
+        parsed = urllib.parse.urlsplit(self.path)
+        page = server.catalogue.page(parsed.path, parsed.query)
+        if page is None:
+            self.send_error(404)
+            return
+        
+        etag, payload = page
+        if server.validators and self.headers.get('If-None-Match') == etag:
+            with server.lock:
+                server.not_modified_count += 1
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        
+        compress = server.compression and 'gzip' in self.headers.get('Accept-Encoding', '')
+        if compress:
+            payload = gzip.compress(payload)
+        self.send_response(200)
+        if parsed.path == GEOCODE_PATH:
+            self.send_header('Content-Type', 'application/json')
+        else:
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('Vary', 'Accept-Encoding')
+        if compress:
+            self.send_header('Content-Encoding', 'gzip')
+        if server.validators:
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(catalogue, latency: float = 0.0, host: str = "127.0.0.1",
+                      port: int = 0, validators: bool = True, compression: bool = True,
+                      error_rate: float = 0.0, drop_rate: float = 0.0,
+                      seed: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Start the stub server in a background thread, serving a Catalogue or
+    a ReplayCatalogue.
+    `validators` controls whether responses carry ETag/Last-Modified and
+    conditional requests get 304 responses; `compression` whether pages
+    are gzipped for clients that accept it. `error_rate` and `drop_rate`
+    are the shares of requests answered with a 503 and dropped.
+    Returns the server and the search URL to use as the crawler's BASE_URL.
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.catalogue = catalogue
+    server.latency = latency
+    server.validators = validators
+    server.compression = compression
+    server.request_count = 0
+    server.not_modified_count = 0
+    server.error_rate = error_rate
+    server.drop_rate = drop_rate
+    server.rng = random.Random(seed)
+    server.error_count = 0
+    server.drop_count = 0
+    server.lock = threading.Lock()
+    
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    
+    return server, f"http://{host}:{server.server_address[1]}{SEARCH_PATH}"
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Serve a fake FHCQ catalogue locally.")
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--coops-per-sector', type=int, default=8)
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--no-validators', action='store_true', help="Send no ETag/Last-Modified headers")
+    parser.add_argument('--no-compression', action='store_true', help="Never gzip responses")
+    parser.add_argument('--replay', metavar='ARCHIVE', default=None,
+                        help="Serve the pages of an archive written by crawler.py --archive instead of the catalogue")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with a 503")
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help="Share of requests whose connection is closed without a response")
+    args = parser.parse_args()
+    
+    if args.replay:
+        catalogue = ReplayCatalogue(args.replay)
+        description = f"{len(catalogue)} pages replayed from {args.replay}"
+    else:
+        catalogue = Catalogue(args.coops_per_sector, args.per_page)
+        description = f"stub catalogue of {len(catalogue.coops)} coops"
+    server, base_url = start_stub_server(catalogue, args.latency, port=args.port,
+                                         validators=not args.no_validators, compression=not args.no_compression,
+                                         error_rate=args.error_rate, drop_rate=args.drop_rate)
+    print(f"Serving {description} at {base_url} (Ctrl+C to stop)")
+    if not args.replay:
+        print(f"Geocoding the coop addresses at {base_url.replace(SEARCH_PATH, GEOCODE_PATH)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
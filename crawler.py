@@ -2,26 +2,68 @@
 """
 FHCQ Cooperatives Crawler
 Crawls the FHCQ cooperatives website and extracts listing data.
+
+The crawl can also be run from another program through the Crawler class:
+    crawler = Crawler(db_path="coops.db", sectors={34: "Ahuntsic-Cartierville"}, engine='async')
+    report = crawler.run()                  # crawl to completion
+    for listing in crawler.listings():      # or get each listing as it is saved
+        ...
+
+Importing this module loads neither requests, BeautifulSoup nor lxml:
+they are imported by the code paths that fetch and parse pages.
 """
 
-import requests
-from bs4 import BeautifulSoup
+import argparse
+import asyncio
+import cProfile
+import functools
+import json
+import pstats
 import sqlite3
+import sys
+import threading
 import time
 import urllib.parse
-from typing import Optional, Dict, List
+from typing import TYPE_CHECKING, Callable, Optional, Dict, Iterable, Iterator, List, Set, Tuple
 import re
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from archive import PageArchive
+from dedup import dedup_listings, dedup_report
+from export import export, export_report
+from extractor import extract_page, page_hash, parse_listing_page
+from frontier import LEASE_SECONDS, LISTING, MAX_ATTEMPTS, SEARCH, Frontier, parse_search_key, search_key
+from geocode import geocode_listings, geocode_report, make_backend
+from history import CRAWL, INCREMENTAL, REPARSE, finish_run, history_report, start_run
+from metrics import Metrics, write_atomic, write_json
+from pipeline import PageQueue, ParsePipeline, start_fetcher
+from schema import init_schema
+from stats import refresh_stats
+from workers import BUSY_TIMEOUT, Heartbeat, RateBudget, run_workers
 
-# Set up a session with headers
-session = requests.Session()
-session.headers.update({
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-})
+if TYPE_CHECKING:
+    import requests
+    from http_cache import HTTPCache
+    from transport import TransportAdapter
 
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+              'Chrome/91.0.4472.124 Safari/537.36')
 
 # Configuration
 BASE_URL = "https://fhcq.coop/fr/cooperatives"
 DB_NAME = "cooperatives.db"
+CONNECT_TIMEOUT = 10  # seconds
+REQUEST_TIMEOUT = 30  # seconds
+REQUEST_DELAY = 1  # minimum seconds between the starts of two requests in the serial engine
+
+# Frontier items claimed at a time by the serial engine; small claims
+# spread the work evenly over the workers of a multi-process crawl
+SEARCH_CLAIM = 1
+LISTING_CLAIM = 5
+# Seconds between looks at the frontier while other workers hold the
+# remaining items
+LEASE_POLL = 0.25
 
 # Sector mapping: sector_id -> sector_name
 SECTORS = {
@@ -35,6 +77,9 @@ SECTORS = {
     52: "Villeray-Saint-Michel - Parc-Extension",
 }
 
+# Crawl order of the sectors, used to pick a listing's primary sector
+SECTOR_ORDER = {sector_name: i for i, sector_name in enumerate(SECTORS.values())}
+
 # Zone mapping: sector_name -> zone_number
 ZONE_MAPPING = {
     "Rosemont – La Petite-Patrie": 1,
@@ -51,366 +96,1582 @@ ZONE_MAPPING = {
 DWELLING_TYPES = [5, 6, 7]  # 5½, 6½, 7½
 
 
-def init_database():
-    """Initialize the SQLite database with the listings table."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS listings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            address TEXT NOT NULL,
-            email TEXT,
-            phone TEXT,
-            url TEXT NOT NULL UNIQUE,
-            has_car_parking INTEGER DEFAULT 0,
-            has_bike_parking INTEGER DEFAULT 0,
-            zone INTEGER,
-            sector TEXT,
-            dwelling_type INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+def init_database(path: str = DB_NAME) -> sqlite3.Connection:
+    """Initialize the SQLite database, creating or migrating its tables."""
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    # WAL lets the web interface read while a crawl is writing. Commits
+    # happen once per ListingWriter batch, so a full fsync per commit is
+    # cheap and a crash loses at most the batch being built.
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = FULL")
+    conn.execute("PRAGMA cache_size = -16384")  # KiB
+    init_schema(conn)
+    return conn
+
+
+def error_type(error: BaseException) -> str:
+    """Metrics label of an error: the HTTP status, or the exception class."""
+    response = getattr(error, 'response', None)
+    if response is not None:
+        return f"http_{response.status_code}"
+    return type(error).__name__
+
+
+def search_params(sector_id: int, dwelling_type: int, page: int = 1) -> Dict[str, str]:
+    """Build the query parameters for one page of search results."""
+    params = {
+        'utf8': '✓',
+        'q[feature_available_true]': '0',
+        'q[feature_reduced_mobility_true]': '0',
+        'q[sector_id_eq]': str(sector_id),
+        'q[dwelling_types_id_eq]': str(dwelling_type),
+        'commit': 'Rechercher',
+        'page': str(page) if page > 1 else None
+    }
+    
+    # Remove None values
+    return {k: v for k, v in params.items() if v is not None}
+
+
+# Pagination links and the result count ("42 coopératives trouvées")
+PAGE_LINK = re.compile(r'/fr/cooperatives\?[^#]*\bpage=(\d+)')
+RESULT_COUNT = re.compile(r'(\d[\d\s\u00a0\u202f]*)\s+(?:coopératives?|résultats?)', re.I)
+
+
+def parse_search_page(content: bytes, base_url: str = BASE_URL) -> Tuple[List[str], bool, Optional[int]]:
+    """
+    Parse one page of search results.
+    Returns the listing URLs found on the page (in page order, without
+    duplicates), whether the page links to a next page, and the number of
+    the last results page if the page tells: the highest page it links to,
+    or 1 when the result count shows that every result is on this page.
+    """
+    from bs4 import BeautifulSoup
+    
+    soup = BeautifulSoup(content, 'html.parser')
+    
+    # Find all listing links
+    # Looking for links that go to /fr/cooperatives/{slug}
+    # Try multiple patterns to find listing links
+    listing_links = soup.find_all('a', href=re.compile(r'/fr/cooperatives/[^/?]+$'))
+    
+    # Also check for links in listing cards/items
+    listing_cards = soup.find_all(['div', 'article', 'li'], class_=re.compile(r'coop|listing|item', re.I))
+    for card in listing_cards:
+        link = card.find('a', href=re.compile(r'/fr/cooperatives/'))
+        if link:
+            listing_links.append(link)
+    
+    page_urls = []
+    for link in listing_links:
+        href = link.get('href', '')
+        # Normalize href (remove query params, ensure it starts with /)
+        if href.startswith('/fr/cooperatives/'):
+            # Remove query parameters and fragments
+            href = href.split('?')[0].split('#')[0]
+            if href != '/fr/cooperatives' and len(href) > len('/fr/cooperatives/'):
+                full_url = urllib.parse.urljoin(base_url, href)
+                if full_url not in page_urls:
+                    page_urls.append(full_url)
+    
+    # Check if there's a next page
+    # Look for pagination links
+    next_page_link = (
+        soup.find('a', class_=re.compile(r'next', re.I)) or
+        soup.find('a', string=re.compile(r'Suivant|Next|›|»', re.I)) or
+        soup.find('a', {'rel': 'next'})
+    )
+    
+    last_page = None
+    page_numbers = [int(PAGE_LINK.search(link['href']).group(1)) for link in soup.find_all('a', href=PAGE_LINK)]
+    if page_numbers:
+        last_page = max(page_numbers)
+    else:
+        count_element = soup.find(class_=re.compile(r'count|total', re.I))
+        match = RESULT_COUNT.search(count_element.get_text()) if count_element else None
+        if match and int(re.sub(r'\D', '', match.group(1))) <= len(page_urls):
+            last_page = 1
+    
+    return page_urls, next_page_link is not None, last_page
+
+
+def is_retryable(error: 'requests.RequestException') -> bool:
+    """Whether a failed request may succeed later: network errors, timeouts, 429 and 5xx."""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return True
+    return response.status_code == 429 or response.status_code >= 500
+
+
+def idle_wait(frontier: Frontier, kind: str) -> Optional[float]:
+    """
+    How long to sleep when no item of `kind` can be claimed, or None once
+    none is left pending. Items other workers hold are polled for, since
+    they are usually done before their leases expire.
+    """
+    # Whatever this worker still holds is not being worked on any more
+    frontier.release()
+    wait = frontier.wait_time(kind)
+    if wait is None:
+        return None
+    if frontier.leased_elsewhere(kind):
+        return min(wait, LEASE_POLL)
+    if wait > 0:
+        print(f"\nWaiting {wait:.1f}s before retrying failed requests...")
+    return wait
+
+
+def run_rounds(frontier: Frontier, kind: str, run_round, limit: int):
+    """
+    Call run_round() with up to `limit` (key, page) items of `kind` claimed
+    at a time until none is left pending, sleeping while the remaining
+    ones back off or are held by other workers.
+    """
+    while True:
+        items = frontier.claim(kind, limit)
+        if items:
+            run_round(items)
+            continue
+        
+        wait = idle_wait(frontier, kind)
+        if wait is None:
+            return
+        time.sleep(wait)
+
+
+def _membership_columns(memberships: Iterable[Tuple[str, int]]) -> Tuple[Optional[str], Optional[int], List[int]]:
+    """
+    Reduce (sector_name, dwelling_type) pairs to the listing's primary
+    sector, its zone and its sorted dwelling types.
+    """
+    memberships = sorted(memberships, key=lambda m: (SECTOR_ORDER.get(m[0], len(SECTOR_ORDER)), m[1]))
+    sector = memberships[0][0] if memberships else None
+    dwelling_types = sorted({dwelling_type for _, dwelling_type in memberships})
+    return sector, ZONE_MAPPING.get(sector, None), dwelling_types
+
+
+def _sync_dwelling_types(cursor: sqlite3.Cursor, listings: List[Tuple[int, List[int]]]):
+    """
+    Bring the listing_dwelling_types rows of (listing id, dwelling types)
+    pairs in line, leaving the rows that did not change untouched.
+    """
+    params = [(listing_id, json.dumps(list(dwelling_types))) for listing_id, dwelling_types in listings]
+    cursor.executemany("""
+        DELETE FROM listing_dwelling_types
+        WHERE listing_id = ? AND dwelling_type NOT IN (SELECT value FROM json_each(?))
+    """, params)
+    cursor.executemany("""
+        INSERT OR IGNORE INTO listing_dwelling_types (listing_id, dwelling_type)
+        SELECT ?, value FROM json_each(?)
+    """, params)
+
+
+class ListingWriter:
+    """
+    Buffers listing rows and membership updates and writes them with
+    executemany, one transaction per batch. A batch is flushed once it holds
+    `batch_size` rows or `flush_interval` seconds after its first row, and
+    by flush()/close() at the end of a crawl. save_parsed() queues an update
+    of the parsed fields alone, for re-parsing. With a `frontier`, the detail
+    pages passed to complete() are marked done in the same transaction as
+    the rows queued before them. Write timings and errors go to `metrics`.
+    """
+    
+    def __init__(self, conn: sqlite3.Connection, batch_size: int = 100, flush_interval: float = 5.0,
+                 frontier: Optional[Frontier] = None, metrics: Optional[Metrics] = None):
+        self.conn = conn
+        self.frontier = frontier
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        # url -> listings row, url -> parsed fields, and url -> (listing id, sector, zone, dwelling_types)
+        self._listings: Dict[str, Tuple] = {}
+        self._parsed: Dict[str, Tuple] = {}
+        self._memberships: Dict[str, Tuple[int, Optional[str], Optional[int], List[int]]] = {}
+        self._completed: List[str] = []
+        self._batch_started: Optional[float] = None
+    
+    def save_listing(self, listing_data: Dict, memberships: Iterable[Tuple[str, int]]):
+        """
+        Queue a listing, along with the dwelling types it was found under.
+        `memberships` holds (sector_name, dwelling_type) pairs.
+        """
+        sector, zone, dwelling_types = _membership_columns(memberships)
+        self._listings[listing_data['url']] = (
+            listing_data['name'],
+            listing_data['address'],
+            listing_data['email'],
+            listing_data['phone'],
+            listing_data['url'],
+            1 if listing_data['has_car_parking'] else 0,
+            1 if listing_data['has_bike_parking'] else 0,
+            zone,
+            sector,
+            dwelling_types[0] if dwelling_types else None,
+            listing_data.get('content_hash'),
+            tuple(dwelling_types)
         )
-    """)
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS notes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            note TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            listing_id INTEGER NOT NULL,
-            FOREIGN KEY (listing_id) REFERENCES listings(id) ON DELETE CASCADE
+        self._queued()
+    
+    def save_parsed(self, listing_data: Dict):
+        """
+        Queue an update of the fields parsed from the page of a stored
+        listing, leaving its activity, last_seen, sector, zone and dwelling
+        types as they are.
+        """
+        self._parsed[listing_data['url']] = (
+            listing_data['name'],
+            listing_data['address'],
+            listing_data['email'],
+            listing_data['phone'],
+            1 if listing_data['has_car_parking'] else 0,
+            1 if listing_data['has_bike_parking'] else 0,
+            listing_data.get('content_hash'),
+            listing_data['url'],
         )
-    """)
+        self._queued()
     
+    def save_memberships(self, url: str, memberships: Iterable[Tuple[str, int]]) -> bool:
+        """
+        Queue an update of the sector, zone and dwelling types of a listing
+        whose page has not changed, marking it active and seen, as saving
+        it would. Returns False if the listing is not in the database yet.
+        """
+        row = self.conn.execute("SELECT id FROM listings WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return False
+        self._memberships[url] = (row[0], *_membership_columns(memberships))
+        self._queued()
+        return True
+    
+    def complete(self, url: str):
+        """Queue marking the detail page of `url` done in the frontier."""
+        if self.frontier is not None:
+            self._completed.append(url)
+            self._queued()
+    
+    def _queued(self):
+        if self._batch_started is None:
+            self._batch_started = time.monotonic()
+        queued = len(self._listings) + len(self._parsed) + len(self._memberships) + len(self._completed)
+        if queued >= self.batch_size or time.monotonic() - self._batch_started >= self.flush_interval:
+            self.flush()
+    
+    def flush(self):
+        """Write the queued rows in one transaction."""
+        listings, self._listings = list(self._listings.values()), {}
+        parsed, self._parsed = list(self._parsed.values()), {}
+        memberships, self._memberships = list(self._memberships.items()), {}
+        completed, self._completed = self._completed, []
+        self._batch_started = None
+        if not listings and not parsed and not memberships and not completed:
+            return
+        
+        start = time.perf_counter()
+        try:
+            self._write(listings, memberships, completed, parsed)
+            self.conn.commit()
+            self.written += len(listings) + len(parsed) + len(memberships)
+            self.metrics.observe('db_write_seconds', time.perf_counter() - start)
+            self.metrics.inc('db_rows_written_total', len(listings) + len(parsed) + len(memberships))
+            return
+        except sqlite3.Error:
+            self.conn.rollback()
+        
+        # Retry row by row so that one bad row does not lose the whole batch;
+        # a listing whose row cannot be saved stays pending in the frontier
+        failed = set()
+        for listing in listings:
+            if not self._write_one([listing], [], f"listing {listing[4]}"):
+                failed.add(listing[4])
+        for row in parsed:
+            self._write_one([], [], f"listing {row[-1]}", parsed=[row])
+        for membership in memberships:
+            if not self._write_one([], [membership], f"listing {membership[0]}"):
+                failed.add(membership[0])
+        completed = [url for url in completed if url not in failed]
+        if completed:
+            self._write_one([], [], "frontier progress", completed)
+    
+    def _write_one(self, listings: List[Tuple], memberships: List[Tuple], label: str,
+                   completed: Iterable[str] = (), parsed: List[Tuple] = ()) -> bool:
+        try:
+            self._write(listings, memberships, list(completed), parsed)
+            self.conn.commit()
+            self.written += len(listings) + len(parsed) + len(memberships)
+            return True
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            self.metrics.inc('errors_total', stage='save', type=type(e).__name__)
+            print(f"Error saving {label}: {e}")
+            return False
+    
+    def _write(self, listings: List[Tuple], memberships: List[Tuple], completed: List[str] = (),
+               parsed: List[Tuple] = ()):
+        cursor = self.conn.cursor()
+        
+        if listings:
+            # Rows keep their id and created_at; updated_at only moves when
+            # the data differs from what is stored.
+            cursor.executemany("""
+                INSERT INTO listings
+                (name, address, email, phone, url, has_car_parking, has_bike_parking, zone, sector, dwelling_type,
+                 content_hash, is_active, last_seen, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                ON CONFLICT(url) DO UPDATE SET
+                    updated_at = CASE
+                        WHEN (name, address, email, phone, has_car_parking, has_bike_parking,
+                              zone, sector, dwelling_type, content_hash)
+                          IS NOT (excluded.name, excluded.address, excluded.email, excluded.phone,
+                                  excluded.has_car_parking, excluded.has_bike_parking, excluded.zone,
+                                  excluded.sector, excluded.dwelling_type, excluded.content_hash)
+                        THEN CURRENT_TIMESTAMP ELSE updated_at END,
+                    name = excluded.name,
+                    address = excluded.address,
+                    email = excluded.email,
+                    phone = excluded.phone,
+                    has_car_parking = excluded.has_car_parking,
+                    has_bike_parking = excluded.has_bike_parking,
+                    zone = excluded.zone,
+                    sector = excluded.sector,
+                    dwelling_type = excluded.dwelling_type,
+                    content_hash = excluded.content_hash,
+                    is_active = 1,
+                    last_seen = CURRENT_TIMESTAMP
+            """, [row[:-1] for row in listings])
+            ids = dict(cursor.execute(
+                f"SELECT url, id FROM listings WHERE url IN ({', '.join('?' * len(listings))})",
+                [row[4] for row in listings]
+            ))
+            _sync_dwelling_types(cursor, [(ids[row[4]], row[-1]) for row in listings])
+        
+        if parsed:
+            cursor.executemany("""
+                UPDATE listings SET
+                    updated_at = CASE
+                        WHEN (name, address, email, phone, has_car_parking, has_bike_parking, content_hash)
+                          IS NOT (?1, ?2, ?3, ?4, ?5, ?6, ?7)
+                        THEN CURRENT_TIMESTAMP ELSE updated_at END,
+                    name = ?1,
+                    address = ?2,
+                    email = ?3,
+                    phone = ?4,
+                    has_car_parking = ?5,
+                    has_bike_parking = ?6,
+                    content_hash = ?7
+                WHERE url = ?8
+            """, parsed)
+        
+        if memberships:
+            rows = [row for _, row in memberships]
+            cursor.executemany("""
+                UPDATE listings SET
+                    updated_at = CASE
+                        WHEN (sector, zone, dwelling_type, is_active) IS NOT (?1, ?2, ?3, 1)
+                        THEN CURRENT_TIMESTAMP ELSE updated_at END,
+                    sector = ?1,
+                    zone = ?2,
+                    dwelling_type = ?3,
+                    is_active = 1,
+                    last_seen = CURRENT_TIMESTAMP
+                WHERE id = ?4
+            """, [(sector, zone, dwelling_types[0] if dwelling_types else None, listing_id)
+                  for listing_id, sector, zone, dwelling_types in rows])
+            _sync_dwelling_types(cursor, [(row[0], row[3]) for row in rows])
+        
+        if completed:
+            self.frontier.complete_listings(cursor, completed)
+    
+    def close(self):
+        """Flush what is left. The connection stays open."""
+        self.flush()
+
+
+class IncrementalIndex:
+    """
+    Content hashes and memberships of the listings already stored, loaded
+    once at the start of an --incremental crawl so that unchanged detail
+    pages can be skipped without parsing them or writing their row.
+    """
+    
+    def __init__(self, conn: sqlite3.Connection):
+        # url -> (content_hash, sector, dwelling_types, is_active)
+        self.listings: Dict[str, Tuple[Optional[str], Optional[str], Tuple[int, ...], bool]] = {}
+        self.unchanged_urls: List[str] = []
+        self.changed = 0
+        
+        rows = conn.execute("""
+            SELECT url, content_hash, sector, is_active,
+                (SELECT GROUP_CONCAT(dwelling_type) FROM listing_dwelling_types WHERE listing_id = listings.id)
+            FROM listings
+        """)
+        for url, content_hash, sector, is_active, dwelling_types in rows:
+            dwelling_types = tuple(sorted(int(d) for d in dwelling_types.split(','))) if dwelling_types else ()
+            self.listings[url] = (content_hash, sector, dwelling_types, bool(is_active))
+    
+    def diff(self, urls: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """
+        Compare the URLs found by the searches with the stored listings.
+        Returns (new URLs, URLs of active listings that no longer appear).
+        """
+        urls = set(urls)
+        new = sorted(url for url in urls if url not in self.listings or not self.listings[url][3])
+        disappeared = sorted(url for url, stored in self.listings.items() if stored[3] and url not in urls)
+        return new, disappeared
+    
+    def is_unchanged(self, url: str, content_hash: str, from_cache: bool = False) -> bool:
+        stored = self.listings.get(url)
+        if stored is None or not stored[3]:
+            return False
+        return from_cache or stored[0] == content_hash
+    
+    def memberships_changed(self, url: str, memberships: Iterable[Tuple[str, int]]) -> bool:
+        sector, _, dwelling_types = _membership_columns(memberships)
+        stored = self.listings[url]
+        return (stored[1], stored[2]) != (sector, tuple(dwelling_types))
+
+
+def begin_incremental(conn: sqlite3.Connection, memberships: Dict[str, Set[Tuple[str, int]]],
+                      failed: List[Tuple[int, int]]) -> IncrementalIndex:
+    """
+    Report new and disappeared listings after the search phase, and mark
+    the disappeared ones inactive. Nothing is deactivated if any search
+    failed, since its listings would wrongly look gone.
+    """
+    index = IncrementalIndex(conn)
+    new, disappeared = index.diff(memberships)
+    
+    print(f"\nIncremental crawl: {len(new)} new listings, {len(disappeared)} no longer listed")
+    for url in new:
+        print(f"  + {url}")
+    for url in disappeared:
+        print(f"  - {url}")
+    
+    if failed:
+        print(f"  {len(failed)} searches failed; not marking any listing inactive")
+    elif disappeared:
+        conn.executemany("UPDATE listings SET is_active = 0 WHERE url = ?", [(url,) for url in disappeared])
+        conn.commit()
+    
+    return index
+
+
+def finish_incremental(conn: sqlite3.Connection, index: IncrementalIndex):
+    """
+    Record that the skipped, unchanged listings were seen in this crawl,
+    including those skipped by an interrupted run that it resumed: every
+    detail page the frontier has marked done.
+    """
+    conn.execute("""
+        UPDATE listings SET last_seen = CURRENT_TIMESTAMP
+        WHERE url IN (SELECT key FROM crawl_frontier WHERE kind = ? AND status = 'done')
+    """, (LISTING,))
     conn.commit()
-    return conn
+    print(f"\nIncremental crawl: {index.changed} listings new or changed, {len(index.unchanged_urls)} unchanged")
 
 
-def get_listing_urls(sector_id: int, dwelling_type: int) -> List[str]:
+def save_unchanged(writer: ListingWriter, url: str, response: 'requests.Response', content_hash: str,
+                   memberships: Iterable[Tuple[str, int]], index: Optional[IncrementalIndex] = None) -> bool:
     """
-    Get all listing URLs for a given sector and dwelling type.
-    Handles pagination.
+    Skip parsing a detail page that has not changed since it was stored:
+    one the HTTP cache reports as unchanged (304 or fresh entry), or, in an
+    incremental crawl, one whose content hash matches the stored one. The
+    listing is marked active and seen and its memberships are refreshed.
+    Returns False if the page needs to be parsed.
     """
-    listing_urls = []
-    page = 1
+    from_cache = getattr(response, 'from_cache', False)
     
-    while True:
-        # Build query parameters
-        params = {
-            'utf8': '✓',
-            'q[feature_available_true]': '0',
-            'q[feature_reduced_mobility_true]': '0',
-            'q[sector_id_eq]': str(sector_id),
-            'q[dwelling_types_id_eq]': str(dwelling_type),
-            'commit': 'Rechercher',
-            'page': str(page) if page > 1 else None
-        }
+    if index is None:
+        if not from_cache:
+            return False
+        return writer.save_memberships(url, memberships)
+    
+    if not index.is_unchanged(url, content_hash, from_cache):
+        index.changed += 1
+        return False
+    
+    index.unchanged_urls.append(url)
+    if index.memberships_changed(url, memberships):
+        writer.save_memberships(url, memberships)
+    return True
+
+
+def parse_timed(content: bytes, url: str) -> Tuple[Optional[Dict], float]:
+    """parse_listing_page(), also returning how long it took (measured in the parse worker)."""
+    start = time.perf_counter()
+    listing_data = parse_listing_page(content, url)
+    return listing_data, time.perf_counter() - start
+
+
+def _parse_inline(pages: Iterable[Tuple[str, bytes, str]]) -> Iterator[Tuple[str, Optional[Tuple], Optional[Exception]]]:
+    """Same interface as ParsePipeline(parse_timed).map(), parsing on the calling thread."""
+    for key, content, url in pages:
+        try:
+            yield key, parse_timed(content, url), None
+        except Exception as e:
+            yield key, None, e
+
+
+def _listing_labels(memberships: Iterable[Tuple[str, int]]) -> Dict:
+    """Metrics labels of a listing: its primary sector and smallest dwelling type."""
+    sector, _, dwelling_types = _membership_columns(memberships)
+    return {'sector': sector, 'dwelling_type': dwelling_types[0] if dwelling_types else None}
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter for asyncio code.
+    Allows `rate` acquisitions per second on average, with bursts of up
+    to `burst` acquisitions.
+    """
+    
+    def __init__(self, rate: float, burst: float = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncCrawler:
+    """
+    Concurrent crawl engine of a Crawler (engine='async').
+    Search pages and detail pages are fetched concurrently, with at most
+    `concurrency` requests in flight and a token bucket per host that
+    replaces the fixed sleeps of the serial engine. Blocking requests and
+    parsing calls run in a thread pool; database writes stay on the event
+    loop thread. With `parse_workers`, detail pages are parsed in a process
+    pool instead, and at most a few pages per worker are held between
+    download and parse.
+    """
+    
+    def __init__(self, crawler: 'Crawler', conn: sqlite3.Connection, frontier: Frontier):
+        self.crawler = crawler
+        self.conn = conn
+        self.frontier = frontier
+        self.concurrency = crawler.concurrency
+        self.rate = crawler.rate
+        self.burst = crawler.burst
+        self.incremental = crawler.incremental
+        self.parse_workers = crawler.parse_workers
+        self.archive = crawler.archive
+        self.index: Optional[IncrementalIndex] = None
+        self._buckets: Dict[str, TokenBucket] = {}
+    
+    async def _run_blocking(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+    
+    async def fetch(self, url: str, params: Optional[Dict[str, str]] = None, **labels) -> 'requests.Response':
+        """
+        Fetch a URL once a request slot and a rate-limit token (or, in a
+        multi-process crawl, a slot of the shared budget) are free.
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        bucket = self._buckets.setdefault(host, TokenBucket(self.rate, self.burst))
+        async with self._semaphore:
+            if self.crawler.rate_budget is not None:
+                await asyncio.sleep(await self._run_blocking(self.crawler.rate_budget.reserve, host))
+            else:
+                await bucket.acquire()
+            return await self._run_blocking(self.crawler.fetch, url, params, **labels)
+    
+    async def fetch_search_page(self, sector_id: int, dwelling_type: int,
+                                page: int) -> Tuple[List[str], bool, Optional[int]]:
+        """Fetch one page of search results and parse it in the thread pool."""
+        crawler = self.crawler
+        response = await self.fetch(crawler.base_url, search_params(sector_id, dwelling_type, page),
+                                    sector=crawler.sectors[sector_id], dwelling_type=dwelling_type)
+        if self.archive is not None:
+            self.archive.store(response.url, response, SEARCH)
+        return await self._run_blocking(parse_search_page, response.content, crawler.base_url)
+    
+    async def get_listing_urls(self, sector_id: int, dwelling_type: int, page: int = 1) -> int:
+        """
+        Async counterpart of get_listing_urls(). Once a page tells which
+        page is the last one, the remaining pages are fetched concurrently
+        (within the rate limit) and recorded in page order; if one of them
+        fails, the search resumes from it on its next attempt.
+        """
+        import requests
         
-        # Remove None values
-        params = {k: v for k, v in params.items() if v is not None}
+        found = 0
+        last_page = None
         
-        try:
-            response = session.get(BASE_URL, params=params, timeout=30)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
+        while True:
+            pages = list(range(page, last_page + 1)) if last_page is not None and last_page > page else [page]
+            results = await asyncio.gather(
+                *(self.fetch_search_page(sector_id, dwelling_type, p) for p in pages), return_exceptions=True
+            )
             
-            # Find all listing links
-            # Looking for links that go to /fr/cooperatives/{slug}
-            # Try multiple patterns to find listing links
-            listing_links = soup.find_all('a', href=re.compile(r'/fr/cooperatives/[^/?]+$'))
+            for page, result in zip(pages, results):
+                if isinstance(result, requests.RequestException):
+                    print(f"Error fetching page {page} for sector {sector_id}, dwelling {dwelling_type}: {result}")
+                    self.crawler.handle_failure(self.frontier, SEARCH, search_key(sector_id, dwelling_type),
+                                                f"search {self.crawler.sectors[sector_id]} - {dwelling_type}½",
+                                                result)
+                    return found
+                if isinstance(result, BaseException):
+                    raise result
+                
+                # Recorded on the event loop thread
+                page_urls, has_next, last_page = result
+                new, finished = self.crawler.record_search_page(self.frontier, sector_id, dwelling_type, page,
+                                                                page_urls, has_next, last_page)
+                found += new
+                if finished:
+                    return found
             
-            # Also check for links in listing cards/items
-            listing_cards = soup.find_all(['div', 'article', 'li'], class_=re.compile(r'coop|listing|item', re.I))
-            for card in listing_cards:
-                link = card.find('a', href=re.compile(r'/fr/cooperatives/'))
-                if link:
-                    listing_links.append(link)
+            page += 1
+    
+    async def crawl_listing(self, url: str, memberships: Set[Tuple[str, int]]):
+        import requests
+        
+        # Waiting here, before the fetch, stops downloads from running ahead
+        # of the parser pool
+        async with self._pending:
+            try:
+                response = await self.fetch(url)
+            except requests.RequestException as e:
+                print(f"Error fetching listing {url}: {e}")
+                self.crawler.handle_failure(self.frontier, LISTING, url, url, e)
+                return
             
-            page_listings = []
-            seen_urls = set(listing_urls)
-            for link in listing_links:
-                href = link.get('href', '')
-                # Normalize href (remove query params, ensure it starts with /)
-                if href.startswith('/fr/cooperatives/'):
-                    # Remove query parameters and fragments
-                    href = href.split('?')[0].split('#')[0]
-                    if href != '/fr/cooperatives' and len(href) > len('/fr/cooperatives/'):
-                        full_url = f"https://fhcq.coop{href}"
-                        if full_url not in seen_urls:
-                            page_listings.append(full_url)
-                            listing_urls.append(full_url)
-                            seen_urls.add(full_url)
+            if self.archive is not None:
+                self.archive.store(url, response)
             
-            # Check if there's a next page
-            # Look for pagination links
-            next_page_link = (
-                soup.find('a', class_=re.compile(r'next', re.I)) or
-                soup.find('a', string=re.compile(r'Suivant|Next|›|»', re.I)) or
-                soup.find('a', {'rel': 'next'})
-            )
+            content_hash = page_hash(response.content)
+            if save_unchanged(self.writer, url, response, content_hash, memberships, self.index):
+                self.writer.complete(url)
+                self.crawler.metrics.inc('listings_unchanged_total', **_listing_labels(memberships))
+                print(f"  = Unchanged: {url}")
+                return
             
-            if not page_listings:
-                break
-                
-            if not next_page_link and page > 1:
-                break
+            error = seconds = None
+            try:
+                loop = asyncio.get_running_loop()
+                listing_data, seconds = await loop.run_in_executor(self._parser, parse_timed, response.content, url)
+            except Exception as e:
+                print(f"Error parsing listing {url}: {e}")
+                listing_data, error = None, e
+        
+        self.crawler.record_parse(memberships, listing_data, seconds, error)
+        if listing_data:
+            listing_data['content_hash'] = content_hash
+            self.writer.save_listing(listing_data, memberships)
+            self.writer.complete(url)
+            print(f"  ✓ Saved: {listing_data['name']}")
+            self.crawler.saved(listing_data)
+        else:
+            self.frontier.fail(LISTING, url, str(error) if error is not None else "no listing data found")
+            print(f"  ✗ Failed to extract data from {url}")
+    
+    async def run_rounds(self, kind: str, run_item, limit: int):
+        """
+        Async counterpart of run_rounds(): keep up to `limit` claimed items
+        running concurrently, claiming more whenever half of them are done.
+        """
+        tasks = set()
+        try:
+            while True:
+                if len(tasks) <= limit // 2:
+                    items = self.frontier.claim(kind, limit - len(tasks))
+                    tasks.update(asyncio.ensure_future(run_item(key, page)) for key, page in items)
+                if tasks:
+                    done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    # Look at every finished item, so that no error goes unretrieved
+                    errors = [task.exception() for task in done if task.exception() is not None]
+                    if errors:
+                        raise errors[0]
+                    continue
                 
-            page += 1
-            time.sleep(1)  # Be polite to the server
-            
-        except requests.RequestException as e:
-            print(f"Error fetching page {page} for sector {sector_id}, dwelling {dwelling_type}: {e}")
-            break
+                # Write the batched completions before looking for due items again
+                self.writer.flush()
+                wait = idle_wait(self.frontier, kind)
+                if wait is None:
+                    return
+                await asyncio.sleep(wait)
+        except BaseException:
+            # Stop the running items before the executors shut down, or they
+            # would fail on them and be marked failed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
     
-    return listing_urls
+    async def collect_listing_urls(self) -> Dict[str, Set[Tuple[str, int]]]:
+        """Async counterpart of collect_listing_urls()."""
+        async def search(key: str, page: int):
+            sector_id, dwelling_type = parse_search_key(key)
+            found = await self.get_listing_urls(sector_id, dwelling_type, page)
+            print(f"{self.crawler.sectors[sector_id]} - {dwelling_type}½: found {found} listings")
+        
+        # One search per request slot: a search has a single page in
+        # flight until it knows its last page
+        await self.run_rounds(SEARCH, search, self.concurrency)
+        return self.frontier.memberships()
+    
+    async def run(self):
+        """Crawl every sector/dwelling type combination pending in the frontier concurrently."""
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.writer = ListingWriter(self.conn, frontier=self.frontier, metrics=self.crawler.metrics)
+        if self.parse_workers:
+            self._parser = ProcessPoolExecutor(max_workers=self.parse_workers)
+            self._pending = asyncio.Semaphore(self.parse_workers * 4)
+        else:
+            self._parser = self._executor
+            self._pending = asyncio.Semaphore(self.concurrency * 4)
+        
+        sectors, dwelling_types = len(self.crawler.sectors), len(self.crawler.dwelling_types)
+        print(f"Starting async crawl for {sectors} sectors × {dwelling_types} dwelling types = "
+              f"{sectors * dwelling_types} combinations")
+        print(f"  Concurrency: {self.concurrency}, rate limit: {self.rate} requests/s per host")
+        
+        try:
+            memberships = await self.collect_listing_urls()
+            print(f"\nFound {len(memberships)} distinct listings")
+            if self.incremental:
+                self.index = begin_incremental(self.conn, memberships, self.frontier.failed_searches())
+            self.frontier.queue_listings()
+            
+            await self.run_rounds(LISTING, lambda url, _: self.crawl_listing(url, memberships[url]),
+                                  self.concurrency * 4)
+        finally:
+            self.writer.close()
+            self._executor.shutdown(wait=True)
+            if self._parser is not self._executor:
+                self._parser.shutdown(wait=True)
+        
+        if self.index is not None:
+            finish_incremental(self.conn, self.index)
 
 
-def extract_listing_data(url: str) -> Optional[Dict]:
+def reparse_archive(conn: sqlite3.Connection, path: str, parse_workers: int = 0):
     """
-    Extract data from a listing detail page.
-    Returns a dictionary with the listing data.
+    Re-run extraction over every page of an archive, without any network
+    access, and save the results. Only the parsed fields of the stored
+    listings change: their activity, last_seen, sectors and dwelling types
+    stay those recorded by the crawls. Pages of listings that are not
+    stored yet are saved as new listings.
     """
+    archive = PageArchive(path)
+    stored = {url for url, in conn.execute("SELECT url FROM listings")}
+    
+    pipeline = ParsePipeline(extract_page, parse_workers or os.cpu_count())
+    print(f"Re-parsing {len(archive)} archived pages with {pipeline.workers} worker processes")
+    
+    writer = ListingWriter(conn, batch_size=500)
+    saved = failed = 0
+    start = time.perf_counter()
     try:
-        response = session.get(url, timeout=30)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        data = {
-            'url': url,
-            'name': '',
-            'address': '',
-            'email': None,
-            'phone': None,
-            'has_car_parking': False,
-            'has_bike_parking': False,
-        }
-        
-        # Extract name - usually in an h1 or title
-        # Try multiple selectors
-        name_elem = (
-            soup.find('h1') or 
-            soup.find('h2', class_=re.compile(r'title|name', re.I)) or
-            soup.find('div', class_=re.compile(r'title|name', re.I)) or
-            soup.find('title')
-        )
-        if name_elem:
-            name_text = name_elem.get_text(strip=True)
-            # Clean up title tag (remove " | FHCQ" or similar)
-            if '|' in name_text:
-                name_text = name_text.split('|')[0].strip()
-            data['name'] = name_text
-        
-        # Extract address - look for address patterns
-        # The address might be in various formats, try multiple approaches
-        address_patterns = [
-            soup.find('address'),
-            soup.find('div', class_=re.compile(r'address|adresse', re.I)),
-            soup.find('p', class_=re.compile(r'address|adresse', re.I)),
-        ]
-        
-        for pattern in address_patterns:
-            if pattern:
-                # Use get_text with separator to preserve all text including nested elements
-                address_text = pattern.get_text(separator=' ', strip=True)
-                # Also try to get all strings from the element to catch any missing parts
-                if address_text:
-                    # Get all strings to ensure we capture everything
-                    all_strings = list(pattern.stripped_strings)
-                    if all_strings:
-                        # Join all strings to ensure we get the complete address
-                        full_address = ' '.join(all_strings)
-                        # Use the longer version (more complete)
-                        if len(full_address) > len(address_text):
-                            address_text = full_address
-                
-                if address_text and len(address_text) > 10:  # Basic validation
-                    data['address'] = address_text
-                    break
-        
-        # If no address found, try to find text that looks like an address by postal code
-        if not data['address']:
-            # Look for postal code pattern (H1A 1A1) and extract full address context
-            postal_code_pattern = re.compile(r'[A-Z]\d[A-Z]\s?\d[A-Z]\d')
+        for url, listing_data, error in pipeline.map((url, content, url) for url, content in archive):
+            if error is not None:
+                print(f"Error parsing listing {url}: {error}")
             
-            # First, try to find the element containing the postal code
-            all_elements = soup.find_all(string=postal_code_pattern)
-            for element in all_elements:
-                parent = element.find_parent()
-                if parent:
-                    # Get all text from the parent element
-                    parent_text = parent.get_text(separator=' ', strip=True)
-                    if len(parent_text) > 10:
-                        data['address'] = parent_text
-                        break
+            if listing_data:
+                if listing_data['url'] in stored:
+                    writer.save_parsed(listing_data)
+                else:
+                    writer.save_listing(listing_data, ())
+                saved += 1
+            else:
+                failed += 1
+                print(f"  ✗ Failed to extract data from {url}")
+    finally:
+        writer.close()
+        pipeline.close()
+        archive.close()
+    
+    print(f"Re-parsed {saved} listings ({failed} failed) in {time.perf_counter() - start:.1f}s")
+
+
+class CrawlStopped(Exception):
+    """Raised in the crawl thread of Crawler.listings() when the consumer stops reading."""
+
+
+class Crawler:
+    """
+    A crawl of the FHCQ website into a database, with its configuration
+    and state: what crawler.py does, for use from other programs.
+    
+    `sectors` (sector id -> name) and `dwelling_types` choose the searches
+    (default: SECTORS and DWELLING_TYPES). `transport` is the requests
+    adapter mounted on the session (default: a TransportAdapter, or a
+    CachingAdapter over `cache`, with a pool of `pool_size` connections and
+    `retries` immediate retries), and `geocoder` a backend of geocode.py
+    (see make_backend()). The other options are those of the command line.
+    Nothing is opened or imported before the first crawl; `cache` and
+    `archive` stay the caller's to close, and may be used from the crawl
+    thread of listings().
+    
+    run() crawls to completion and returns the run report. listings() runs
+    the same crawl in a background thread and yields every listing as it is
+    saved; stopping the iteration stops the crawl, which `resume` continues.
+    """
+    
+    def __init__(self, db_path: str = DB_NAME, base_url: str = BASE_URL, sectors: Optional[Dict[int, str]] = None,
+                 dwelling_types: Optional[Iterable[int]] = None, engine: str = 'serial', concurrency: int = 8,
+                 rate: float = 2, burst: float = 2, request_delay: Optional[float] = None, parse_workers: int = 0,
+                 incremental: bool = False, transport=None, pool_size: Optional[int] = None,
+                 retries: Optional[int] = None, cache: Optional['HTTPCache'] = None,
+                 archive: Optional[PageArchive] = None, resume: bool = False, join: bool = False,
+                 max_attempts: int = MAX_ATTEMPTS, lease: float = LEASE_SECONDS, geocoder=None,
+                 export_dir: Optional[str] = None):
+        if engine not in ('serial', 'async'):
+            raise ValueError(f"Unknown engine: {engine}")
+        if rate <= 0 or burst <= 0 or concurrency < 1:
+            raise ValueError("rate and burst must be positive, and concurrency at least 1")
+        if request_delay is not None and request_delay < 0:
+            raise ValueError("request_delay cannot be negative")
+        self.db_path = db_path
+        self.base_url = base_url
+        self.sectors = dict(SECTORS if sectors is None else sectors)
+        self.dwelling_types = list(DWELLING_TYPES if dwelling_types is None else dwelling_types)
+        self.engine = engine
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.request_delay = REQUEST_DELAY if request_delay is None else request_delay
+        self.parse_workers = parse_workers
+        self.incremental = incremental
+        self.transport = transport
+        self.pool_size = pool_size
+        self.retries = retries
+        self.cache = cache
+        self.archive = archive
+        self.resume = resume
+        self.join = join
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.geocoder = geocoder
+        self.export_dir = export_dir
+        
+        # Counters and timings of the current run
+        self.metrics = Metrics()
+        # Request budget shared with the other workers of a multi-process
+        # crawl (with `join`); replaces the per-process rate limits
+        self.rate_budget: Optional[RateBudget] = None
+        self.on_listing: Optional[Callable[[Dict], None]] = None
+        self._session: Optional['requests.Session'] = None
+        self._last_request = 0.0
+    
+    @property
+    def session(self) -> 'requests.Session':
+        """The HTTP session, with `transport` mounted; made on first use."""
+        if self._session is None:
+            import requests
+            from transport import ACCEPT_ENCODING
             
-            # Fallback: search in full text
-            if not data['address']:
-                all_text = soup.get_text(separator=' ')
-                matches = postal_code_pattern.findall(all_text)
-                if matches:
-                    # Try to extract surrounding text as address
-                    for match in matches:
-                        idx = all_text.find(match)
-                        if idx > 0:
-                            # Get more text before postal code to capture full address
-                            start = max(0, idx - 100)
-                            end = min(len(all_text), idx + 20)
-                            potential_address = all_text[start:end].strip()
-                            # Clean up - remove any leading/trailing punctuation
-                            potential_address = re.sub(r'^[,\s]+|[,\s]+$', '', potential_address)
-                            if len(potential_address) > 10:
-                                data['address'] = potential_address
-                                break
-        
-        # Extract email - look for mailto links or email patterns
-        email_link = soup.find('a', href=re.compile(r'^mailto:'))
-        if email_link:
-            data['email'] = email_link['href'].replace('mailto:', '').strip()
+            session = requests.Session()
+            session.headers.update({'User-Agent': USER_AGENT, 'Accept-Encoding': ACCEPT_ENCODING})
+            if self.transport is None:
+                self.transport = self._make_transport()
+            session.mount('https://', self.transport)
+            session.mount('http://', self.transport)
+            self._session = session
+        return self._session
+    
+    def _make_transport(self) -> 'TransportAdapter':
+        from transport import DEFAULT_POOL_SIZE, DEFAULT_RETRIES, TransportAdapter
+        
+        # Size the pool to the number of requests that can be in flight at
+        # once, so that every connection is kept alive between requests.
+        pool_size = self.pool_size
+        if pool_size is None:
+            pool_size = max(self.concurrency, DEFAULT_POOL_SIZE) if self.engine == 'async' else DEFAULT_POOL_SIZE
+        retries = DEFAULT_RETRIES if self.retries is None else self.retries
+        if self.cache is not None:
+            from http_cache import CachingAdapter
+            return CachingAdapter(self.cache, pool_size=pool_size, retries=retries)
+        return TransportAdapter(pool_size=pool_size, retries=retries)
+    
+    def searches(self) -> List[Tuple[int, int]]:
+        """The (sector id, dwelling type) searches of the crawl."""
+        return [(sector_id, dwelling_type) for sector_id in self.sectors for dwelling_type in self.dwelling_types]
+    
+    def fetch(self, url: str, params: Optional[Dict[str, str]] = None, **labels) -> 'requests.Response':
+        """
+        GET a page with the crawl's session, raising on HTTP errors.
+        Search pages (with `params`) and detail pages are timed separately;
+        `labels` break the metrics down further (e.g. by sector).
+        """
+        import requests
+        
+        kind = 'search' if params else 'detail'
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, params=params, timeout=(CONNECT_TIMEOUT, REQUEST_TIMEOUT))
+            response.raise_for_status()
+        except requests.RequestException as e:
+            self.metrics.inc('errors_total', stage='fetch', kind=kind, type=error_type(e), **labels)
+            raise
+        
+        self.metrics.observe('fetch_seconds', time.perf_counter() - start, kind=kind, **labels)
+        timing = getattr(response, 'timing', None)
+        source = 'cache' if getattr(response, 'from_cache', False) else 'network'
+        self.metrics.inc('pages_fetched_total', kind=kind, source=source, **labels)
+        self.metrics.inc('bytes_downloaded_total', timing['wire_bytes'] if timing else 0, kind=kind)
+        return response
+    
+    def polite_wait(self):
+        """
+        Serial engine: wait until `request_delay` seconds have passed since
+        the previous request started, so the time spent on a request counts
+        towards the delay. In a multi-process crawl, the request waits for
+        its slot in the budget shared by the workers instead.
+        """
+        if self.rate_budget is not None:
+            self.rate_budget.wait(urllib.parse.urlsplit(self.base_url).netloc)
+            return
+        wait = self._last_request + self.request_delay - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_request = time.monotonic()
+    
+    def handle_failure(self, frontier: Frontier, kind: str, key: str, label: str,
+                       error: 'requests.RequestException'):
+        """Schedule another attempt of a failed frontier item, or give up on it."""
+        if not is_retryable(error):
+            frontier.fail(kind, key, str(error))
+            self.metrics.inc('given_up_total', kind=kind)
+            print(f"  ✗ Giving up on {label}: {error}")
+            return
+        
+        delay = frontier.retry(kind, key, str(error))
+        if delay is None:
+            self.metrics.inc('given_up_total', kind=kind)
+            print(f"  ✗ Giving up on {label} after {frontier.max_attempts} attempts: {error}")
         else:
-            # Look for email pattern in text
-            email_pattern = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
-            email_match = email_pattern.search(soup.get_text())
-            if email_match:
-                data['email'] = email_match.group(0)
-        
-        # Extract phone - look for tel: links or phone patterns
-        phone_link = soup.find('a', href=re.compile(r'^tel:'))
-        if phone_link:
-            phone = phone_link['href'].replace('tel:', '').strip()
-            # Clean up phone number (remove spaces, normalize)
-            phone = re.sub(r'[\s\-\(\)]', '', phone)
-            if phone.startswith('1'):
-                phone = phone[1:]  # Remove leading 1 for North American numbers
-            data['phone'] = phone
+            self.metrics.inc('retries_total', kind=kind)
+            print(f"  ↻ Retrying {label} in {delay:.1f}s")
+    
+    def record_search_page(self, frontier: Frontier, sector_id: int, dwelling_type: int, page: int,
+                           page_urls: List[str], has_next: bool, last_page: Optional[int] = None) -> Tuple[int, bool]:
+        """
+        Record one parsed page of search results in the frontier.
+        Returns the number of listings the search had not found yet and
+        whether the search is finished.
+        """
+        sector_name = self.sectors[sector_id]
+        seen = frontier.seen(sector_name, dwelling_type)
+        new_urls = [url for url in page_urls if url not in seen]
+        self.metrics.inc('search_pages_total', sector=sector_name, dwelling_type=dwelling_type)
+        self.metrics.inc('listings_found_total', len(new_urls), sector=sector_name, dwelling_type=dwelling_type)
+        
+        if last_page is not None:
+            finished = not new_urls or page >= last_page
         else:
-            # Look for phone pattern (various formats)
-            # Quebec format: (514) 123-4567, 514-123-4567, 514.123.4567, etc.
-            phone_patterns = [
-                re.compile(r'\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}'),  # Standard format
-                re.compile(r'\d{3}[-.\s]?\d{3}[-.\s]?\d{4}'),  # Without parentheses
-            ]
-            for pattern in phone_patterns:
-                phone_match = pattern.search(soup.get_text())
-                if phone_match:
-                    phone = phone_match.group(0).strip()
-                    # Clean up phone number
-                    phone = re.sub(r'[\s\-\(\)\.]', '', phone)
-                    if len(phone) == 10:  # Valid 10-digit number
-                        data['phone'] = phone
-                        break
-        
-        # Extract parking information from specific HTML elements
-        # Look for the features section with icon classes
-        features_section = soup.find('p', class_=re.compile(r'coop--features', re.I))
-        if features_section:
-            # Check for car parking icon
-            car_icon = features_section.find('span', class_=re.compile(r'icon-car-side', re.I))
-            if car_icon:
-                # If the icon doesn't have 'disabled' class, parking is available
-                if 'disabled' not in car_icon.get('class', []):
-                    data['has_car_parking'] = True
+            # Without a page count, the first page is followed even without a
+            # next link; later pages only while they link to another one
+            finished = not new_urls or (not has_next and page > 1)
+        frontier.record_search_page(sector_id, sector_name, dwelling_type, page, new_urls, finished)
+        return len(new_urls), finished
+    
+    def get_listing_urls(self, frontier: Frontier, sector_id: int, dwelling_type: int, page: int = 1) -> int:
+        """
+        Get the listing URLs for a given sector and dwelling type, from results
+        page `page` on, recording every page in the frontier (and in the
+        archive). Handles pagination, stopping at the last page when the
+        results tell which one it is. If a page cannot be fetched, it is
+        scheduled for a retry and the search stops there. Returns the number
+        of listings found.
+        """
+        import requests
+        
+        found = 0
+        
+        while True:
+            params = search_params(sector_id, dwelling_type, page)
+            
+            self.polite_wait()
+            try:
+                response = self.fetch(self.base_url, params, sector=self.sectors[sector_id],
+                                      dwelling_type=dwelling_type)
+            except requests.RequestException as e:
+                print(f"Error fetching page {page} for sector {sector_id}, dwelling {dwelling_type}: {e}")
+                self.handle_failure(frontier, SEARCH, search_key(sector_id, dwelling_type),
+                                    f"search {self.sectors[sector_id]} - {dwelling_type}½", e)
+                return found
+            
+            if self.archive is not None:
+                self.archive.store(response.url, response, SEARCH)
+            
+            # Search pages are parsed even when served from the HTTP cache,
+            # since the URLs they list are needed for the next phase.
+            new, finished = self.record_search_page(frontier, sector_id, dwelling_type, page,
+                                                    *parse_search_page(response.content, self.base_url))
+            found += new
+            if finished:
+                return found
+            
+            page += 1
+    
+    def collect_listing_urls(self, frontier: Frontier) -> Dict[str, Set[Tuple[str, int]]]:
+        """
+        First crawl phase: search every sector/dwelling type combination still
+        pending in the frontier, resuming each from the page it stopped at.
+        Returns a map of listing URL -> {(sector_name, dwelling_type)}.
+        """
+        searched = 0
+        
+        def search_round(items: List[Tuple[str, int]]):
+            nonlocal searched
+            for key, page in items:
+                searched += 1
+                sector_id, dwelling_type = parse_search_key(key)
+                resumed = f" (from page {page})" if page > 1 else ""
+                print(f"\n[{searched}] Searching: {self.sectors[sector_id]} - {dwelling_type}½{resumed}")
+                
+                found = self.get_listing_urls(frontier, sector_id, dwelling_type, page)
+                print(f"  Found {found} listings")
+        
+        run_rounds(frontier, SEARCH, search_round, SEARCH_CLAIM)
+        return frontier.memberships()
+    
+    def extract_listing_data(self, url: str) -> Optional[Dict]:
+        """
+        Extract data from a listing detail page.
+        Returns a dictionary with the listing data.
+        """
+        import requests
+        
+        try:
+            response = self.fetch(url)
             
-            # Check for bike parking icon
-            bike_icon = features_section.find('span', class_=re.compile(r'icon-bicycle', re.I))
-            if bike_icon:
-                # If the icon doesn't have 'disabled' class, parking is available
-                if 'disabled' not in bike_icon.get('class', []):
-                    data['has_bike_parking'] = True
+            return parse_listing_page(response.content, url)
+        
+        except requests.RequestException as e:
+            print(f"Error fetching listing {url}: {e}")
+            return None
+        except Exception as e:
+            print(f"Error parsing listing {url}: {e}")
+            return None
+    
+    def record_parse(self, memberships: Iterable[Tuple[str, int]], listing_data: Optional[Dict],
+                     seconds: Optional[float], error: Optional[BaseException]):
+        """Count the outcome of parsing a detail page, and its parse time."""
+        labels = _listing_labels(memberships)
+        if seconds is not None:
+            self.metrics.observe('parse_seconds', seconds, **labels)
+        if listing_data:
+            self.metrics.inc('listings_saved_total', **labels)
         else:
-            # Fallback: Look for individual icon elements anywhere on the page
-            car_icons = soup.find_all('span', class_=re.compile(r'icon-car-side', re.I))
-            for car_icon in car_icons:
-                if 'disabled' not in car_icon.get('class', []):
-                    data['has_car_parking'] = True
-                    break
+            self.metrics.inc('errors_total', stage='parse',
+                             type=error_type(error) if error is not None else 'no_data', **labels)
+    
+    def saved(self, listing_data: Dict):
+        """Hand a saved listing to `on_listing`."""
+        if self.on_listing is not None:
+            self.on_listing(listing_data)
+    
+    def _fetch_listing_pages(self, urls: List[str]) -> Iterator[Tuple[str, Optional['requests.Response'],
+                                                                      Optional[Exception]]]:
+        """Fetch detail pages one at a time; yields (url, response, None) or (url, None, error)."""
+        import requests
+        
+        for i, url in enumerate(urls, 1):
+            print(f"  [{i}/{len(urls)}] Fetching: {url}")
+            self.polite_wait()
+            try:
+                response = self.fetch(url)
+            except requests.RequestException as e:
+                print(f"Error fetching listing {url}: {e}")
+                yield url, None, e
+                continue
+            yield url, response, None
+    
+    def crawl_serial(self, conn: sqlite3.Connection, frontier: Frontier):
+        """
+        Crawl one request at a time, in two phases: collect the URL ->
+        memberships map from every search, then fetch each distinct listing once.
+        Both phases only do the work still pending in `frontier`, and failed
+        requests are retried in further rounds once their backoff has elapsed.
+        With `parse_workers`, detail pages are fetched by a background thread and
+        parsed in a process pool while the next ones download.
+        """
+        print(f"Starting crawl for {len(self.sectors)} sectors × {len(self.dwelling_types)} dwelling types = "
+              f"{len(self.sectors) * len(self.dwelling_types)} combinations")
+        
+        memberships = self.collect_listing_urls(frontier)
+        print(f"\nFound {len(memberships)} distinct listings")
+        index = begin_incremental(conn, memberships, frontier.failed_searches()) if self.incremental else None
+        frontier.queue_listings()
+        writer = ListingWriter(conn, frontier=frontier, metrics=self.metrics)
+        pipeline = ParsePipeline(parse_timed, self.parse_workers) if self.parse_workers else None
+        
+        def listing_round(items: List[Tuple[str, int]]):
+            self.crawl_listings_serial(writer, frontier, [url for url, _ in items], memberships, index, pipeline)
+            # Write the batched completions before looking for due pages again
+            writer.flush()
+        
+        try:
+            run_rounds(frontier, LISTING, listing_round, LISTING_CLAIM)
+        finally:
+            writer.close()
+            if pipeline is not None:
+                pipeline.close()
+        if index is not None:
+            finish_incremental(conn, index)
+    
+    def crawl_listings_serial(self, writer: ListingWriter, frontier: Frontier, urls: List[str],
+                              memberships: Dict[str, Set[Tuple[str, int]]], index: Optional[IncrementalIndex] = None,
+                              pipeline: Optional[ParsePipeline] = None):
+        """Fetch, parse and save one round of detail pages."""
+        pages = self._fetch_listing_pages(urls)
+        if pipeline is not None:
+            # Downloads continue in a background thread while the pool parses
+            fetched = pages
+            pages = start_fetcher(lambda queue: [queue.put(page) for page in fetched], pipeline.max_pending)
+        
+        content_hashes = {}
+        
+        def pages_to_parse():
+            # Runs on this thread, so the database is only touched here
+            for url, response, error in pages:
+                if response is None:
+                    self.handle_failure(frontier, LISTING, url, url, error)
+                    continue
+                
+                if self.archive is not None:
+                    self.archive.store(url, response)
+                
+                content_hash = page_hash(response.content)
+                if save_unchanged(writer, url, response, content_hash, memberships[url], index):
+                    writer.complete(url)
+                    self.metrics.inc('listings_unchanged_total', **_listing_labels(memberships[url]))
+                    print(f"    = Unchanged: {url}")
+                    continue
+                
+                content_hashes[url] = content_hash
+                yield url, response.content, url
+        
+        results = pipeline.map(pages_to_parse()) if pipeline is not None else _parse_inline(pages_to_parse())
+        for url, result, error in results:
+            if error is not None:
+                print(f"Error parsing listing {url}: {error}")
             
-            bike_icons = soup.find_all('span', class_=re.compile(r'icon-bicycle', re.I))
-            for bike_icon in bike_icons:
-                if 'disabled' not in bike_icon.get('class', []):
-                    data['has_bike_parking'] = True
-                    break
+            listing_data, seconds = result if result is not None else (None, None)
+            self.record_parse(memberships[url], listing_data, seconds, error)
+            if listing_data:
+                listing_data['content_hash'] = content_hashes.pop(url)
+                writer.save_listing(listing_data, memberships[url])
+                writer.complete(url)
+                print(f"    ✓ Saved: {listing_data['name']}")
+                self.saved(listing_data)
+            else:
+                # Parsing is deterministic, so the page is not retried
+                frontier.fail(LISTING, url, str(error) if error is not None else "no listing data found")
+                print(f"    ✗ Failed to extract data from {url}")
+    
+    def start(self, conn: sqlite3.Connection, frontier: Frontier) -> Tuple[bool, Optional[int]]:
+        """
+        Set up the frontier: join the crawl in progress, resume the
+        interrupted one, or start a new one. Returns whether there is
+        anything to crawl, and the history run the changes are recorded
+        under (None when joining: the workers record theirs under the run
+        they join).
+        """
+        if self.join:
+            if not frontier.unfinished():
+                print("No crawl in progress to join")
+                return False, None
+            print(f"Joining the crawl in progress as {frontier.owner}")
+            if self.engine == 'async':
+                self.rate_budget = RateBudget(self.db_path, self.rate, self.burst)
+            elif self.request_delay > 0:
+                self.rate_budget = RateBudget(self.db_path, 1 / self.request_delay)
+            # Without a delay, the serial workers send their requests unthrottled
+            return True, None
         
-        return data
+        kind = INCREMENTAL if self.incremental else CRAWL
+        if self.resume and frontier.unfinished():
+            print(f"Resuming the interrupted crawl ({frontier.report()})")
+            # Its workers are gone; their pages need not wait for the leases to expire
+            frontier.release(everyone=True)
+            return True, start_run(conn, kind, resume=True)
+        if self.resume:
+            print("No interrupted crawl to resume, starting a new one")
+        frontier.start(self.searches())
+        return True, start_run(conn, kind)
+    
+    def crawl(self, conn: sqlite3.Connection, frontier: Frontier):
+        """Do the work pending in the frontier with the configured engine."""
+        try:
+            with Heartbeat(frontier):
+                if self.engine == 'async':
+                    asyncio.run(AsyncCrawler(self, conn, frontier).run())
+                else:
+                    self.crawl_serial(conn, frontier)
+        finally:
+            # Hand back the pages left unfinished by an interruption
+            if conn.in_transaction:
+                conn.rollback()
+            frontier.release()
+            if self.rate_budget is not None:
+                self.rate_budget.close()
+                self.rate_budget = None
+    
+    def finish(self, conn: sqlite3.Connection, frontier: Frontier, run_id: Optional[int],
+               complete: bool = True) -> Dict:
+        """
+        The end of a crawl: geocoding, closing the history run (if
+        `complete`), duplicate detection, statistics and export, which
+        workers joining a crawl leave to the process that started it.
+        Returns the run report.
+        """
+        print(f"\n{frontier.report()}")
+        if self.geocoder is not None and not self.join:
+            print(geocode_report(geocode_listings(conn, self.geocoder)))
+        report = self.run_report(frontier)
+        if run_id is not None:
+            if complete:
+                finish_run(conn, run_id)
+            report['run_id'] = run_id
+            print(history_report(conn, run_id))
+        if not self.join:
+            print(dedup_report(dedup_listings(conn)))
+        refresh_stats(conn)
+        if self.export_dir and not self.join:
+            print(export_report(self.export_dir, export(conn, self.export_dir)))
+        # Refresh the query planner statistics used to pick the reader indexes
+        conn.execute("PRAGMA optimize")
+        return report
+    
+    def run(self, on_listing: Optional[Callable[[Dict], None]] = None) -> Optional[Dict]:
+        """
+        Crawl to completion, calling `on_listing` with every listing saved.
+        Returns the run report, or None if there was no crawl to join.
+        """
+        self.metrics = Metrics()
+        self.on_listing = on_listing
+        conn = init_database(self.db_path)
+        try:
+            frontier = Frontier(conn, self.max_attempts, self.lease)
+            ready, run_id = self.start(conn, frontier)
+            if not ready:
+                return None
+            self.crawl(conn, frontier)
+            return self.finish(conn, frontier, run_id)
+        finally:
+            self.on_listing = None
+            conn.close()
+    
+    def listings(self, buffer: int = 100) -> Iterator[Dict]:
+        """
+        Run the crawl in a background thread, yielding every listing as it
+        is saved (the dictionary of parse_listing_page()). Up to `buffer`
+        listings wait for the reader before the crawl pauses. If the reader
+        stops early, the crawl stops at its next listing, leaving the rest
+        of the frontier for a crawl with `resume`; the listings saved but
+        not read by then are in the database, and are not yielded again.
+        """
+        stop = threading.Event()
+        errors: List[BaseException] = []
         
-    except requests.RequestException as e:
-        print(f"Error fetching listing {url}: {e}")
-        return None
-    except Exception as e:
-        print(f"Error parsing listing {url}: {e}")
-        return None
+        def crawl(listings: PageQueue):
+            def on_listing(listing_data: Dict):
+                if stop.is_set():
+                    raise CrawlStopped()
+                listings.put(listing_data)
+            
+            try:
+                self.run(on_listing)
+            except CrawlStopped:
+                pass
+            except BaseException as e:
+                errors.append(e)
+        
+        listings = start_fetcher(crawl, buffer)
+        finished = False
+        try:
+            yield from listings
+            finished = True
+        finally:
+            if not finished:
+                stop.set()
+                # Unblock the crawl thread and wait for it to wind down
+                for _ in listings:
+                    pass
+        if errors:
+            raise errors[0]
+    
+    def reparse(self, path: str):
+        """
+        Re-run extraction over an archive written with `archive` (see
+        reparse_archive()), as a history run of its own, then refresh the
+        duplicates, statistics and export.
+        """
+        conn = init_database(self.db_path)
+        try:
+            run_id = start_run(conn, REPARSE)
+            reparse_archive(conn, path, self.parse_workers)
+            finish_run(conn, run_id)
+            print(dedup_report(dedup_listings(conn)))
+            refresh_stats(conn)
+            if self.export_dir:
+                print(export_report(self.export_dir, export(conn, self.export_dir)))
+        finally:
+            conn.close()
+    
+    def run_report(self, frontier: Frontier) -> Dict:
+        """The JSON run report: totals and rates, then every counter and histogram."""
+        metrics = self.metrics
+        finished = time.time()
+        duration = finished - metrics.started
+        pages = metrics.total('pages_fetched_total')
+        errors: Dict[str, float] = {}
+        for counter in metrics.to_dict()['counters']:
+            if counter['name'] == 'errors_total':
+                key = f"{counter['labels']['stage']}:{counter['labels']['type']}"
+                errors[key] = errors.get(key, 0) + counter['value']
+        stats = getattr(self.transport, 'stats', None)
+        
+        return {
+            'started_at': _iso(metrics.started),
+            'finished_at': _iso(finished),
+            'duration_seconds': duration,
+            'engine': self.engine,
+            'incremental': self.incremental,
+            'pages_fetched': pages,
+            'pages_per_second': pages / duration if duration else None,
+            'listings_saved': metrics.total('listings_saved_total'),
+            'listings_unchanged': metrics.total('listings_unchanged_total'),
+            'errors': errors,
+            'frontier': {f"{kind}_{status}": count for (kind, status), count in frontier.counts().items()},
+            'transport': stats.summary() if stats is not None else None,
+            'http_cache': dict(self.cache.stats) if self.cache is not None else None,
+            'archive': self.archive.stats() if self.archive is not None else None,
+            **metrics.to_dict(),
+        }
+    
+    def print_run_summary(self, report: Dict):
+        """Print the headline numbers of a run report."""
+        fetches = self.metrics.merged('fetch_seconds')
+        parses = self.metrics.merged('parse_seconds')
+        writes = self.metrics.merged('db_write_seconds')
+        print(f"Run: {report['pages_fetched']:.0f} pages in {report['duration_seconds']:.1f}s "
+              f"({report['pages_per_second'] or 0:.1f} pages/s), {report['listings_saved']:.0f} listings saved, "
+              f"{report['listings_unchanged']:.0f} unchanged")
+        if fetches.count:
+            print(f"  fetch p50/p95: {fetches.quantile(0.5) * 1000:.0f}/{fetches.quantile(0.95) * 1000:.0f} ms")
+        if parses.count:
+            print(f"  parse mean: {parses.sum / parses.count * 1000:.1f} ms/page")
+        if writes.count:
+            print(f"  database: {writes.count} batches, {writes.sum / writes.count * 1000:.1f} ms mean")
+        if report['errors']:
+            print("  errors: " + ", ".join(f"{key} {count:.0f}" for key, count in sorted(report['errors'].items())))
 
 
-def save_listing(conn: sqlite3.Connection, listing_data: Dict, sector: str, dwelling_type: int):
-    """Save a listing to the database."""
-    cursor = conn.cursor()
-    zone = ZONE_MAPPING.get(sector, None)
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    from http_cache import CACHE_NAME, DEFAULT_MAX_BYTES
+    from transport import DEFAULT_POOL_SIZE, DEFAULT_RETRIES
     
-    try:
-        cursor.execute("""
-            INSERT OR REPLACE INTO listings 
-            (name, address, email, phone, url, has_car_parking, has_bike_parking, zone, sector, dwelling_type)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            listing_data['name'],
-            listing_data['address'],
-            listing_data['email'],
-            listing_data['phone'],
-            listing_data['url'],
-            1 if listing_data['has_car_parking'] else 0,
-            1 if listing_data['has_bike_parking'] else 0,
-            zone,
-            sector,
-            dwelling_type
-        ))
-        conn.commit()
-        return True
-    except sqlite3.Error as e:
-        print(f"Error saving listing {listing_data['url']}: {e}")
-        return False
+    parser = argparse.ArgumentParser(description="Crawl the FHCQ cooperatives website.")
+    parser.add_argument('--engine', choices=['serial', 'async'], default='serial',
+                        help="Crawl engine: one request at a time, or concurrent (default: serial)")
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help="Maximum requests in flight with the async engine (default: 8)")
+    parser.add_argument('--rate', type=float, default=2,
+                        help="Requests per second per host with the async engine (default: 2)")
+    parser.add_argument('--burst', type=float, default=2,
+                        help="Token-bucket burst size with the async engine (default: 2)")
+    parser.add_argument('--base-url', default=BASE_URL,
+                        help=f"Search page URL (default: {BASE_URL})")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only re-extract listings whose page changed; mark listings that disappeared inactive")
+    parser.add_argument('--db', default=DB_NAME,
+                        help=f"SQLite database path (default: {DB_NAME})")
+    parser.add_argument('--cache', default=CACHE_NAME,
+                        help=f"HTTP response cache path (default: {CACHE_NAME})")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Disable the HTTP response cache")
+    parser.add_argument('--cache-max-mb', type=float, default=DEFAULT_MAX_BYTES / 1024 / 1024,
+                        help="Maximum cache size before least recently used entries are evicted (default: %(default)g)")
+    parser.add_argument('--cache-ttl', type=float, default=None,
+                        help="Serve cached pages that have no ETag/Last-Modified for this many seconds without refetching")
+    parser.add_argument('--parse-workers', type=int, default=0,
+                        help="Parse detail pages in this many worker processes while fetching continues "
+                             "(default: 0, parse inline)")
+    parser.add_argument('--archive', default=None,
+                        help="Keep a compressed copy of every fetched page, with its headers, in this SQLite file")
+    parser.add_argument('--reparse-from', metavar='ARCHIVE', default=None,
+                        help="Re-run extraction over an archive written by --archive, without fetching anything")
+    parser.add_argument('--pool-size', type=int, default=None,
+                        help=f"Connections kept open per host (default: the async concurrency, at least "
+                             f"{DEFAULT_POOL_SIZE})")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help="Immediate retries of a request on connection errors, 429 and 5xx, with backoff "
+                             "and honouring Retry-After (default: %(default)s)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted crawl from its saved frontier instead of starting over")
+    parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                        help="Attempts per page before giving up on it (default: %(default)s)")
+    parser.add_argument('--geocode', metavar='BACKEND', default=None,
+                        help="After the crawl, geocode the listings without coordinates: 'nominatim', the URL of a "
+                             "Nominatim-compatible service, or a CSV gazetteer (see geocode.py)")
+    parser.add_argument('--export', metavar='DIR', default=None,
+                        help="After the crawl, write the static JSON snapshots for the web interface to DIR "
+                             "(see export.py)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Run the crawl in this many processes sharing the database and the rate limit "
+                             "(default: 1)")
+    parser.add_argument('--join', action='store_true',
+                        help="Work on the crawl in progress in the database alongside other processes")
+    parser.add_argument('--lease', type=float, default=LEASE_SECONDS,
+                        help="Seconds a process holds the pages it claimed without renewing them, before "
+                             "others may take them over (default: %(default)g)")
+    parser.add_argument('--metrics', metavar='PATH', default=None,
+                        help="Write a JSON run report (counters, timings, errors) to this file")
+    parser.add_argument('--prometheus', metavar='PATH', default=None,
+                        help="Write the run metrics in the Prometheus textfile format to this file")
+    parser.add_argument('--profile', metavar='PATH', nargs='?', const='crawl.prof', default=None,
+                        help="Run the crawl under cProfile, save the profile (default: crawl.prof) and print the "
+                             "hot spots of the search and extraction code")
+    args = parser.parse_args(argv)
+    for option in ('rate', 'burst', 'concurrency', 'workers'):
+        if getattr(args, option) <= 0:
+            parser.error(f"--{option} must be positive")
+    return args
+
 
+def worker_argv(args: argparse.Namespace) -> List[str]:
+    """Command line of the worker processes of a --workers crawl: the crawl options, and --join."""
+    argv = ['--join', '--engine', args.engine, '--concurrency', str(args.concurrency), '--rate', str(args.rate),
+            '--burst', str(args.burst), '--base-url', args.base_url, '--db', args.db, '--cache', args.cache,
+            '--cache-max-mb', str(args.cache_max_mb), '--parse-workers', str(args.parse_workers),
+            '--retries', str(args.retries), '--max-attempts', str(args.max_attempts), '--lease', str(args.lease)]
+    if args.incremental:
+        argv.append('--incremental')
+    if args.no_cache:
+        argv.append('--no-cache')
+    if args.cache_ttl is not None:
+        argv += ['--cache-ttl', str(args.cache_ttl)]
+    if args.archive:
+        argv += ['--archive', args.archive]
+    if args.pool_size is not None:
+        argv += ['--pool-size', str(args.pool_size)]
+    return argv
 
-def main():
+
+def _iso(timestamp: float) -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+def print_profile(profiler: cProfile.Profile, path: str):
+    """Save a profile and print where the search and extraction code spends its time."""
+    profiler.dump_stats(path)
+    stats = pstats.Stats(profiler, stream=sys.stdout)
+    stats.sort_stats('cumulative')
+    print(f"\nProfile saved to {path} (browse it with: python -m pstats {path})")
+    print("\nSearch phase (get_listing_urls):")
+    stats.print_callees(r'get_listing_urls')
+    print("Detail page extraction (parse_listing_page):")
+    stats.print_callees(r'parse_listing_page')
+    print("Top functions by own time:")
+    stats.sort_stats('tottime').print_stats(15)
+
+
+def main(argv: Optional[List[str]] = None):
     """Main crawler function."""
-    print("Initializing database...")
-    conn = init_database()
+    args = parse_args(argv)
     
-    total_combinations = len(SECTORS) * len(DWELLING_TYPES)
-    current = 0
+    if args.reparse_from:
+        print("Initializing database...")
+        Crawler(db_path=args.db, parse_workers=args.parse_workers, export_dir=args.export).reparse(args.reparse_from)
+        return
     
-    print(f"Starting crawl for {len(SECTORS)} sectors × {len(DWELLING_TYPES)} dwelling types = {total_combinations} combinations")
+    archive = PageArchive(args.archive) if args.archive else None
+    cache = None
+    if not args.no_cache:
+        from http_cache import HTTPCache
+        cache = HTTPCache(args.cache, int(args.cache_max_mb * 1024 * 1024), args.cache_ttl)
+    crawler = Crawler(
+        db_path=args.db, base_url=args.base_url, engine=args.engine, concurrency=args.concurrency, rate=args.rate,
+        burst=args.burst, parse_workers=args.parse_workers, incremental=args.incremental, pool_size=args.pool_size,
+        retries=args.retries, cache=cache, archive=archive, resume=args.resume, join=args.join,
+        max_attempts=args.max_attempts, lease=args.lease,
+        geocoder=make_backend(args.geocode) if args.geocode else None, export_dir=args.export,
+    )
     
-    for sector_id, sector_name in SECTORS.items():
-        for dwelling_type in DWELLING_TYPES:
-            current += 1
-            print(f"\n[{current}/{total_combinations}] Processing: {sector_name} - {dwelling_type}½")
-            
-            # Get all listing URLs for this combination
-            listing_urls = get_listing_urls(sector_id, dwelling_type)
-            print(f"  Found {len(listing_urls)} listings")
-            
-            # Process each listing
-            for i, url in enumerate(listing_urls, 1):
-                print(f"  [{i}/{len(listing_urls)}] Processing: {url}")
-                listing_data = extract_listing_data(url)
-                
-                if listing_data:
-                    if save_listing(conn, listing_data, sector_name, dwelling_type):
-                        print(f"    ✓ Saved: {listing_data['name']}")
-                    else:
-                        print(f"    ✗ Failed to save")
-                else:
-                    print(f"    ✗ Failed to extract data")
-                
-                time.sleep(1)  # Be polite to the server
+    print("Initializing database...")
+    conn = init_database(args.db)
+    frontier = Frontier(conn, args.max_attempts, args.lease)
+    # The changes to the listings are recorded under this run (see
+    # history.py); joining workers record theirs under the run they join
+    ready, run_id = crawler.start(conn, frontier)
+    if not ready:
+        conn.close()
+        return
+    
+    if args.workers > 1 and not args.join:
+        print(f"Starting {args.workers} worker processes")
+        failed = run_workers(args.workers, worker_argv(args))
+        crawler.finish(conn, frontier, run_id, complete=not failed)
+        conn.close()
+        if cache is not None:
+            cache.close()
+        if archive is not None:
+            print(archive.report())
+            archive.close()
+        if failed:
+            print(f"✗ {failed} of {args.workers} workers failed; continue with --resume")
+            sys.exit(1)
+        print("\n✓ Crawl completed!")
+        return
     
+    profiler = None
+    if args.profile:
+        if args.engine == 'async' or args.parse_workers:
+            print("Note: --profile only sees the main thread; the async engine fetches and parse workers "
+                  "run elsewhere. Use the serial engine without --parse-workers for a complete profile.")
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        crawler.crawl(conn, frontier)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+    
+    report = crawler.finish(conn, frontier, run_id)
     conn.close()
+    if archive is not None:
+        print(archive.report())
+        archive.close()
     print("\n✓ Crawl completed!")
+    crawler.print_run_summary(report)
+    if crawler.transport is not None:
+        print(crawler.transport.stats.report())
+    if cache is not None:
+        print(cache.report())
+        cache.close()
+    
+    if args.metrics:
+        write_json(args.metrics, report)
+        print(f"Run report written to {args.metrics}")
+    if args.prometheus:
+        write_atomic(args.prometheus, crawler.metrics.prometheus({
+            'last_run_timestamp_seconds': time.time(),
+            'run_duration_seconds': report['duration_seconds'],
+            'pages_per_second': report['pages_per_second'] or 0,
+        }))
+        print(f"Prometheus metrics written to {args.prometheus}")
+    if profiler is not None:
+        print_profile(profiler, args.profile)
 
 
 if __name__ == "__main__":
     main()
-
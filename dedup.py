@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Detection of the cooperatives listed more than once.
+The same cooperative can appear under several slugs, with its name
+spelled differently. Each active listing gets blocking keys from its
+normalized phone number, email and address (postal code and civic
+number); only listings sharing a key are compared, so the work grows
+with the size of the blocks rather than with the square of the number of
+listings. Two listings are the same cooperative if they share two keys,
+or one key and a similar name. Matches are grouped into clusters
+(union-find), and every listing of a cluster but the oldest is recorded
+in listing_duplicates with the id of that oldest one, its canonical
+listing. The listing queries, stats and export leave the duplicates out.
+
+Usage:
+    python query_db.py dedup [--refresh]
+    (run by crawler.py at the end of each crawl)
+"""
+
+import re
+import sqlite3
+import time
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from extractor import POSTAL_CODE_PATTERN
+from geocode import normalize_address
+
+# A key shared by more listings than this (a management company's phone,
+# a generic address) says nothing about identity and is not compared
+MAX_BLOCK_SIZE = 10
+
+# SequenceMatcher ratio above which two normalized names are similar
+NAME_SIMILARITY = 0.8
+
+# Words that every other name has, left out of the name comparison
+NAME_STOPWORDS = {"cooperative", "coop", "habitation", "habitations", "d", "de", "du", "des", "la", "le",
+                  "les", "l", "of", "the", "inc"}
+
+NON_DIGITS = re.compile(r'\D')
+NUMBER = re.compile(r'\d+')
+
+
+class Listing(NamedTuple):
+    id: int
+    name: str
+    keys: Dict[str, str]  # kind ('phone', 'email', 'address') -> normalized value
+
+
+def not_duplicate(id_column: str = "listings.id") -> str:
+    """SQL condition true for the listings that are not the duplicate of another."""
+    return f"NOT EXISTS (SELECT 1 FROM listing_duplicates WHERE listing_id = {id_column})"
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """The 10 digits of a phone number, as extract_listing_data() stores them, or None."""
+    digits = NON_DIGITS.sub('', phone or '')
+    if len(digits) == 11 and digits.startswith('1'):
+        digits = digits[1:]  # North American country code
+    return digits if len(digits) == 10 else None
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    email = (email or '').strip().casefold()
+    return email if '@' in email else None
+
+
+def address_key(address: Optional[str]) -> Optional[str]:
+    """Postal code and civic number of an address, or None without a postal code."""
+    address = (address or '').upper()
+    postal_code = POSTAL_CODE_PATTERN.search(address)
+    if postal_code is None:
+        return None
+    civic_number = NUMBER.search(address[:postal_code.start()])
+    return postal_code.group(0).replace(' ', '') + (f" {civic_number.group(0)}" if civic_number else '')
+
+
+def name_words(name: str) -> List[str]:
+    return [word for word in normalize_address(name).split() if word not in NAME_STOPWORDS]
+
+
+def similar_names(a: str, b: str) -> bool:
+    """
+    Whether two names are spellings of the same one: the same numbers (so
+    that phases 45-1 and 45-2 stay apart), and the other words alike.
+    """
+    words_a, words_b = name_words(a), name_words(b)
+    if [w for w in words_a if w.isdigit()] != [w for w in words_b if w.isdigit()]:
+        return False
+    text_a, text_b = " ".join(words_a), " ".join(words_b)
+    if not text_a or not text_b:
+        return text_a == text_b
+    if text_a in text_b or text_b in text_a:
+        return True
+    return SequenceMatcher(None, text_a, text_b).ratio() >= NAME_SIMILARITY
+
+
+def listing_keys(phone, email, address) -> Dict[str, str]:
+    keys = {'phone': normalize_phone(phone), 'email': normalize_email(email), 'address': address_key(address)}
+    return {kind: value for kind, value in keys.items() if value is not None}
+
+
+def load_listings(conn: sqlite3.Connection) -> List[Listing]:
+    return [
+        Listing(listing_id, name, listing_keys(phone, email, address))
+        for listing_id, name, phone, email, address in conn.execute(
+            "SELECT id, name, phone, email, address FROM listings WHERE is_active = 1 ORDER BY id"
+        )
+    ]
+
+
+def candidate_pairs(listings: Iterable[Listing]) -> Dict[Tuple[int, int], Set[str]]:
+    """The pairs of listings sharing at least one blocking key, with the kinds of keys they share."""
+    blocks: Dict[Tuple[str, str], List[int]] = {}
+    for listing in listings:
+        for kind, value in listing.keys.items():
+            blocks.setdefault((kind, value), []).append(listing.id)
+    
+    pairs: Dict[Tuple[int, int], Set[str]] = {}
+    for (kind, _), ids in blocks.items():
+        if len(ids) < 2 or len(ids) > MAX_BLOCK_SIZE:
+            continue
+        for i, a in enumerate(ids):
+            for b in ids[i + 1:]:
+                pairs.setdefault((a, b), set()).add(kind)
+    return pairs
+
+
+def find_duplicates(listings: List[Listing]) -> Dict[int, Tuple[int, str]]:
+    """
+    Map every duplicate listing id to (canonical id, kinds of evidence), the
+    canonical listing of a cluster being its smallest id.
+    """
+    names = {listing.id: listing.name for listing in listings}
+    parent: Dict[int, int] = {}
+    evidence: Dict[int, Tuple[int, str]] = {}  # listing id -> (keys shared, kinds)
+    
+    def find(x: int) -> int:
+        root = x
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while x != root:
+            parent[x], x = root, parent[x]
+        return root
+    
+    for (a, b), kinds in sorted(candidate_pairs(listings).items()):
+        if len(kinds) < 2 and not similar_names(names[a], names[b]):
+            continue
+        matched = (len(kinds), ",".join(sorted(kinds) + ([] if len(kinds) >= 2 else ['name'])))
+        # Keep the strongest evidence seen for each listing
+        for listing_id in (a, b):
+            evidence[listing_id] = max(evidence.get(listing_id, matched), matched)
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            # The smaller id stays the root, and so the canonical listing
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+    
+    return {listing_id: (find(listing_id), evidence[listing_id][1])
+            for listing_id in parent if find(listing_id) != listing_id}
+
+
+def dedup_listings(conn: sqlite3.Connection) -> Dict[str, object]:
+    """Find the duplicates among the active listings and replace the contents of listing_duplicates."""
+    start = time.perf_counter()
+    listings = load_listings(conn)
+    duplicates = find_duplicates(listings)
+    try:
+        conn.execute("DELETE FROM listing_duplicates")
+        conn.executemany(
+            "INSERT INTO listing_duplicates (listing_id, canonical_id, matched_on) VALUES (?, ?, ?)",
+            [(listing_id, canonical_id, matched_on)
+             for listing_id, (canonical_id, matched_on) in sorted(duplicates.items())]
+        )
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return {
+        'listings': len(listings),
+        'duplicates': len(duplicates),
+        'clusters': len({canonical_id for canonical_id, _ in duplicates.values()}),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def dedup_report(result: Dict[str, object]) -> str:
+    """One-line summary of dedup_listings()."""
+    return (f"Dedup: {result['duplicates']} duplicates of {result['clusters']} cooperatives among "
+            f"{result['listings']} listings in {result['seconds']:.1f}s (query_db.py dedup)")
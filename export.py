@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Static export of the listings.
+Writes what the read path of the web interface needs as pre-gzipped JSON
+snapshots, so that it can be served as static files whatever the size of
+the catalogue: every active listing, the facet indexes (the listing ids
+of each zone, sector, dwelling type and parking kind) and the counts.
+Each snapshot is named after the SHA-256 of its JSON content, which also
+serves as its ETag: an export that finds the data unchanged writes
+nothing, and a snapshot file never changes once written. manifest.json
+names the current snapshots; it is the only file to revalidate.
+
+Usage:
+    python query_db.py export [--out DIR]
+    python crawler.py --export DIR ...       # at the end of each crawl
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+from dedup import not_duplicate
+from history import latest_run
+from metrics import write_atomic
+
+EXPORT_DIR = "export"
+MANIFEST = "manifest.json"
+
+# Bumped when the layout of the snapshots changes
+FORMAT_VERSION = 1
+
+# Hex digits of the content hash in the file names and ETags
+HASH_LENGTH = 16
+GZIP_LEVEL = 9
+
+# Snapshot files: <name>.<hash>.json.gz
+SNAPSHOT_FILE = re.compile(r"^(listings|facets|stats)\.[0-9a-f]+\.json\.gz$")
+
+# Ordered like the default view of index.php (uses idx_listings_active_name)
+LISTINGS_SQL = f"""
+    SELECT id, name, address, email, phone, url, zone, sector,
+        (SELECT GROUP_CONCAT(dwelling_type) FROM (
+            SELECT dwelling_type FROM listing_dwelling_types
+            WHERE listing_id = listings.id ORDER BY dwelling_type
+        )),
+        has_car_parking, has_bike_parking, latitude, longitude
+    FROM listings
+    WHERE is_active = 1 AND {not_duplicate()}
+    ORDER BY name, id
+"""
+
+
+def build_snapshots(conn: sqlite3.Connection) -> Dict[str, object]:
+    """The contents of the listings, facets and stats snapshots, in one pass over the active listings."""
+    listings: List[Dict] = []
+    facets: Dict[str, Dict[str, List[int]]] = {'zone': {}, 'sector': {}, 'dwelling_type': {}, 'parking': {}}
+    
+    def index(dimension: str, key, listing_id: int):
+        if key is not None:
+            facets[dimension].setdefault(str(key), []).append(listing_id)
+    
+    for (listing_id, name, address, email, phone, url, zone, sector, dwelling_types,
+         car, bike, latitude, longitude) in conn.execute(LISTINGS_SQL):
+        dwelling_types = [int(d) for d in dwelling_types.split(',')] if dwelling_types else []
+        listings.append({
+            'id': listing_id,
+            'name': name,
+            'address': address,
+            'email': email,
+            'phone': phone,
+            'url': url,
+            'zone': zone,
+            'sector': sector,
+            'dwelling_types': dwelling_types,
+            'has_car_parking': bool(car),
+            'has_bike_parking': bool(bike),
+            'latitude': latitude,
+            'longitude': longitude,
+        })
+        index('zone', zone, listing_id)
+        index('sector', sector, listing_id)
+        for dwelling_type in dwelling_types:
+            index('dwelling_type', dwelling_type, listing_id)
+        index('parking', 'car' if car else None, listing_id)
+        index('parking', 'bike' if bike else None, listing_id)
+    
+    # Keys in a stable order, so that unchanged data hashes the same
+    facets = {dimension: dict(sorted(keys.items())) for dimension, keys in facets.items()}
+    stats = {
+        'total': len(listings),
+        'car_parking': len(facets['parking'].get('car', [])),
+        'bike_parking': len(facets['parking'].get('bike', [])),
+        **{f"by_{dimension}": {key: len(ids) for key, ids in facets[dimension].items()}
+           for dimension in ('zone', 'sector', 'dwelling_type')},
+    }
+    return {'listings': listings, 'facets': facets, 'stats': stats}
+
+
+def write_snapshot(out_dir: str, name: str, data) -> Dict[str, object]:
+    """
+    Write `data` as <name>.<hash>.json.gz, unless a snapshot with the same
+    content exists. Returns its manifest entry.
+    """
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    digest = hashlib.sha256(body).hexdigest()
+    filename = f"{name}.{digest[:HASH_LENGTH]}.json.gz"
+    path = os.path.join(out_dir, filename)
+    if not os.path.exists(path):
+        # mtime=0: the same content always gives the same file
+        write_atomic(path, gzip.compress(body, GZIP_LEVEL, mtime=0))
+    return {
+        'file': filename,
+        'etag': f'"{digest[:HASH_LENGTH]}"',
+        'sha256': digest,
+        'bytes': len(body),
+        'gzip_bytes': os.path.getsize(path),
+    }
+
+
+def read_manifest(out_dir: str) -> Optional[Dict]:
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def export(conn: sqlite3.Connection, out_dir: str = EXPORT_DIR) -> Dict:
+    """
+    Export the snapshots to `out_dir` and point the manifest at them. The
+    snapshots of the previous manifest are kept, for the clients that
+    fetched it just before; older ones are removed. Returns the manifest.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    previous = read_manifest(out_dir)
+    snapshots = {name: write_snapshot(out_dir, name, data) for name, data in build_snapshots(conn).items()}
+    
+    if previous is not None and previous.get('format') == FORMAT_VERSION and previous['snapshots'] == snapshots:
+        return previous
+    manifest = {
+        'format': FORMAT_VERSION,
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'run': latest_run(conn),
+        'snapshots': snapshots,
+    }
+    write_atomic(os.path.join(out_dir, MANIFEST), json.dumps(manifest, indent=2) + "\n")
+    
+    keep = {entry['file'] for entry in snapshots.values()}
+    if previous is not None:
+        keep |= {entry['file'] for entry in previous.get('snapshots', {}).values()}
+    for filename in os.listdir(out_dir):
+        if SNAPSHOT_FILE.match(filename) and filename not in keep:
+            os.remove(os.path.join(out_dir, filename))
+    return manifest
+
+
+def _size(size: int) -> str:
+    if size < 1024:
+        return f"{size} B"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} KiB"
+    return f"{size / 1024 / 1024:.1f} MiB"
+
+
+def export_report(out_dir: str, manifest: Dict) -> str:
+    """One-line summary of an export."""
+    sizes = ", ".join(
+        f"{name} {_size(entry['bytes'])} ({_size(entry['gzip_bytes'])} gzipped)"
+        for name, entry in manifest['snapshots'].items()
+    )
+    return f"Export: {os.path.join(out_dir, MANIFEST)} as of run {manifest['run']} ({sizes})"
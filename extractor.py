@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Listing detail page extractor.
+Parses a detail page with lxml and walks the document once, picking up
+the first element matching each selector and the page's text nodes on
+the way. The result is the same dictionary the original BeautifulSoup
+implementation produced (see bench/legacy_extract.py). lxml is imported
+on the first parse, so that the readers of the database that only need
+the patterns below do not pay for it.
+"""
+
+import hashlib
+import re
+from typing import Dict, List, NamedTuple, Optional, Pattern
+
+
+class Selector(NamedTuple):
+    """Matches elements by tag name, and optionally a class or attribute regex."""
+    tag: str
+    class_pattern: Optional[Pattern] = None
+    attribute: Optional[str] = None
+    attribute_pattern: Optional[Pattern] = None
+    
+    def matches(self, element) -> bool:
+        if self.class_pattern is not None and not self.class_pattern.search(element.get('class') or ''):
+            return False
+        if self.attribute is not None:
+            value = element.get(self.attribute)
+            if value is None or not self.attribute_pattern.search(value):
+                return False
+        return True
+
+
+TITLE_OR_NAME_CLASS = re.compile(r'title|name', re.I)
+ADDRESS_CLASS = re.compile(r'address|adresse', re.I)
+
+# Only the first element matching each selector is kept. Name and address
+# candidates are tried in list order.
+NAME_SELECTORS = ['h1', 'h2_title', 'div_title', 'title']
+ADDRESS_SELECTORS = ['address', 'div_address', 'p_address']
+SELECTORS = {
+    'h1': Selector('h1'),
+    'h2_title': Selector('h2', TITLE_OR_NAME_CLASS),
+    'div_title': Selector('div', TITLE_OR_NAME_CLASS),
+    'title': Selector('title'),
+    'address': Selector('address'),
+    'div_address': Selector('div', ADDRESS_CLASS),
+    'p_address': Selector('p', ADDRESS_CLASS),
+    'email_link': Selector('a', attribute='href', attribute_pattern=re.compile(r'^mailto:')),
+    'phone_link': Selector('a', attribute='href', attribute_pattern=re.compile(r'^tel:')),
+    'features': Selector('p', re.compile(r'coop--features', re.I)),
+}
+SELECTORS_BY_TAG: Dict[str, List[str]] = {}
+for _key, _selector in SELECTORS.items():
+    SELECTORS_BY_TAG.setdefault(_selector.tag, []).append(_key)
+
+CAR_ICON_CLASS = re.compile(r'icon-car-side', re.I)
+BIKE_ICON_CLASS = re.compile(r'icon-bicycle', re.I)
+
+# Postal code pattern (H1A 1A1)
+POSTAL_CODE_PATTERN = re.compile(r'[A-Z]\d[A-Z]\s?\d[A-Z]\d')
+ADDRESS_TRIM_PATTERN = re.compile(r'^[,\s]+|[,\s]+$')
+EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+# Quebec format: (514) 123-4567, 514-123-4567, 514.123.4567, etc.
+PHONE_PATTERNS = [
+    re.compile(r'\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}'),  # Standard format
+    re.compile(r'\d{3}[-.\s]?\d{3}[-.\s]?\d{4}'),  # Without parentheses
+]
+PHONE_LINK_CLEANUP = re.compile(r'[\s\-\(\)]')
+PHONE_TEXT_CLEANUP = re.compile(r'[\s\-\(\)\.]')
+CHARSET_PATTERN = re.compile(rb'<meta[^>]+charset=["\']?([A-Za-z0-9_-]+)', re.I)
+
+# Like BeautifulSoup's get_text(), page text leaves out the contents of
+# these elements (and comments)
+NON_TEXT_TAGS = frozenset(['script', 'style', 'template'])
+
+# Markup left out of a detail page's content hash (see page_hash): the
+# attributes and contents of non-text elements, and the <meta> and <input>
+# tags, which the extractor never reads but which carry per-request tokens
+# (CSRF metas, hidden inputs, script nonces)
+NON_TEXT_ELEMENT_PATTERN = re.compile(r'<(script|style|template)\b[^>]*>(.*?)</\1\s*>', re.I | re.S)
+TOKEN_TAG_PATTERN = re.compile(r'<(?:meta|input)\b[^>]*>', re.I)
+
+
+def _decode(content: bytes) -> str:
+    """Decode a page using its declared charset, falling back to UTF-8 then Windows-1252."""
+    match = CHARSET_PATTERN.search(content, 0, 2048)
+    for encoding in ([match.group(1).decode('ascii')] if match else []) + ['utf-8']:
+        try:
+            return content.decode(encoding)
+        except (LookupError, UnicodeDecodeError):
+            continue
+    return content.decode('cp1252', errors='replace')
+
+
+def _strings(element) -> List[str]:
+    """Text nodes of an element, in document order, as get_text() sees them."""
+    include_hidden = element.tag in NON_TEXT_TAGS
+    strings = []
+    stack = [element]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            strings.append(node)
+            continue
+        if node.text and isinstance(node.tag, str):
+            strings.append(node.text)
+        for child in reversed(node):
+            if child.tail:
+                stack.append(child.tail)
+            if isinstance(child.tag, str) and (include_hidden or child.tag not in NON_TEXT_TAGS):
+                stack.append(child)
+    return strings
+
+
+def _text(element, separator: str = '') -> str:
+    """Equivalent of BeautifulSoup's get_text(separator, strip=True)."""
+    return separator.join(s.strip() for s in _strings(element) if s.strip())
+
+
+class _PageScan:
+    """Everything the extractor needs from a page, collected in one walk."""
+    
+    def __init__(self, root):
+        self.found: Dict[str, object] = {}
+        self.strings: List[str] = []  # page text nodes
+        self.postal_code_owners = []  # elements owning a text node with a postal code
+        self.car_icons = []  # (icon, inside the features paragraph)
+        self.bike_icons = []
+        self._walk(root)
+    
+    def _add_string(self, text: str, owner, hidden: bool):
+        if not hidden:
+            self.strings.append(text)
+        if owner is not None and POSTAL_CODE_PATTERN.search(text):
+            self.postal_code_owners.append(owner)
+    
+    def _match(self, element, in_features: bool) -> bool:
+        """Record the selectors the element is the first match of. Returns True for the features paragraph."""
+        tag = element.tag
+        is_features = False
+        for key in SELECTORS_BY_TAG.get(tag, ()):
+            if key not in self.found and SELECTORS[key].matches(element):
+                self.found[key] = element
+                is_features = is_features or key == 'features'
+        if tag == 'span':
+            css_class = element.get('class') or ''
+            if CAR_ICON_CLASS.search(css_class):
+                self.car_icons.append((element, in_features))
+            if BIKE_ICON_CLASS.search(css_class):
+                self.bike_icons.append((element, in_features))
+        return is_features
+    
+    def _walk(self, root):
+        # Entries: (node, hidden, in_features, exiting). Text comes before the
+        # children, tails after the element's subtree, in document order.
+        stack = [(root, False, False, False)]
+        while stack:
+            node, hidden, in_features, exiting = stack.pop()
+            parent = node.getparent()
+            
+            if exiting:
+                if node.tail:
+                    self._add_string(node.tail, parent, hidden)
+                continue
+            
+            if not isinstance(node.tag, str):
+                # Comments are not page text but can still hold a postal code
+                if node.text and POSTAL_CODE_PATTERN.search(node.text) and parent is not None:
+                    self.postal_code_owners.append(parent)
+                if node.tail:
+                    self._add_string(node.tail, parent, hidden)
+                continue
+            
+            child_in_features = self._match(node, in_features) or in_features
+            child_hidden = hidden or node.tag in NON_TEXT_TAGS
+            if node.text:
+                self._add_string(node.text, node, child_hidden)
+            stack.append((node, hidden, in_features, True))
+            for child in reversed(node):
+                stack.append((child, child_hidden, child_in_features, False))
+
+
+def parse_listing_page(content: bytes, url: str) -> Dict:
+    """
+    Parse a listing detail page.
+    Returns a dictionary with the listing data.
+    """
+    import lxml.etree
+    import lxml.html
+    
+    try:
+        root = lxml.html.document_fromstring(_decode(content))
+    except ValueError:
+        # lxml refuses str input that carries an XML encoding declaration
+        root = lxml.html.document_fromstring(content)
+    except lxml.etree.ParserError:
+        # Empty document
+        root = lxml.html.document_fromstring('<html></html>')
+    page = _PageScan(root)
+    found = page.found
+    
+    data = {
+        'url': url,
+        'name': '',
+        'address': '',
+        'email': None,
+        'phone': None,
+        'has_car_parking': False,
+        'has_bike_parking': False,
+    }
+    
+    # Page text is only built if a fallback needs it, and then only once
+    page_text = None
+    
+    # Name: first of h1, h2/div with a title-like class, <title>
+    for key in NAME_SELECTORS:
+        if key in found:
+            name_text = _text(found[key])
+            # Clean up title tag (remove " | FHCQ" or similar)
+            if '|' in name_text:
+                name_text = name_text.split('|')[0].strip()
+            data['name'] = name_text
+            break
+    
+    # Address: first candidate element with enough text
+    for key in ADDRESS_SELECTORS:
+        if key in found:
+            address_text = _text(found[key], ' ')
+            if address_text and len(address_text) > 10:  # Basic validation
+                data['address'] = address_text
+                break
+    
+    # If no address found, use the element holding a postal code, then the
+    # text surrounding the first postal code on the page
+    if not data['address']:
+        for owner in page.postal_code_owners:
+            parent_text = _text(owner, ' ')
+            if len(parent_text) > 10:
+                data['address'] = parent_text
+                break
+        
+        if not data['address']:
+            all_text = ' '.join(page.strings)
+            for match in POSTAL_CODE_PATTERN.findall(all_text):
+                idx = all_text.find(match)
+                if idx > 0:
+                    start = max(0, idx - 100)
+                    end = min(len(all_text), idx + 20)
+                    potential_address = ADDRESS_TRIM_PATTERN.sub('', all_text[start:end].strip())
+                    if len(potential_address) > 10:
+                        data['address'] = potential_address
+                        break
+    
+    # Email: mailto link, or the first email-looking text
+    if 'email_link' in found:
+        data['email'] = found['email_link'].get('href').replace('mailto:', '').strip()
+    else:
+        page_text = ''.join(page.strings)
+        email_match = EMAIL_PATTERN.search(page_text)
+        if email_match:
+            data['email'] = email_match.group(0)
+    
+    # Phone: tel link, or the first phone-looking text
+    if 'phone_link' in found:
+        phone = found['phone_link'].get('href').replace('tel:', '').strip()
+        phone = PHONE_LINK_CLEANUP.sub('', phone)
+        if phone.startswith('1'):
+            phone = phone[1:]  # Remove leading 1 for North American numbers
+        data['phone'] = phone
+    else:
+        if page_text is None:
+            page_text = ''.join(page.strings)
+        for pattern in PHONE_PATTERNS:
+            phone_match = pattern.search(page_text)
+            if phone_match:
+                phone = PHONE_TEXT_CLEANUP.sub('', phone_match.group(0).strip())
+                if len(phone) == 10:  # Valid 10-digit number
+                    data['phone'] = phone
+                    break
+    
+    # Parking: icons without a 'disabled' class. Only the first icon of
+    # each kind in the features paragraph counts; without that paragraph,
+    # any enabled icon on the page does.
+    has_features = 'features' in found
+    for icons, key in ((page.car_icons, 'has_car_parking'), (page.bike_icons, 'has_bike_parking')):
+        candidates = [icon for icon, in_features in icons if in_features or not has_features]
+        if has_features:
+            candidates = candidates[:1]
+        data[key] = any('disabled' not in (icon.get('class') or '').split() for icon in candidates)
+    
+    return data
+
+
+def _strip_non_text(match) -> str:
+    # A postal code makes the element an address candidate, so its contents are read
+    tag, contents = match.groups()
+    if not POSTAL_CODE_PATTERN.search(contents):
+        contents = ''
+    return f'<{tag}>{contents}</{tag}>'
+
+
+def page_hash(content: bytes) -> str:
+    """
+    Hash everything the extractor reads from a detail page: the decoded
+    document without the contents of scripts, styles and templates and
+    without <meta> and <input> tags, so per-request tokens don't make a
+    page look changed while a change to any text on it does.
+    """
+    text = NON_TEXT_ELEMENT_PATTERN.sub(_strip_non_text, _decode(content))
+    text = TOKEN_TAG_PATTERN.sub('', text)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def extract_page(content: bytes, url: str) -> Dict:
+    """
+    Parse a detail page and add its content hash. This is the unit of work
+    of the parser processes, so the hashing happens off the fetching side too.
+    """
+    data = parse_listing_page(content, url)
+    data['content_hash'] = page_hash(content)
+    return data
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Persistent crawl frontier.
+Records, next to the listings, what a crawl still has to do: the search
+combinations (and the next results page of each), the listing URLs they
+found with their memberships, and the detail pages left to fetch. Work
+items that fail are retried with exponential backoff and jitter. An
+interrupted crawl can be resumed with `crawler.py --resume`, which only
+does the remaining work.
+
+Items are claimed a few at a time under an expiring lease, so several
+worker processes can share one crawl (`crawler.py --workers N`): a worker
+renews its leases while it works (see workers.py) and releases them when
+an item fails or when it stops, and the items of a worker that died are
+claimed by the others once its leases expire.
+"""
+
+import os
+import random
+import socket
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+SEARCH = 'search'
+LISTING = 'listing'
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 2.0    # seconds before the first retry (on average)
+BACKOFF_CAP = 300.0   # longest wait between two attempts
+LEASE_SECONDS = 60.0  # how long a claimed item stays with its worker without a renewal
+
+
+def backoff_delay(attempts: int) -> float:
+    """
+    Delay before the next attempt of an item that failed `attempts` times:
+    exponential, with "equal jitter" so that items that failed together do
+    not all come back at the same moment.
+    """
+    delay = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def worker_id() -> str:
+    """Lease owner name of this process."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def search_key(sector_id: int, dwelling_type: int) -> str:
+    return f"{sector_id}:{dwelling_type}"
+
+
+def parse_search_key(key: str) -> Tuple[int, int]:
+    sector_id, dwelling_type = key.split(':')
+    return int(sector_id), int(dwelling_type)
+
+
+class Frontier:
+    """
+    The crawl_frontier and crawl_memberships tables of a database.
+    Methods commit their own changes, except complete_listings(), which
+    ListingWriter calls inside the transaction that saves the listings, so
+    that a detail page is only marked done once its listing is stored.
+    Items are claimed for `owner` (this process by default).
+    """
+    
+    def __init__(self, conn: sqlite3.Connection, max_attempts: int = MAX_ATTEMPTS,
+                 lease: float = LEASE_SECONDS, owner: Optional[str] = None):
+        self.conn = conn
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.owner = owner or worker_id()
+        # (sector_name, dwelling_type) -> URLs found so far, loaded on demand
+        self._seen: Dict[Tuple[str, int], Set[str]] = {}
+    
+    def unfinished(self) -> bool:
+        """Whether a previous crawl left work behind."""
+        row = self.conn.execute("SELECT 1 FROM crawl_frontier WHERE status = 'pending' LIMIT 1").fetchone()
+        return row is not None
+    
+    def start(self, searches: Iterable[Tuple[int, int]]):
+        """Forget the previous crawl and queue the first page of every search."""
+        self._seen.clear()
+        try:
+            self.conn.execute("DELETE FROM crawl_frontier")
+            self.conn.execute("DELETE FROM crawl_memberships")
+            self.conn.executemany(
+                "INSERT INTO crawl_frontier (kind, key) VALUES (?, ?)",
+                [(SEARCH, search_key(sector_id, dwelling_type)) for sector_id, dwelling_type in searches]
+            )
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+    
+    def claim(self, kind: str, limit: int) -> List[Tuple[str, int]]:
+        """
+        Lease up to `limit` pending items whose backoff has elapsed and that
+        no worker holds, as (key, page).
+        """
+        now = time.time()
+        # Taking the write lock first stops two workers from selecting the
+        # same items
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute("""
+                SELECT rowid, key, page FROM crawl_frontier
+                WHERE kind = ? AND status = 'pending' AND next_attempt <= ? AND lease_expires <= ?
+                ORDER BY rowid LIMIT ?
+            """, (kind, now, now, limit)).fetchall()
+            self.conn.executemany(
+                "UPDATE crawl_frontier SET lease_owner = ?, lease_expires = ? WHERE rowid = ?",
+                [(self.owner, now + self.lease, rowid) for rowid, _, _ in rows]
+            )
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        if kind == SEARCH and rows:
+            # Another worker may have advanced these searches
+            self._seen.clear()
+        return [(key, page) for _, key, page in rows]
+    
+    def wait_time(self, kind: str) -> Optional[float]:
+        """
+        Seconds until a pending item can be claimed (its backoff has elapsed
+        and its lease, if any, expired), or None if nothing is pending.
+        """
+        row = self.conn.execute("""
+            SELECT MIN(MAX(next_attempt, lease_expires)) FROM crawl_frontier
+            WHERE kind = ? AND status = 'pending'
+        """, (kind,)).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+    
+    def leased_elsewhere(self, kind: str) -> int:
+        """Number of pending items other workers hold."""
+        return self.conn.execute("""
+            SELECT COUNT(*) FROM crawl_frontier
+            WHERE kind = ? AND status = 'pending' AND lease_owner != ? AND lease_expires > ?
+        """, (kind, self.owner, time.time())).fetchone()[0]
+    
+    def renew(self):
+        """Extend the leases of the items this owner holds."""
+        self.conn.execute(
+            "UPDATE crawl_frontier SET lease_expires = ? WHERE lease_owner = ? AND status = 'pending'",
+            (time.time() + self.lease, self.owner)
+        )
+        self.conn.commit()
+    
+    def release(self, everyone: bool = False):
+        """
+        Hand the pending items this owner holds back to the frontier, or
+        those of every worker (when resuming a crawl whose workers are gone).
+        """
+        if everyone:
+            self.conn.execute("""
+                UPDATE crawl_frontier SET lease_owner = NULL, lease_expires = 0
+                WHERE status = 'pending' AND lease_owner IS NOT NULL
+            """)
+        else:
+            self.conn.execute("""
+                UPDATE crawl_frontier SET lease_owner = NULL, lease_expires = 0
+                WHERE status = 'pending' AND lease_owner = ?
+            """, (self.owner,))
+        self.conn.commit()
+    
+    def seen(self, sector_name: str, dwelling_type: int) -> Set[str]:
+        """URLs already found by a search, including by an interrupted run."""
+        combination = (sector_name, dwelling_type)
+        if combination not in self._seen:
+            self._seen[combination] = {url for url, in self.conn.execute(
+                "SELECT url FROM crawl_memberships WHERE sector = ? AND dwelling_type = ?", combination
+            )}
+        return self._seen[combination]
+    
+    def record_search_page(self, sector_id: int, sector_name: str, dwelling_type: int, page: int,
+                           new_urls: List[str], finished: bool):
+        """
+        Store the new URLs of a results page, and move the search to its
+        next page (renewing its lease) or mark it done.
+        """
+        try:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO crawl_memberships (url, sector, dwelling_type) VALUES (?, ?, ?)",
+                [(url, sector_name, dwelling_type) for url in new_urls]
+            )
+            self.conn.execute("""
+                UPDATE crawl_frontier
+                SET page = ?, status = ?, attempts = 0, next_attempt = 0, last_error = NULL, lease_expires = ?
+                WHERE kind = ? AND key = ?
+            """, (page + 1, 'done' if finished else 'pending', 0 if finished else time.time() + self.lease,
+                  SEARCH, search_key(sector_id, dwelling_type)))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        self.seen(sector_name, dwelling_type).update(new_urls)
+    
+    def queue_listings(self) -> int:
+        """Queue a detail page fetch for every URL found by the searches. Returns the number queued."""
+        cursor = self.conn.execute("""
+            INSERT OR IGNORE INTO crawl_frontier (kind, key)
+            SELECT DISTINCT ?, url FROM crawl_memberships
+        """, (LISTING,))
+        self.conn.commit()
+        return cursor.rowcount
+    
+    def memberships(self) -> Dict[str, Set[Tuple[str, int]]]:
+        """Map of listing URL -> {(sector_name, dwelling_type)} found by the searches."""
+        memberships: Dict[str, Set[Tuple[str, int]]] = {}
+        for url, sector, dwelling_type in self.conn.execute("SELECT url, sector, dwelling_type FROM crawl_memberships"):
+            memberships.setdefault(url, set()).add((sector, dwelling_type))
+        return memberships
+    
+    def failed_searches(self) -> List[Tuple[int, int]]:
+        """(sector_id, dwelling_type) of the searches that ran out of attempts."""
+        rows = self.conn.execute(
+            "SELECT key FROM crawl_frontier WHERE kind = ? AND status = 'failed' ORDER BY rowid", (SEARCH,)
+        )
+        return [parse_search_key(key) for key, in rows]
+    
+    def retry(self, kind: str, key: str, error: str) -> Optional[float]:
+        """
+        Record a failed attempt and release the item. Returns the delay
+        before the next one, or None if the item has run out of attempts and
+        is now failed.
+        """
+        attempts = self.conn.execute(
+            "SELECT attempts FROM crawl_frontier WHERE kind = ? AND key = ?", (kind, key)
+        ).fetchone()[0] + 1
+        delay = backoff_delay(attempts) if attempts < self.max_attempts else None
+        self.conn.execute("""
+            UPDATE crawl_frontier
+            SET attempts = ?, status = ?, next_attempt = ?, last_error = ?, lease_owner = NULL, lease_expires = 0
+            WHERE kind = ? AND key = ?
+        """, (attempts, 'pending' if delay is not None else 'failed', time.time() + (delay or 0), error, kind, key))
+        self.conn.commit()
+        return delay
+    
+    def fail(self, kind: str, key: str, error: str):
+        """Give up on an item, e.g. a page that cannot be parsed or a 404."""
+        self.conn.execute(
+            "UPDATE crawl_frontier SET status = 'failed', last_error = ? WHERE kind = ? AND key = ?",
+            (error, kind, key)
+        )
+        self.conn.commit()
+    
+    def complete_listings(self, cursor: sqlite3.Cursor, urls: List[str]):
+        """Mark detail pages done, in the caller's transaction."""
+        cursor.executemany(
+            "UPDATE crawl_frontier SET status = 'done' WHERE kind = ? AND key = ?",
+            [(LISTING, url) for url in urls]
+        )
+    
+    def counts(self) -> Dict[Tuple[str, str], int]:
+        """Number of items per (kind, status)."""
+        rows = self.conn.execute("SELECT kind, status, COUNT(*) FROM crawl_frontier GROUP BY kind, status")
+        return {(kind, status): count for kind, status, count in rows}
+    
+    def report(self) -> str:
+        """One-line summary of the frontier for the end-of-run output."""
+        counts = self.counts()
+        parts = []
+        for kind, label in ((SEARCH, "searches"), (LISTING, "detail pages")):
+            parts.append(f"{label}: {counts.get((kind, 'done'), 0)} done, "
+                         f"{counts.get((kind, 'failed'), 0)} failed, {counts.get((kind, 'pending'), 0)} pending")
+        return "Frontier: " + "; ".join(parts)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Geocoding of the listing addresses.
+Looks up the coordinates of every active listing that has none through a
+backend (a Nominatim-compatible search service, or an offline gazetteer
+file) and stores them in listings.latitude/longitude, from where triggers
+copy them into the listings_rtree spatial index used by
+`query_db.py near`. Every answer, including the addresses the backend
+could not place, is cached in geocode_cache by normalized address, so each
+distinct address is looked up once across crawls.
+
+Usage:
+    python geocode.py nominatim                  # OpenStreetMap's public service
+    python geocode.py http://localhost:8080/search
+    python geocode.py addresses.csv              # columns: address, latitude, longitude
+"""
+
+import argparse
+import csv
+import math
+import re
+import sqlite3
+import time
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from schema import init_schema
+
+DB_NAME = "cooperatives.db"
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+# The public service allows one request per second, from an application
+# that identifies itself
+NOMINATIM_DELAY = 1.0
+USER_AGENT = "fhcq-coop-crawler/1.0 (geocoding of cooperative addresses)"
+REQUEST_TIMEOUT = 30  # seconds
+
+# Listings updated per transaction
+BATCH_SIZE = 100
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+Coordinates = Tuple[float, float]
+
+
+def normalize_address(address: str) -> str:
+    """Cache key of an address: case, accents, punctuation and spacing folded."""
+    text = unicodedata.normalize('NFKD', address)
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return " ".join(re.findall(r"\w+", text))
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points, in kilometres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def distance_sql(latitude: str, longitude: str) -> str:
+    """
+    SQL expression of the haversine distance in kilometres between the
+    point in the columns `latitude` and `longitude` and the point (?1, ?2),
+    where ?3 is cos(radians(?1)).
+    """
+    # sin²(x/2) written as (1 - cos x) / 2
+    return (f"2 * {EARTH_RADIUS_KM} * asin(min(1.0, sqrt("
+            f"(1 - cos(radians({latitude} - ?1))) / 2"
+            f" + ?3 * cos(radians({latitude})) * (1 - cos(radians({longitude} - ?2))) / 2)))")
+
+
+def register_math_functions(conn: sqlite3.Connection):
+    """
+    Make the functions used by distance_sql() available on `conn`: SQLite
+    builds without the math functions get (slower) Python ones.
+    """
+    try:
+        conn.execute("SELECT asin(sqrt(cos(radians(0))))")
+    except sqlite3.OperationalError:
+        for name, func in (('asin', math.asin), ('sqrt', math.sqrt), ('cos', math.cos), ('radians', math.radians)):
+            conn.create_function(name, 1, func, deterministic=True)
+
+
+def bounding_box(lat: float, lon: float, km: float) -> Tuple[float, float, float, float]:
+    """
+    (min_lat, max_lat, min_lon, max_lon) of a box holding every point
+    within `km` of (lat, lon). Near a pole or the antimeridian the box
+    spans every longitude.
+    """
+    dlat = km / KM_PER_DEGREE
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    angle = km / EARTH_RADIUS_KM
+    if angle >= math.pi / 2 or math.sin(angle) >= math.cos(math.radians(lat)):
+        return min_lat, max_lat, -180.0, 180.0
+    # Widest longitude offset of the circle, reached north or south of lat
+    dlon = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(lat))))
+    if lon - dlon < -180 or lon + dlon > 180:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, lon - dlon, lon + dlon
+
+
+class GazetteerBackend:
+    """Offline backend: a CSV file with address, latitude and longitude columns."""
+    
+    name = 'gazetteer'
+    
+    def __init__(self, path: str):
+        self.places: Dict[str, Coordinates] = {}
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                self.places[normalize_address(row['address'])] = (float(row['latitude']), float(row['longitude']))
+    
+    def geocode(self, address: str) -> Optional[Coordinates]:
+        return self.places.get(normalize_address(address))
+
+
+class NominatimBackend:
+    """
+    The search API of Nominatim (OpenStreetMap's geocoder, a self-hosted
+    instance or the bench stub), at most one request per `delay` seconds.
+    """
+    
+    name = 'nominatim'
+    
+    def __init__(self, url: str = NOMINATIM_URL, delay: float = NOMINATIM_DELAY):
+        self.url = url
+        self.delay = delay
+        # Imported here: the distance queries of query_db.py do not need it
+        import requests
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        self._last_request = 0.0
+    
+    def geocode(self, address: str) -> Optional[Coordinates]:
+        wait = self._last_request + self.delay - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_request = time.monotonic()
+        response = self.session.get(self.url, params={'q': address, 'format': 'jsonv2', 'limit': 1},
+                                    timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        results = response.json()
+        if not results:
+            return None
+        return float(results[0]['lat']), float(results[0]['lon'])
+
+
+def make_backend(spec: str):
+    """The backend named by `spec`: "nominatim", the URL of a Nominatim-compatible service, or a gazetteer file."""
+    if spec == 'nominatim':
+        return NominatimBackend()
+    if spec.startswith(('http://', 'https://')):
+        return NominatimBackend(spec)
+    return GazetteerBackend(spec)
+
+
+def geocode_listings(conn: sqlite3.Connection, backend, retry_misses: bool = False) -> Dict[str, int]:
+    """
+    Give coordinates to the active listings that have none, from the cache
+    or from `backend`. Addresses cached as not found are skipped unless
+    `retry_misses`. A lookup that fails (e.g. a network error) is not
+    cached, so the next run tries again. Returns the counts of the run.
+    """
+    by_key: Dict[str, List[Tuple[int, str]]] = {}
+    for listing_id, address in conn.execute(
+        "SELECT id, address FROM listings WHERE is_active = 1 AND latitude IS NULL"
+    ):
+        by_key.setdefault(normalize_address(address), []).append((listing_id, address))
+    
+    counts = {'addresses': len(by_key), 'cached': 0, 'looked_up': 0, 'not_found': 0, 'errors': 0, 'located': 0}
+    pending = 0
+    try:
+        for key, listings in by_key.items():
+            cached = conn.execute(
+                "SELECT latitude, longitude FROM geocode_cache WHERE address_key = ?", (key,)
+            ).fetchone()
+            if cached is not None and (cached[0] is not None or not retry_misses):
+                counts['cached'] += 1
+                coordinates = cached if cached[0] is not None else None
+            else:
+                try:
+                    coordinates = backend.geocode(listings[0][1])
+                # requests' errors are OSErrors, which also covers the other backends' I/O
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"  ✗ Could not geocode {listings[0][1]}: {e}")
+                    counts['errors'] += 1
+                    continue
+                counts['looked_up'] += 1
+                conn.execute("""
+                    INSERT INTO geocode_cache (address_key, latitude, longitude, provider, geocoded_at)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT (address_key) DO UPDATE SET
+                        latitude = excluded.latitude, longitude = excluded.longitude,
+                        provider = excluded.provider, geocoded_at = excluded.geocoded_at
+                """, (key, *(coordinates or (None, None)), backend.name))
+            
+            if coordinates is None:
+                counts['not_found'] += 1
+                continue
+            conn.executemany("UPDATE listings SET latitude = ?, longitude = ? WHERE id = ?",
+                             [(*coordinates, listing_id) for listing_id, _ in listings])
+            counts['located'] += len(listings)
+            pending += len(listings)
+            if pending >= BATCH_SIZE:
+                conn.commit()
+                pending = 0
+        conn.commit()
+    except KeyboardInterrupt:
+        # Keep the lookups already paid for
+        conn.commit()
+        raise
+    return counts
+
+
+def geocode_report(counts: Dict[str, int]) -> str:
+    """One-line summary of a geocode_listings() run."""
+    return (f"Geocoding: {counts['located']} listings located, {counts['addresses']} addresses "
+            f"({counts['cached']} cached, {counts['looked_up']} looked up, {counts['not_found']} not found, "
+            f"{counts['errors']} errors)")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Geocode the addresses of the listings.")
+    parser.add_argument('backend',
+                        help="'nominatim', the URL of a Nominatim-compatible search service, or a CSV gazetteer "
+                             "with address, latitude and longitude columns")
+    parser.add_argument('--db', default=DB_NAME, help=f"SQLite database path (default: {DB_NAME})")
+    parser.add_argument('--retry-misses', action='store_true',
+                        help="Look up again the addresses the backend could not place before")
+    args = parser.parse_args(argv)
+    
+    conn = sqlite3.connect(args.db)
+    init_schema(conn)
+    try:
+        print(geocode_report(geocode_listings(conn, make_backend(args.backend), args.retry_misses)))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+History of the listings across crawls.
+Each crawl (or re-parse) is a run, numbered in crawl_runs. listings holds
+the latest version of every listing; triggers on listings and
+listing_dwelling_types record in listing_history, under the latest run
+id, the value each field had before the run changed it (reverse deltas,
+as RCS keeps them). The history thus holds one row per change, rather
+than one copy of the listings per run, and needs no initial copy either.
+
+A field as of run N is the value recorded by the first change after N,
+or its current value if it has not changed since. A listing created in a
+run has a NULL is_active before it.
+"""
+
+import sqlite3
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# Fields recorded in listing_history, in display order (see migration 10
+# in schema.py). dwelling_types is the sorted, comma-separated list of the
+# listing_dwelling_types of the listing.
+FIELDS = ('name', 'address', 'email', 'phone', 'zone', 'sector', 'dwelling_types',
+          'has_car_parking', 'has_bike_parking', 'is_active')
+
+# The fields that are columns of listings
+COLUMNS = tuple(field for field in FIELDS if field != 'dwelling_types')
+
+CRAWL = 'crawl'
+INCREMENTAL = 'incremental'
+REPARSE = 'reparse'
+
+DWELLING_TYPES_SQL = """
+    (SELECT GROUP_CONCAT(dwelling_type) FROM (
+        SELECT dwelling_type FROM listing_dwelling_types WHERE listing_id = listings.id ORDER BY dwelling_type
+    ))
+"""
+
+# Current value of the field named by `changed.field`, from the listings row
+CURRENT_VALUE_SQL = "CASE changed.field {} ELSE {} END".format(
+    " ".join(f"WHEN '{column}' THEN listings.{column}" for column in COLUMNS), DWELLING_TYPES_SQL
+)
+
+# Value of `field` of the listing `changed.listing_id` as of `run`: the
+# value before the first change after the run, if any (two lookups in the
+# primary key), else `current`
+VALUE_AS_OF_SQL = """
+    CASE WHEN EXISTS (
+        SELECT 1 FROM listing_history h
+        WHERE h.listing_id = changed.listing_id AND h.field = {field} AND h.run_id > {run}
+    ) THEN (
+        SELECT old_value FROM listing_history h
+        WHERE h.listing_id = changed.listing_id AND h.field = {field} AND h.run_id > {run}
+        ORDER BY h.run_id LIMIT 1
+    ) ELSE {current} END
+"""
+
+
+class Change(NamedTuple):
+    """A field that differs between two runs; a listing added in between has an `old` is_active of None."""
+    listing_id: int
+    name: Optional[str]
+    field: str
+    old: object
+    new: object
+
+
+def latest_run(conn: sqlite3.Connection) -> int:
+    """Id of the latest run, 0 if there was none."""
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM crawl_runs").fetchone()[0]
+
+
+def start_run(conn: sqlite3.Connection, kind: str = CRAWL, resume: bool = False) -> int:
+    """
+    Start a run: the changes made from now on are recorded under its id.
+    With `resume`, an interrupted run carries on under its own id.
+    """
+    if resume:
+        row = conn.execute("SELECT id, finished_at FROM crawl_runs ORDER BY id DESC LIMIT 1").fetchone()
+        if row is not None and row[1] is None:
+            return row[0]
+    run_id = conn.execute("INSERT INTO crawl_runs (kind) VALUES (?)", (kind,)).lastrowid
+    conn.commit()
+    return run_id
+
+
+def finish_run(conn: sqlite3.Connection, run_id: int):
+    """Mark a run complete. Later changes are still recorded under it until the next run starts."""
+    conn.execute("UPDATE crawl_runs SET finished_at = CURRENT_TIMESTAMP WHERE id = ?", (run_id,))
+    conn.commit()
+
+
+def list_runs(conn: sqlite3.Connection) -> List[Tuple[int, str, str, Optional[str], int]]:
+    """(id, kind, started_at, finished_at, changes recorded) of every run, oldest first."""
+    return conn.execute("""
+        SELECT id, kind, started_at, finished_at,
+            (SELECT COUNT(*) FROM listing_history WHERE run_id = crawl_runs.id)
+        FROM crawl_runs ORDER BY id
+    """).fetchall()
+
+
+def current_listing(conn: sqlite3.Connection, listing_id: int) -> Optional[Dict[str, object]]:
+    """The recorded fields of a listing as it is now, or None."""
+    row = conn.execute(
+        f"SELECT {', '.join(COLUMNS)}, {DWELLING_TYPES_SQL} FROM listings WHERE id = ?", (listing_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return dict(zip(COLUMNS + ('dwelling_types',), row))
+
+
+def listing_as_of(conn: sqlite3.Connection, listing_id: int, run_id: int) -> Optional[Dict[str, object]]:
+    """The fields of a listing as they stood at the end of run `run_id`, or None if it did not exist yet."""
+    current = current_listing(conn, listing_id)
+    if current is None:
+        return None
+    # The bare old_value comes from the row holding MIN(run_id)
+    for field, old_value, _ in conn.execute("""
+        SELECT field, old_value, MIN(run_id) FROM listing_history
+        WHERE listing_id = ? AND run_id > ?
+        GROUP BY field
+    """, (listing_id, run_id)):
+        current[field] = old_value
+    if current['is_active'] is None:
+        return None
+    return {field: current[field] for field in FIELDS}
+
+
+def listing_changes(conn: sqlite3.Connection, listing_id: int) -> List[Tuple[int, str, object, object]]:
+    """(run id, field, old value, new value) of every recorded change of a listing, oldest first."""
+    current = current_listing(conn, listing_id)
+    if current is None:
+        return []
+    changes = []
+    # Walk each field back from its current value
+    rows = conn.execute("""
+        SELECT run_id, field, old_value FROM listing_history
+        WHERE listing_id = ?
+        ORDER BY field, run_id DESC
+    """, (listing_id,))
+    new = dict(current)
+    for run_id, field, old_value in rows:
+        changes.append((run_id, field, old_value, new[field]))
+        new[field] = old_value
+    return sorted(changes, key=lambda change: (change[0], FIELDS.index(change[1])))
+
+
+def diff_runs(conn: sqlite3.Connection, run_a: int, run_b: int) -> Iterator[Change]:
+    """
+    Every field whose value differs between the end of run `run_a` and the
+    end of run `run_b`, ordered by listing. Only the fields changed by the
+    runs in between are looked at; a listing that stopped being listed
+    changes is_active to 0.
+    """
+    def as_of(field: str, run: str, current: str) -> str:
+        return VALUE_AS_OF_SQL.format(field=field, run=run, current=current)
+    
+    rows = conn.execute(f"""
+        SELECT listing_id, name, field, old, new FROM (
+            SELECT changed.listing_id, changed.field,
+                {as_of("'name'", '?4', 'listings.name')} AS name,
+                {as_of('changed.field', '?3', CURRENT_VALUE_SQL)} AS old,
+                {as_of('changed.field', '?4', CURRENT_VALUE_SQL)} AS new
+            FROM (
+                SELECT DISTINCT listing_id, field FROM listing_history WHERE run_id > ?1 AND run_id <= ?2
+            ) AS changed
+            JOIN listings ON listings.id = changed.listing_id
+        )
+        WHERE old IS NOT new
+        ORDER BY listing_id
+    """, (min(run_a, run_b), max(run_a, run_b), run_a, run_b))
+    
+    listing_id, changes = None, []
+    for row in rows:
+        if row[0] != listing_id and changes:
+            yield from sorted(changes, key=lambda change: FIELDS.index(change.field))
+            changes = []
+        listing_id = row[0]
+        changes.append(Change(*row))
+    yield from sorted(changes, key=lambda change: FIELDS.index(change.field))
+
+
+def history_report(conn: sqlite3.Connection, run_id: int) -> str:
+    """One-line summary of the changes recorded under a run."""
+    changes, listings = conn.execute(
+        "SELECT COUNT(*), COUNT(DISTINCT listing_id) FROM listing_history WHERE run_id = ?", (run_id,)
+    ).fetchone()
+    return (f"History: run {run_id} changed {changes} fields of {listings} listings "
+            f"(query_db.py diff {run_id - 1} {run_id})")
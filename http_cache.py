@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+On-disk HTTP response cache for the crawler's requests.Session.
+Stores response bodies with their validators (ETag / Last-Modified) in a
+SQLite file, revalidates them with conditional GETs, and evicts the least
+recently used entries once the cache grows past its size limit.
+"""
+
+import io
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from transport import TransportAdapter
+
+CACHE_NAME = "http_cache.db"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class HTTPCache:
+    """
+    SQLite-backed store of GET responses keyed by URL.
+    `ttl` (seconds) lets entries without validators be served without
+    contacting the server while they are younger than the TTL.
+    """
+    
+    def __init__(self, path: str = CACHE_NAME, max_bytes: int = DEFAULT_MAX_BYTES, ttl: Optional[float] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = {
+            'hits': 0,            # served from cache without a request
+            'revalidated': 0,     # 304 Not Modified, body served from cache
+            'misses': 0,          # full download
+            'bytes_downloaded': 0,
+            'bytes_from_cache': 0,
+            'evictions': 0,
+        }
+        self._lock = threading.Lock()
+        # Requests are sent from several threads with the async engine, and
+        # the workers of a multi-process crawl share the file
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    
+    def get(self, url: str) -> Optional[Dict]:
+        """Return the cached entry for a URL, or None."""
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT status, headers, body, etag, last_modified, stored_at
+                FROM responses WHERE url = ?
+            """, (url,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'status': row[0],
+            'headers': json.loads(row[1]),
+            'body': row[2],
+            'etag': row[3],
+            'last_modified': row[4],
+            'stored_at': row[5],
+        }
+    
+    def count(self, stat: str, n: int = 1):
+        """Increment one of the activity counters (thread-safe)."""
+        with self._lock:
+            self.stats[stat] += n
+    
+    def is_fresh(self, entry: Dict) -> bool:
+        """Whether an entry without validators can be served without a request."""
+        if self.ttl is None or entry['etag'] or entry['last_modified']:
+            return False
+        return time.time() - entry['stored_at'] < self.ttl
+    
+    def put(self, url: str, status: int, headers: Dict[str, str], body: bytes):
+        """Store (or replace) the response for a URL, evicting old entries if needed."""
+        headers_json = json.dumps(dict(headers))
+        size = len(body) + len(headers_json)
+        if size > self.max_bytes:
+            return
+        
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            self._conn.execute("""
+                INSERT OR REPLACE INTO responses
+                (url, status, headers, body, etag, last_modified, size, stored_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (url, status, headers_json, body, headers.get('ETag'), headers.get('Last-Modified'), size, now, now))
+            self._size += size - (old[0] if old else 0)
+            self._evict()
+            self._conn.commit()
+    
+    def touch(self, url: str, headers: Optional[Dict[str, str]] = None):
+        """
+        Mark an entry as recently used. After a 304, `headers` carries the
+        refreshed validators, which replace the stored ones.
+        """
+        now = time.time()
+        with self._lock:
+            if headers is None:
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE url = ?", (now, url))
+            else:
+                self._conn.execute("""
+                    UPDATE responses
+                    SET last_access = ?, stored_at = ?,
+                        etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified)
+                    WHERE url = ?
+                """, (now, now, headers.get('ETag'), headers.get('Last-Modified'), url))
+            self._conn.commit()
+    
+    def _evict(self):
+        """Delete least recently used entries until the cache fits. Caller holds the lock."""
+        while self._size > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT url, size FROM responses ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for url, size in rows:
+                if self._size <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self._size -= size
+                self.stats['evictions'] += 1  # lock already held
+    
+    def report(self) -> str:
+        """One-line summary of cache activity for the end-of-run output."""
+        s = self.stats
+        requests_total = s['hits'] + s['revalidated'] + s['misses']
+        hit_rate = (s['hits'] + s['revalidated']) / requests_total * 100 if requests_total else 0
+        return (f"HTTP cache: {s['hits']} hits, {s['revalidated']} revalidated (304), {s['misses']} misses "
+                f"({hit_rate:.0f}% served from cache), {s['bytes_downloaded'] / 1024:.1f} KiB downloaded, "
+                f"{s['bytes_from_cache'] / 1024:.1f} KiB from cache, {s['evictions']} evictions, "
+                f"{self._size / 1024:.1f} KiB stored")
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachingAdapter(TransportAdapter):
+    """
+    Transport adapter that answers GET requests from an HTTPCache.
+    Cached entries are revalidated with If-None-Match / If-Modified-Since;
+    responses served from the cache have `from_cache = True`, so callers
+    can skip work for pages that have not changed.
+    """
+    
+    def __init__(self, cache: HTTPCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+    
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if request.method != 'GET':
+            return super().send(request, **kwargs)
+        
+        entry = self.cache.get(request.url)
+        if entry is not None:
+            if self.cache.is_fresh(entry):
+                self.cache.count('hits')
+                self.cache.touch(request.url)
+                return self._cached_response(request, entry)
+            if entry['etag']:
+                request.headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                request.headers['If-Modified-Since'] = entry['last_modified']
+        
+        response = super().send(request, **kwargs)
+        
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            self.cache.count('revalidated')
+            self.cache.touch(request.url, response.headers)
+            return self._cached_response(request, entry)
+        
+        body = response.content
+        response.from_cache = False
+        self.cache.count('misses')
+        self.cache.count('bytes_downloaded', len(body))
+        
+        cacheable = (
+            response.status_code == 200 and
+            'no-store' not in response.headers.get('Cache-Control', '') and
+            (response.headers.get('ETag') or response.headers.get('Last-Modified') or self.cache.ttl is not None)
+        )
+        if cacheable:
+            self.cache.put(request.url, response.status_code, response.headers, body)
+        
+        return response
+    
+    def _cached_response(self, request: requests.PreparedRequest, entry: Dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(entry['body'])
+        response._content = entry['body']
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.from_cache = True
+        self.cache.count('bytes_from_cache', len(entry['body']))
+        return response
@@ -23,9 +23,17 @@ $zone_filter = isset($_GET['zone']) ? (int)$_GET['zone'] : null;
 $sector_filter = isset($_GET['sector']) ? $_GET['sector'] : null;
 $dwelling_filter = isset($_GET['dwelling']) ? (int)$_GET['dwelling'] : null;
 $parking_filter = isset($_GET['parking']) ? $_GET['parking'] : null;
-
-// Build query
-$query = "SELECT * FROM listings WHERE 1=1";
+$search_filter = isset($_GET['q']) ? trim($_GET['q']) : '';
+
+// Build query (dwelling_types lists every type a listing was found under;
+// the duplicates of another listing found by dedup.py are left out)
+$query = "SELECT listings.*,
+    (SELECT GROUP_CONCAT(dwelling_type) FROM (
+        SELECT dwelling_type FROM listing_dwelling_types
+        WHERE listing_id = listings.id ORDER BY dwelling_type
+    )) AS dwelling_types
+    FROM listings WHERE is_active = 1
+    AND NOT EXISTS (SELECT 1 FROM listing_duplicates WHERE listing_id = listings.id)";
 $params = [];
 
 if ($zone_filter !== null && $zone_filter > 0) {
@@ -39,10 +47,17 @@ if ($sector_filter) {
 }
 
 if ($dwelling_filter) {
-    $query .= " AND dwelling_type = ?";
+    $query .= " AND EXISTS (SELECT 1 FROM listing_dwelling_types WHERE listing_id = listings.id AND dwelling_type = ?)";
     $params[] = $dwelling_filter;
 }
 
+// Full-text search: every word must match, as a prefix, ignoring case and
+// accents (same query as `query_db.py search`)
+if ($search_filter !== '' && preg_match_all('/\w+/u', $search_filter, $words)) {
+    $query .= " AND id IN (SELECT rowid FROM listings_fts WHERE listings_fts MATCH ?)";
+    $params[] = implode(' ', array_map(function ($word) { return '"' . $word . '"*'; }, $words[0]));
+}
+
 if ($parking_filter === 'car') {
     $query .= " AND has_car_parking = 1";
 } elseif ($parking_filter === 'bike') {
@@ -63,21 +78,28 @@ $stmt = $db->prepare($query);
 $stmt->execute($params);
 $listings = $stmt->fetchAll(PDO::FETCH_ASSOC);
 
-// Get statistics
-$stats_query = "SELECT 
-    COUNT(*) as total,
-    COUNT(DISTINCT zone) as zones,
-    COUNT(DISTINCT sector) as sectors,
-    SUM(has_car_parking) as with_car_parking,
-    SUM(has_bike_parking) as with_bike_parking
-    FROM listings";
-$stats = $db->query($stats_query)->fetch(PDO::FETCH_ASSOC);
+// Get statistics, as precomputed by the last crawl (see stats.py)
+$stats = ['total' => 0, 'zones' => 0, 'sectors' => 0, 'with_car_parking' => 0, 'with_bike_parking' => 0];
+$stats_rows = $db->query("SELECT dimension, key, value FROM listing_stats")->fetchAll(PDO::FETCH_ASSOC);
+foreach ($stats_rows as $row) {
+    if ($row['dimension'] === 'total') {
+        $stats['total'] = $row['value'];
+    } elseif ($row['dimension'] === 'car_parking') {
+        $stats['with_car_parking'] = $row['value'];
+    } elseif ($row['dimension'] === 'bike_parking') {
+        $stats['with_bike_parking'] = $row['value'];
+    } elseif ($row['dimension'] === 'zone' && $row['key'] !== null) {
+        $stats['zones']++;
+    } elseif ($row['dimension'] === 'sector' && $row['key'] !== null) {
+        $stats['sectors']++;
+    }
+}
 
 // Get unique sectors and zones for filters
-$sectors_query = "SELECT DISTINCT sector FROM listings WHERE sector IS NOT NULL ORDER BY sector";
+$sectors_query = "SELECT DISTINCT sector FROM listings WHERE is_active = 1 AND sector IS NOT NULL ORDER BY sector";
 $sectors = $db->query($sectors_query)->fetchAll(PDO::FETCH_COLUMN);
 
-$zones_query = "SELECT DISTINCT zone FROM listings WHERE zone IS NOT NULL ORDER BY zone";
+$zones_query = "SELECT DISTINCT zone FROM listings WHERE is_active = 1 AND zone IS NOT NULL ORDER BY zone";
 $zones = $db->query($zones_query)->fetchAll(PDO::FETCH_COLUMN);
 
 // Handle note creation
@@ -100,9 +122,14 @@ if ($_SERVER['REQUEST_METHOD'] === 'POST' && isset($_POST['action']) && $_POST['
     }
 }
 
-// Fetch notes for all listings
-$notes_query = "SELECT * FROM notes ORDER BY created_at DESC";
-$all_notes = $db->query($notes_query)->fetchAll(PDO::FETCH_ASSOC);
+// Fetch notes for the listings shown (uses the notes(listing_id) index)
+$all_notes = [];
+foreach (array_chunk(array_column($listings, 'id'), 500) as $ids) {
+    $placeholders = implode(',', array_fill(0, count($ids), '?'));
+    $stmt = $db->prepare("SELECT * FROM notes WHERE listing_id IN ($placeholders) ORDER BY listing_id, created_at DESC");
+    $stmt->execute($ids);
+    $all_notes = array_merge($all_notes, $stmt->fetchAll(PDO::FETCH_ASSOC));
+}
 
 // Group notes by listing_id
 $notes_by_listing = [];
@@ -541,6 +568,12 @@ foreach ($all_notes as $note) {
 
         <div class="filters">
             <form method="GET" action="">
+                <div class="filter-group">
+                    <label for="q">Recherche</label>
+                    <input type="search" name="q" id="q" placeholder="Nom, adresse ou note"
+                           value="<?php echo htmlspecialchars($search_filter); ?>">
+                </div>
+
                 <div class="filter-group">
                     <label for="zone">Zone</label>
                     <select name="zone" id="zone">
@@ -648,7 +681,7 @@ foreach ($all_notes as $note) {
                                 <td>
                                     <span class="badge badge-sector"><?php echo htmlspecialchars($listing['sector']); ?></span>
                                 </td>
-                                <td><?php echo $listing['dwelling_type']; ?>½</td>
+                                <td><?php echo implode(', ', array_map(function ($type) { return $type . '½'; }, array_filter(explode(',', (string)$listing['dwelling_types']), 'strlen'))); ?></td>
                                 <td>
                                     <span class="badge <?php echo $listing['has_car_parking'] ? 'badge-yes' : 'badge-no'; ?>">
                                         Auto: <?php echo $listing['has_car_parking'] ? 'Oui' : 'Non'; ?>
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Crawl metrics.
+Counters and histograms with labels (stage, sector, dwelling type, ...),
+collected from any thread during a crawl and written at the end as a JSON
+run report and, optionally, in the Prometheus textfile format read by the
+node_exporter textfile collector.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+PROMETHEUS_PREFIX = "fhcq_crawler_"
+
+# Upper bounds (seconds) of the histogram buckets; wide enough for both a
+# parse (milliseconds) and a slow fetch (tens of seconds)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items() if value is not None))
+
+
+class Histogram:
+    """Count, sum, extremes and cumulative bucket counts of observed values."""
+    
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.buckets = [0] * len(BUCKETS)
+    
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (the maximum beyond the last bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, cumulative in zip(BUCKETS, self.buckets):
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+    
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'buckets': {str(bound): cumulative for bound, cumulative in zip(BUCKETS, self.buckets)},
+        }
+
+
+class Metrics:
+    """Thread-safe registry of labelled counters and histograms."""
+    
+    def __init__(self):
+        self.started = time.time()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        """Add `value` to a counter."""
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+    
+    def observe(self, name: str, value: float, **labels):
+        """Record a value (usually seconds) in a histogram."""
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+    
+    def total(self, name: str, **labels) -> float:
+        """Sum of a counter over every label set matching `labels`."""
+        wanted = set(_labels(labels))
+        with self._lock:
+            return sum(value for (counter, key), value in self._counters.items()
+                       if counter == name and wanted <= set(key))
+    
+    def merged(self, name: str, **labels) -> Histogram:
+        """One histogram merging every label set of `name` matching `labels`."""
+        wanted = set(_labels(labels))
+        merged = Histogram()
+        with self._lock:
+            for (histogram_name, key), histogram in self._histograms.items():
+                if histogram_name != name or not wanted <= set(key) or not histogram.count:
+                    continue
+                merged.count += histogram.count
+                merged.sum += histogram.sum
+                merged.min = histogram.min if merged.min is None else min(merged.min, histogram.min)
+                merged.max = histogram.max if merged.max is None else max(merged.max, histogram.max)
+                merged.buckets = [a + b for a, b in zip(merged.buckets, histogram.buckets)]
+        return merged
+    
+    def to_dict(self) -> Dict[str, List[Dict]]:
+        """Every counter and histogram, as lists of {name, labels, ...} sorted by name and labels."""
+        with self._lock:
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {'name': name, 'labels': dict(labels), **histogram.to_dict()}
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ]
+        return {'counters': counters, 'histograms': histograms}
+    
+    def prometheus(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """The metrics in the Prometheus text exposition format, plus unlabelled `gauges`."""
+        lines = []
+        
+        def series(name: str, labels: Labels, value: float, extra: Labels = ()):
+            pairs = labels + extra
+            label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in pairs)
+            lines.append(f"{PROMETHEUS_PREFIX}{name}{{{label_text}}} {_number(value)}" if pairs
+                         else f"{PROMETHEUS_PREFIX}{name} {_number(value)}")
+        
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} gauge")
+            series(name, (), value)
+        
+        previous = None
+        for (name, labels), value in counters:
+            if name != previous:
+                lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} counter")
+                previous = name
+            series(name, labels, value)
+        
+        for (name, labels), histogram in histograms:
+            if name != previous:
+                lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} histogram")
+                previous = name
+            for bound, cumulative in zip(BUCKETS, histogram.buckets):
+                series(f"{name}_bucket", labels, cumulative, (('le', f"{bound:g}"),))
+            series(f"{name}_bucket", labels, histogram.count, (('le', "+Inf"),))
+            series(f"{name}_sum", labels, histogram.sum)
+            series(f"{name}_count", labels, histogram.count)
+        
+        return "\n".join(lines) + "\n"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_atomic(path: str, text: Union[str, bytes]):
+    """
+    Write a file (text, or bytes as is) through a temporary file and a
+    rename, so that readers (such as the textfile collector or a web
+    server) never see a partial file.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if isinstance(text, bytes):
+        with open(tmp, 'wb') as f:
+            f.write(text)
+    else:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(text)
+    os.replace(tmp, path)
+
+
+def write_json(path: str, report: Dict):
+    """Write a run report as indented JSON."""
+    write_atomic(path, json.dumps(report, indent=2, ensure_ascii=False, default=str) + "\n")
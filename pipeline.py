@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Process-pool parsing stage.
+Parsing detail pages is CPU-bound, so it runs in a pool of worker processes
+while the fetching side keeps downloading. The amount of work handed to the
+pool is bounded: the page source is only advanced when a slot frees up, so
+a slow parser throttles the fetchers instead of letting raw pages pile up
+in memory.
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+# Marks the end of a PageQueue
+_DONE = object()
+
+
+class PageQueue:
+    """
+    Bounded hand-off between fetcher threads and the parsing stage.
+    put() blocks while the queue is full, which is the backpressure that
+    keeps memory flat when parsing falls behind.
+    """
+    
+    def __init__(self, maxsize: int):
+        self._queue = queue.Queue(maxsize)
+    
+    def put(self, item: Any):
+        self._queue.put(item)
+    
+    def close(self):
+        """Signal that no more items will be put."""
+        self._queue.put(_DONE)
+    
+    def __iter__(self) -> Iterator[Any]:
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            yield item
+
+
+def start_fetcher(target: Callable[[PageQueue], None], maxsize: int) -> PageQueue:
+    """
+    Run `target(pages)` in a background thread and return the queue it fills.
+    The queue is closed when the target returns, even if it fails.
+    """
+    pages = PageQueue(maxsize)
+    
+    def run():
+        try:
+            target(pages)
+        finally:
+            pages.close()
+    
+    threading.Thread(target=run, daemon=True).start()
+    return pages
+
+
+class ParsePipeline:
+    """
+    Applies `func(content, url)` to pages in a ProcessPoolExecutor, keeping
+    at most `max_pending` pages submitted but not yet collected. The worker
+    processes are started by the first map() and reused by the next ones
+    until close(), so that a crawl parsing its pages round by round starts
+    them once.
+    """
+    
+    def __init__(self, func: Callable[[bytes, str], Any], workers: Optional[int] = None,
+                 max_pending: Optional[int] = None):
+        self.func = func
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self._executor: Optional[ProcessPoolExecutor] = None
+    
+    def close(self):
+        """Shut the worker processes down."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+    
+    def map(self, pages: Iterable[Tuple[Any, bytes, str]]) -> Iterator[Tuple[Any, Any, Optional[BaseException]]]:
+        """
+        Parse (key, content, url) items. Yields (key, result, None) or
+        (key, None, exception) in completion order.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        pending = {}
+        source = iter(pages)
+        exhausted = False
+        
+        try:
+            while pending or not exhausted:
+                while not exhausted and len(pending) < self.max_pending:
+                    try:
+                        key, content, url = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending[self._executor.submit(self.func, content, url)] = key
+                
+                if not pending:
+                    break
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = pending.pop(future)
+                    error = future.exception()
+                    yield key, (None if error else future.result()), error
+        finally:
+            # Pages left over when the caller stops early are not parsed
+            for future in pending:
+                future.cancel()
@@ -3,155 +3,670 @@
 Utility script to query the cooperatives database.
 """
 
+import argparse
+import csv
+import json
+import math
+import re
+import shlex
 import sqlite3
 import sys
-from tabulate import tabulate
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
 
+from dedup import dedup_listings, dedup_report, not_duplicate
+from export import EXPORT_DIR, export, export_report
+from geocode import bounding_box, distance_sql, register_math_functions
+from history import diff_runs, latest_run, list_runs, listing_as_of, listing_changes
+from schema import init_schema
+from stats import read_stats, refresh_stats
 
-def query_listings(query_type="all", **kwargs):
-    """Query listings from the database."""
-    conn = sqlite3.connect("cooperatives.db")
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+DB_NAME = "cooperatives.db"
+
+# Listing columns plus the comma-separated dwelling types of each listing
+LISTING_COLUMNS = """
+    listings.*,
+        (SELECT GROUP_CONCAT(dwelling_type) FROM (
+            SELECT dwelling_type FROM listing_dwelling_types
+            WHERE listing_id = listings.id ORDER BY dwelling_type
+        )) AS dwelling_types
+"""
+
+# Active listings, less the duplicates of another one
+LISTING_SELECT = f"""
+    SELECT {LISTING_COLUMNS}
+    FROM listings
+    WHERE is_active = 1 AND {not_duplicate()}
+"""
+
+# bm25() weights of the listings_fts columns: name, address, notes
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0)
+
+# Rows read from the cursor at a time by the streaming outputs
+FETCH_BATCH = 500
+
+# Column widths of the "table" output
+TABLE_WIDTHS = {
+    "ID": 6, "Name": 40, "Address": 40, "Email": 30, "Phone": 14, "Zone": 4, "Sector": 28,
+    "Dwelling": 12, "Car Parking": 11, "Bike Parking": 12, "Distance": 10,
+}
+
+
+def connect() -> sqlite3.Connection:
+    """Open the database, bringing its schema up to date."""
+    conn = sqlite3.connect(DB_NAME)
+    init_schema(conn)
+    register_math_functions(conn)
+    return conn
+
+
+def match_expression(terms: Iterable[str]) -> str:
+    """
+    Build an FTS5 query matching listings that contain every term, each
+    one as a prefix. Terms are quoted, so FTS5 operators in user input are
+    searched for literally.
+    """
+    words = [word for term in terms for word in re.findall(r"\w+", term)]
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_query(terms: Iterable[str], limit: Optional[int] = None) -> Tuple[str, tuple]:
+    """SQL and parameters of a full-text search, best matches first."""
+    weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+    # listings_fts only holds active listings, so ranking and cutting happen
+    # in the index alone; listings are joined for the rows returned
+    sql = f"""
+        SELECT {LISTING_COLUMNS}
+        FROM (
+            SELECT rowid AS id, bm25(listings_fts, {weights}) AS score
+            FROM listings_fts
+            WHERE listings_fts MATCH ? AND {not_duplicate('listings_fts.rowid')}
+            ORDER BY score, id
+            {"LIMIT ?" if limit is not None else ""}
+        ) AS ranked
+        JOIN listings ON listings.id = ranked.id
+        ORDER BY ranked.score, ranked.id
+    """
+    params = (match_expression(terms),)
+    if limit is not None:
+        params += (limit,)
+    return sql, params
+
+
+def near_query(latitude: float, longitude: float, km: float, limit: Optional[int] = None) -> Tuple[str, tuple]:
+    """
+    SQL and parameters of the listings within `km` of a point, nearest
+    first. The R*Tree narrows them down to a bounding box, and only the
+    points in the box get their distance computed.
+    """
+    # listings_rtree only holds active listings with coordinates, so the
+    # distances, the ordering and the cut all happen in the index alone.
+    # It stores each point as a box rounded outwards to single precision,
+    # whose centre is within half a metre of the exact point.
+    sql = f"""
+        SELECT {LISTING_COLUMNS}, nearby.distance_km
+        FROM (
+            SELECT id, distance_km FROM (
+                SELECT id, {distance_sql('(min_lat + max_lat) / 2', '(min_lon + max_lon) / 2')} AS distance_km
+                FROM listings_rtree
+                WHERE max_lat >= ?4 AND min_lat <= ?5 AND max_lon >= ?6 AND min_lon <= ?7
+                    AND {not_duplicate('listings_rtree.id')}
+            )
+            WHERE distance_km <= ?8
+            ORDER BY distance_km, id
+            {"LIMIT ?9" if limit is not None else ""}
+        ) AS nearby
+        JOIN listings ON listings.id = nearby.id
+        ORDER BY nearby.distance_km, nearby.id
+    """
+    params = (latitude, longitude, math.cos(math.radians(latitude)), *bounding_box(latitude, longitude, km), km)
+    if limit is not None:
+        params += (limit,)
+    return sql, params
+
+
+def listing_query(query_type: str = "all", after: Optional[Tuple[str, Optional[int]]] = None,
+                  limit: Optional[int] = None, **kwargs) -> Tuple[str, tuple]:
+    """
+    Return the SQL and parameters of one of the canned listing queries.
+    Results are ordered by (name, id); `after` = (name, id or None) starts
+    after that key, so pages can be fetched without OFFSET. Search results
+    are ranked instead and only support `limit`.
+    """
+    if query_type == "search":
+        if after is not None:
+            raise ValueError("Search results are ranked by relevance; --after-name does not apply")
+        sql, params = search_query(kwargs.get("terms", ()), limit)
+        # Terms made only of punctuation leave nothing to MATCH, which FTS5 rejects
+        if not params[0]:
+            raise ValueError("no search terms")
+        return sql, params
+    if query_type == "near":
+        if after is not None:
+            raise ValueError("Nearby listings are ordered by distance; --after-name does not apply")
+        return near_query(kwargs.get("latitude"), kwargs.get("longitude"), kwargs.get("km"), limit)
     
     if query_type == "all":
-        cursor.execute("SELECT * FROM listings ORDER BY name")
+        conditions, params = "", ()
     elif query_type == "zone":
-        zone = kwargs.get("zone")
-        cursor.execute("SELECT * FROM listings WHERE zone = ? ORDER BY name", (zone,))
+        conditions, params = "AND zone = ?", (kwargs.get("zone"),)
     elif query_type == "sector":
-        sector = kwargs.get("sector")
-        cursor.execute("SELECT * FROM listings WHERE sector = ? ORDER BY name", (sector,))
+        conditions, params = "AND sector = ?", (kwargs.get("sector"),)
     elif query_type == "parking":
-        parking_type = kwargs.get("parking_type", "car")
-        if parking_type == "car":
-            cursor.execute("SELECT * FROM listings WHERE has_car_parking = 1 ORDER BY name")
+        if kwargs.get("parking_type", "car") == "car":
+            conditions, params = "AND has_car_parking = 1", ()
         else:
-            cursor.execute("SELECT * FROM listings WHERE has_bike_parking = 1 ORDER BY name")
+            conditions, params = "AND has_bike_parking = 1", ()
     elif query_type == "dwelling":
-        dwelling_type = kwargs.get("dwelling_type")
-        cursor.execute("SELECT * FROM listings WHERE dwelling_type = ? ORDER BY name", (dwelling_type,))
+        conditions = "AND EXISTS (SELECT 1 FROM listing_dwelling_types WHERE listing_id = listings.id AND dwelling_type = ?)"
+        params = (kwargs.get("dwelling_type"),)
     else:
-        print(f"Unknown query type: {query_type}")
-        return
+        raise ValueError(f"Unknown query type: {query_type}")
     
-    rows = cursor.fetchall()
+    if after is not None:
+        name, listing_id = after
+        if listing_id is None:
+            conditions += " AND name > ?"
+            params += (name,)
+        else:
+            conditions += " AND (name, id) > (?, ?)"
+            params += (name, listing_id)
     
-    if not rows:
-        print("No listings found.")
-        return
+    sql = f"{LISTING_SELECT} {conditions} ORDER BY name, id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params += (limit,)
+    return sql, params
+
+
+def iter_rows(cursor: sqlite3.Cursor, batch_size: int = FETCH_BATCH) -> Iterator[sqlite3.Row]:
+    """Yield the rows of an executed query, holding at most one batch in memory."""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def display_row(row: sqlite3.Row) -> Dict[str, object]:
+    """A listing as shown in the grid and table outputs."""
+    return {
+        "ID": row["id"],
+        "Name": row["name"],
+        "Address": row["address"][:50] + "..." if len(row["address"]) > 50 else row["address"],
+        "Email": row["email"] or "N/A",
+        "Phone": row["phone"] or "N/A",
+        "Zone": row["zone"] or "N/A",
+        "Sector": row["sector"],
+        "Dwelling": ", ".join(f"{d}½" for d in (row["dwelling_types"] or "").split(",") if d),
+        "Car Parking": "Yes" if row["has_car_parking"] else "No",
+        "Bike Parking": "Yes" if row["has_bike_parking"] else "No",
+        **({"Distance": f"{row['distance_km']:.2f} km"} if "distance_km" in row.keys() else {}),
+    }
+
+
+def export_row(row: sqlite3.Row) -> Dict[str, object]:
+    """A listing as written by the csv and ndjson outputs: untruncated values."""
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "address": row["address"],
+        "email": row["email"],
+        "phone": row["phone"],
+        "url": row["url"],
+        "zone": row["zone"],
+        "sector": row["sector"],
+        "dwelling_types": [int(d) for d in (row["dwelling_types"] or "").split(",") if d],
+        "has_car_parking": bool(row["has_car_parking"]),
+        "has_bike_parking": bool(row["has_bike_parking"]),
+        "latitude": row["latitude"],
+        "longitude": row["longitude"],
+        **({"distance_km": row["distance_km"]} if "distance_km" in row.keys() else {}),
+    }
+
+
+def write_table(rows: Iterable[sqlite3.Row], out: Optional[TextIO] = None):
+    """Fixed-width table, one line per row as it arrives."""
+    out = out or sys.stdout
+    line = None
     
-    # Convert to list of dicts for tabulate
-    data = []
-    for row in rows:
-        data.append({
-            "ID": row["id"],
-            "Name": row["name"],
-            "Address": row["address"][:50] + "..." if len(row["address"]) > 50 else row["address"],
-            "Email": row["email"] or "N/A",
-            "Phone": row["phone"] or "N/A",
-            "Zone": row["zone"] or "N/A",
-            "Sector": row["sector"],
-            "Dwelling": f"{row['dwelling_type']}½",
-            "Car Parking": "Yes" if row["has_car_parking"] else "No",
-            "Bike Parking": "Yes" if row["has_bike_parking"] else "No",
-        })
-    
-    print(tabulate(data, headers="keys", tablefmt="grid"))
-    print(f"\nTotal: {len(rows)} listings")
+    def header(columns):
+        widths = [TABLE_WIDTHS[column] for column in columns]
+        line = "  ".join(f"{{:<{width}.{width}}}" for width in widths)
+        print(line.format(*columns), file=out)
+        print(line.format(*("-" * width for width in widths)), file=out)
+        return line
     
-    conn.close()
+    for row in rows:
+        data = display_row(row)
+        # The columns depend on the query (e.g. Distance for near)
+        if line is None:
+            line = header(list(data))
+        print(line.format(*(str(value) for value in data.values())), file=out)
+    if line is None:
+        header([column for column in TABLE_WIDTHS if column != "Distance"])
+
+
+def write_csv(rows: Iterable[sqlite3.Row], out: Optional[TextIO] = None):
+    out = out or sys.stdout
+    writer = None
+    for row in rows:
+        data = export_row(row)
+        data["dwelling_types"] = ",".join(str(d) for d in data["dwelling_types"])
+        if writer is None:
+            writer = csv.DictWriter(out, fieldnames=list(data))
+            writer.writeheader()
+        writer.writerow(data)
+
+
+def write_ndjson(rows: Iterable[sqlite3.Row], out: Optional[TextIO] = None):
+    out = out or sys.stdout
+    for row in rows:
+        out.write(json.dumps(export_row(row), ensure_ascii=False) + "\n")
 
 
-def stats():
-    """Show database statistics."""
-    conn = sqlite3.connect("cooperatives.db")
+STREAM_WRITERS = {
+    "table": write_table,
+    "csv": write_csv,
+    "ndjson": write_ndjson,
+}
+
+
+def query_listings(query_type="all", output_format="grid", after=None, limit=None, **kwargs):
+    """
+    Query listings from the database. The "grid" format loads every row to
+    align the columns; "table", "csv" and "ndjson" stream rows as they are
+    read. With `limit`, the key to pass as `after` for the next page is
+    printed to stderr.
+    """
+    try:
+        sql, params = listing_query(query_type, after, limit, **kwargs)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    
+    conn = connect()
+    conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
+    cursor.execute(sql, params)
     
-    # Total listings
-    cursor.execute("SELECT COUNT(*) FROM listings")
-    total = cursor.fetchone()[0]
+    count = 0
+    last = None
     
-    # By zone
-    cursor.execute("SELECT zone, COUNT(*) FROM listings GROUP BY zone ORDER BY zone")
-    by_zone = cursor.fetchall()
+    def counted(rows):
+        nonlocal count, last
+        for row in rows:
+            count += 1
+            last = row
+            yield row
     
-    # By sector
-    cursor.execute("SELECT sector, COUNT(*) FROM listings GROUP BY sector ORDER BY sector")
-    by_sector = cursor.fetchall()
+    if output_format == "grid":
+        from tabulate import tabulate
+        data = [display_row(row) for row in counted(iter_rows(cursor))]
+        if data:
+            print(tabulate(data, headers="keys", tablefmt="grid"))
+    else:
+        STREAM_WRITERS[output_format](counted(iter_rows(cursor)))
+        sys.stdout.flush()
     
-    # By dwelling type
-    cursor.execute("SELECT dwelling_type, COUNT(*) FROM listings GROUP BY dwelling_type ORDER BY dwelling_type")
-    by_dwelling = cursor.fetchall()
+    conn.close()
     
-    # Parking stats
-    cursor.execute("SELECT COUNT(*) FROM listings WHERE has_car_parking = 1")
-    with_car_parking = cursor.fetchone()[0]
+    # Keep the summary off stdout for the machine-readable formats
+    summary = sys.stdout if output_format in ("grid", "table") else sys.stderr
+    if count == 0:
+        print("No listings found.", file=summary)
+        return
+    print(f"\nTotal: {count} listings", file=summary)
+    if limit is not None and count == limit and query_type not in ("search", "near"):
+        print(f"Next page: --after-name {shlex.quote(last['name'])} --after-id {last['id']}", file=summary)
+
+
+def stats(as_json: bool = False, refresh: bool = False):
+    """
+    Show database statistics, as precomputed by the last crawl. They are
+    computed now if the database has never been crawled with this version,
+    or with `refresh`.
+    """
+    conn = connect()
+    summary = None if refresh else read_stats(conn)
+    if summary is None:
+        summary = refresh_stats(conn)
+    conn.close()
+    
+    if as_json:
+        print(json.dumps({
+            'total': summary['total'],
+            'car_parking': summary['car_parking'],
+            'bike_parking': summary['bike_parking'],
+            'duplicates': summary['duplicates'],
+            'by_zone': {str(zone): count for zone, count in summary['zone'].items()},
+            'by_sector': summary['sector'],
+            'by_dwelling_type': {str(d): count for d, count in summary['dwelling_type'].items()},
+            'refreshed_at': summary['refreshed_at'],
+        }, ensure_ascii=False, sort_keys=True))
+        return
     
-    cursor.execute("SELECT COUNT(*) FROM listings WHERE has_bike_parking = 1")
-    with_bike_parking = cursor.fetchone()[0]
+    def ordered(breakdown):
+        # NULL keys (e.g. a sector without a zone) sort first, like ORDER BY
+        return sorted(breakdown.items(), key=lambda item: (item[0] is not None, item[0]))
     
     print("=" * 50)
     print("DATABASE STATISTICS")
     print("=" * 50)
-    print(f"\nTotal listings: {total}")
+    print(f"\nTotal listings: {summary['total']}")
     
     print("\nBy Zone:")
-    for zone, count in by_zone:
+    for zone, count in ordered(summary['zone']):
         print(f"  Zone {zone}: {count}")
     
     print("\nBy Sector:")
-    for sector, count in by_sector:
+    for sector, count in ordered(summary['sector']):
         print(f"  {sector}: {count}")
     
     print("\nBy Dwelling Type:")
-    for dwelling, count in by_dwelling:
+    for dwelling, count in ordered(summary['dwelling_type']):
         print(f"  {dwelling}½: {count}")
     
     print("\nParking:")
-    print(f"  With car parking: {with_car_parking}")
-    print(f"  With bike parking: {with_bike_parking}")
+    print(f"  With car parking: {summary['car_parking']}")
+    print(f"  With bike parking: {summary['bike_parking']}")
+    if summary['duplicates']:
+        print(f"\nDuplicates left out: {summary['duplicates']} (query_db.py dedup)")
+    print(f"\nAs of {summary['refreshed_at']}")
     print("=" * 50)
+
+
+def show_runs():
+    """List the crawl runs and the number of changes each recorded."""
+    conn = connect()
+    rows = list_runs(conn)
+    conn.close()
+    if not rows:
+        print("No runs recorded yet.")
+        return
+    from tabulate import tabulate
+    print(tabulate([
+        {"Run": run_id, "Kind": kind, "Started": started_at, "Finished": finished_at or "(not finished)",
+         "Changes": changes}
+        for run_id, kind, started_at, finished_at, changes in rows
+    ], headers="keys", tablefmt="simple"))
+
+
+def show_diff(run_a: Optional[int] = None, run_b: Optional[int] = None, as_json: bool = False):
+    """
+    Show what changed between two runs, listing by listing: the latest run
+    against the one before it by default.
+    """
+    conn = connect()
+    if run_b is None:
+        run_b = latest_run(conn)
+    if run_a is None:
+        run_a = max(run_b - 1, 0)
+    changes = diff_runs(conn, run_a, run_b)
     
+    count = 0
+    listing_id = None
+    for change in changes:
+        count += 1
+        if as_json:
+            print(json.dumps(change._asdict(), ensure_ascii=False))
+            continue
+        if change.listing_id != listing_id:
+            listing_id = change.listing_id
+            print(f"\n#{change.listing_id} {change.name}")
+        if change.field == 'is_active' and None in (change.old, change.new):
+            print("  added" if change.old is None else "  not stored yet")
+            continue
+        print(f"  {change.field}: {'—' if change.old is None else change.old} → "
+              f"{'—' if change.new is None else change.new}")
     conn.close()
+    
+    summary = sys.stderr if as_json else sys.stdout
+    print(f"\n{count} changes between run {run_a} and run {run_b}", file=summary)
 
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage:")
-        print("  python query_db.py stats                    # Show statistics")
-        print("  python query_db.py all                      # Show all listings")
-        print("  python query_db.py zone <zone_number>       # Show listings by zone")
-        print("  python query_db.py sector <sector_name>    # Show listings by sector")
-        print("  python query_db.py parking [car|bike]       # Show listings with parking")
-        print("  python query_db.py dwelling <type>          # Show listings by dwelling type")
-        sys.exit(1)
+def show_history(listing_id: int, as_of: Optional[int] = None):
+    """Show the recorded changes of a listing, or its fields as of a run."""
+    conn = connect()
+    if as_of is not None:
+        fields = listing_as_of(conn, listing_id, as_of)
+        if fields is None:
+            print(f"Listing {listing_id} was not stored yet at run {as_of}")
+        else:
+            print(f"Listing {listing_id} as of run {as_of}:")
+            for field, value in fields.items():
+                print(f"  {field}: {'—' if value is None else value}")
+        conn.close()
+        return
     
-    command = sys.argv[1]
+    changes = listing_changes(conn, listing_id)
+    conn.close()
+    if not changes:
+        print(f"No history for listing {listing_id}")
+        return
+    run = None
+    for run_id, field, old, new in changes:
+        if run_id != run:
+            run = run_id
+            print(f"Run {run_id}:")
+        if field == 'is_active' and old is None:
+            print("  created")
+        else:
+            print(f"  {field}: {'—' if old is None else old} → {'—' if new is None else new}")
+
+
+def show_duplicates(refresh: bool = False):
+    """
+    Show the cooperatives listed more than once, as found by the last
+    crawl: each canonical listing, then its duplicates and what they
+    matched on. With `refresh`, look for them again first.
+    """
+    conn = connect()
+    if refresh:
+        print(dedup_report(dedup_listings(conn)))
+        refresh_stats(conn)
+    rows = conn.execute("""
+        SELECT canonical.id, canonical.name, canonical.address, canonical.phone,
+            duplicate.id, duplicate.name, duplicate.url, listing_duplicates.matched_on
+        FROM listing_duplicates
+        JOIN listings AS canonical ON canonical.id = listing_duplicates.canonical_id
+        JOIN listings AS duplicate ON duplicate.id = listing_duplicates.listing_id
+        WHERE duplicate.is_active = 1
+        ORDER BY canonical.name, canonical.id, duplicate.id
+    """).fetchall()
+    conn.close()
+    if not rows:
+        print("No duplicates found.")
+        return
     
-    if command == "stats":
-        stats()
-    elif command == "all":
-        query_listings("all")
-    elif command == "zone":
-        if len(sys.argv) < 3:
-            print("Error: Zone number required")
-            sys.exit(1)
-        query_listings("zone", zone=int(sys.argv[2]))
-    elif command == "sector":
-        if len(sys.argv) < 3:
-            print("Error: Sector name required")
-            sys.exit(1)
-        query_listings("sector", sector=sys.argv[2])
-    elif command == "parking":
-        parking_type = sys.argv[2] if len(sys.argv) > 2 else "car"
-        query_listings("parking", parking_type=parking_type)
-    elif command == "dwelling":
-        if len(sys.argv) < 3:
-            print("Error: Dwelling type required (5, 6, or 7)")
+    canonical_id = None
+    for listing_id, name, address, phone, duplicate_id, duplicate_name, url, matched_on in rows:
+        if listing_id != canonical_id:
+            canonical_id = listing_id
+            print(f"\n#{listing_id} {name}\n  {address}{f' · {phone}' if phone else ''}")
+        print(f"  = #{duplicate_id} {duplicate_name} (same {matched_on.replace(',', ', ')})\n    {url}")
+    print(f"\n{len(rows)} duplicates of {len({row[0] for row in rows})} cooperatives")
+
+
+def export_snapshots(out_dir: str = EXPORT_DIR):
+    """Write the static JSON snapshots for the web interface (see export.py)."""
+    conn = connect()
+    try:
+        print(export_report(out_dir, export(conn, out_dir)))
+    finally:
+        conn.close()
+
+
+# Queries checked by `explain`: the canned queries above, and the
+# filter combinations and lookups of index.php
+EXPLAIN_QUERIES = [
+    ("all", *listing_query("all")),
+    ("zone", *listing_query("zone", zone=2)),
+    ("sector", *listing_query("sector", sector="Outremont")),
+    ("parking car", *listing_query("parking", parking_type="car")),
+    ("parking bike", *listing_query("parking", parking_type="bike")),
+    ("dwelling", *listing_query("dwelling", dwelling_type=5)),
+    ("all, next page", *listing_query("all", after=("M", 1), limit=100)),
+    ("search", *listing_query("search", limit=20, terms=["ahunt", "cote"])),
+    ("near", *listing_query("near", limit=20, latitude=45.5236, longitude=-73.5817, km=2)),
+    ("sector, next page", *listing_query("sector", after=("M", None), limit=100, sector="Outremont")),
+    ("index.php zone + car parking",
+     f"{LISTING_SELECT} AND zone = ? AND has_car_parking = 1 ORDER BY name", (2,)),
+    ("index.php sector + dwelling",
+     f"""{LISTING_SELECT} AND sector = ?
+     AND EXISTS (SELECT 1 FROM listing_dwelling_types WHERE listing_id = listings.id AND dwelling_type = ?) ORDER BY name""",
+     ("Outremont", 6)),
+    ("index.php zone + dwelling + bike parking",
+     f"""{LISTING_SELECT} AND zone = ? AND has_bike_parking = 1
+     AND EXISTS (SELECT 1 FROM listing_dwelling_types WHERE listing_id = listings.id AND dwelling_type = ?) ORDER BY name""",
+     (3, 7)),
+    ("index.php search",
+     f"{LISTING_SELECT} AND id IN (SELECT rowid FROM listings_fts WHERE listings_fts MATCH ?) ORDER BY name",
+     ('"erab"*',)),
+    ("index.php sectors",
+     "SELECT DISTINCT sector FROM listings WHERE is_active = 1 AND sector IS NOT NULL ORDER BY sector", ()),
+    ("index.php zones",
+     "SELECT DISTINCT zone FROM listings WHERE is_active = 1 AND zone IS NOT NULL ORDER BY zone", ()),
+    ("index.php notes",
+     "SELECT * FROM notes WHERE listing_id IN (?, ?, ?) ORDER BY listing_id, created_at DESC", (1, 2, 3)),
+]
+
+# A plan step reading a whole table rather than an index or a subquery
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+MATERIALIZE = re.compile(r"^MATERIALIZE (\w+)$")
+
+
+def explain() -> bool:
+    """
+    Print the query plan of every query in EXPLAIN_QUERIES. Returns False
+    if any of them scans a whole table.
+    """
+    conn = connect()
+    ok = True
+    
+    for name, sql, params in EXPLAIN_QUERIES:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        # Reading a materialized subquery (e.g. the ranked FTS matches) is not a table scan
+        details = [detail for _, _, _, detail in plan]
+        subqueries = {match.group(1) for match in map(MATERIALIZE.match, details) if match}
+        scans = [match.group(0) for match in map(FULL_SCAN.match, details)
+                 if match and match.group(1) not in subqueries]
+        ok = ok and not scans
+        print(f"{'FULL SCAN' if scans else 'ok':>9}  {name}")
+        for detail in details:
+            print(f"           {detail}")
+    
+    conn.close()
+    return ok
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Query the cooperatives database.")
+    parser.add_argument('--db', default=DB_NAME, help=f"SQLite database path (default: {DB_NAME})")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    stats_parser = commands.add_parser('stats', help="Show statistics")
+    stats_parser.add_argument('--json', action='store_true', help="Print the statistics as one JSON object")
+    stats_parser.add_argument('--refresh', action='store_true',
+                              help="Recompute the statistics instead of reading those of the last crawl")
+    
+    # Output and pagination options shared by the listing commands
+    listing_options = argparse.ArgumentParser(add_help=False)
+    listing_options.add_argument('--format', choices=['grid', 'table', 'csv', 'ndjson'], default='grid',
+                                 help="grid loads all rows to align columns; the others stream (default: grid)")
+    listing_options.add_argument('--limit', type=int, default=None, help="Show at most this many listings")
+    listing_options.add_argument('--after-name', default=None,
+                                 help="Start after this name (results are ordered by name, then id)")
+    listing_options.add_argument('--after-id', type=int, default=None,
+                                 help="With --after-name, start after this listing id among equal names")
+    
+    commands.add_parser('all', parents=[listing_options], help="Show all listings")
+    commands.add_parser('zone', parents=[listing_options], help="Show listings by zone").add_argument(
+        'zone', type=int)
+    commands.add_parser('sector', parents=[listing_options], help="Show listings by sector").add_argument(
+        'sector')
+    commands.add_parser('parking', parents=[listing_options], help="Show listings with parking").add_argument(
+        'parking_type', nargs='?', choices=['car', 'bike'], default='car')
+    commands.add_parser('dwelling', parents=[listing_options], help="Show listings by dwelling type").add_argument(
+        'dwelling_type', type=int, choices=[5, 6, 7])
+    search_parser = commands.add_parser('search', parents=[listing_options],
+                                        help="Full-text search of names, addresses and notes")
+    search_parser.add_argument('terms', nargs='+',
+                               help="Words to look for; each matches as a prefix, ignoring case and accents")
+    near_parser = commands.add_parser('near', parents=[listing_options],
+                                      help="Listings within a distance of a point, nearest first (see geocode.py)")
+    near_parser.add_argument('latitude', type=float)
+    near_parser.add_argument('longitude', type=float)
+    near_parser.add_argument('km', type=float, help="Distance in kilometres")
+    commands.add_parser('runs', help="List the crawl runs recorded in the history")
+    diff_parser = commands.add_parser('diff', help="Show what changed between two runs")
+    diff_parser.add_argument('run_a', type=int, nargs='?', default=None,
+                             help="Run to compare from (default: the one before run_b)")
+    diff_parser.add_argument('run_b', type=int, nargs='?', default=None, help="Run to compare to (default: the latest)")
+    diff_parser.add_argument('--json', action='store_true', help="Print one JSON object per changed field")
+    history_parser = commands.add_parser('history', help="Show the changes of a listing across runs")
+    history_parser.add_argument('listing_id', type=int)
+    history_parser.add_argument('--as-of', type=int, default=None, metavar='RUN',
+                                help="Show the listing as it stood at the end of this run instead")
+    dedup_parser = commands.add_parser('dedup', help="Show the cooperatives listed more than once")
+    dedup_parser.add_argument('--refresh', action='store_true',
+                              help="Look for duplicates again instead of showing those of the last crawl")
+    export_parser = commands.add_parser('export', help="Write the static JSON snapshots for the web interface")
+    export_parser.add_argument('--out', default=EXPORT_DIR, help=f"Output directory (default: {EXPORT_DIR})")
+    commands.add_parser('explain', help="Show query plans; fail if a query scans a whole table")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    global DB_NAME
+    args = parse_args(argv)
+    DB_NAME = args.db
+    
+    if args.command == "stats":
+        stats(args.json, args.refresh)
+        return
+    elif args.command == "runs":
+        show_runs()
+        return
+    elif args.command == "diff":
+        show_diff(args.run_a, args.run_b, args.json)
+        return
+    elif args.command == "history":
+        show_history(args.listing_id, args.as_of)
+        return
+    elif args.command == "dedup":
+        show_duplicates(args.refresh)
+        return
+    elif args.command == "export":
+        export_snapshots(args.out)
+        return
+    elif args.command == "explain":
+        if not explain():
             sys.exit(1)
-        query_listings("dwelling", dwelling_type=int(sys.argv[2]))
-    else:
-        print(f"Unknown command: {command}")
+        return
+    
+    if args.after_id is not None and args.after_name is None:
+        print("Error: --after-id requires --after-name")
         sys.exit(1)
+    after = (args.after_name, args.after_id) if args.after_name is not None else None
+    options = dict(output_format=args.format, after=after, limit=args.limit)
+    
+    if args.command == "all":
+        query_listings("all", **options)
+    elif args.command == "zone":
+        query_listings("zone", zone=args.zone, **options)
+    elif args.command == "sector":
+        query_listings("sector", sector=args.sector, **options)
+    elif args.command == "parking":
+        query_listings("parking", parking_type=args.parking_type, **options)
+    elif args.command == "dwelling":
+        query_listings("dwelling", dwelling_type=args.dwelling_type, **options)
+    elif args.command == "search":
+        if options['limit'] is None:
+            options['limit'] = 20
+        query_listings("search", terms=args.terms, **options)
+    elif args.command == "near":
+        query_listings("near", latitude=args.latitude, longitude=args.longitude, km=args.km, **options)
+
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Database schema for the cooperatives database.
+The base tables are created if missing, then numbered migrations bring
+databases created by older versions of the crawler up to date. The
+version reached is stored in PRAGMA user_version.
+"""
+
+import sqlite3
+
+BASE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS listings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        address TEXT NOT NULL,
+        email TEXT,
+        phone TEXT,
+        url TEXT NOT NULL UNIQUE,
+        has_car_parking INTEGER DEFAULT 0,
+        has_bike_parking INTEGER DEFAULT 0,
+        zone INTEGER,
+        sector TEXT,
+        dwelling_type INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS notes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        note TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        listing_id INTEGER NOT NULL,
+        FOREIGN KEY (listing_id) REFERENCES listings(id) ON DELETE CASCADE
+    )
+    """,
+]
+
+# MIGRATIONS[i] upgrades a database from version i to version i + 1.
+# Only ever append to this list.
+MIGRATIONS = [
+    # 1: A cooperative can appear in the search results of several dwelling
+    # types; listings.dwelling_type only keeps the smallest one.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS listing_dwelling_types (
+            listing_id INTEGER NOT NULL,
+            dwelling_type INTEGER NOT NULL,
+            PRIMARY KEY (listing_id, dwelling_type),
+            FOREIGN KEY (listing_id) REFERENCES listings(id) ON DELETE CASCADE
+        )
+        """,
+        """
+        INSERT OR IGNORE INTO listing_dwelling_types (listing_id, dwelling_type)
+        SELECT id, dwelling_type FROM listings WHERE dwelling_type IS NOT NULL
+        """,
+    ],
+    # 2: Incremental crawls: hash of the relevant part of the detail page,
+    # and soft deletion of listings that no longer appear in the searches.
+    [
+        "ALTER TABLE listings ADD COLUMN content_hash TEXT",
+        "ALTER TABLE listings ADD COLUMN is_active INTEGER NOT NULL DEFAULT 1",
+        "ALTER TABLE listings ADD COLUMN last_seen TIMESTAMP",
+        "UPDATE listings SET last_seen = created_at",
+    ],
+    # 3: Listings are upserted in place instead of replaced, so ids (and the
+    # notes pointing at them) survive re-crawls; track when the data changed.
+    [
+        "ALTER TABLE listings ADD COLUMN updated_at TIMESTAMP",
+        "UPDATE listings SET updated_at = created_at",
+    ],
+    # 4: Indexes for the filters of query_db.py and index.php. All of them
+    # sort on name; the listings ones are partial on is_active = 1, which
+    # every reader query includes literally.
+    [
+        "CREATE INDEX IF NOT EXISTS idx_listings_active_name ON listings(name) WHERE is_active = 1",
+        "CREATE INDEX IF NOT EXISTS idx_listings_active_zone ON listings(zone, name) WHERE is_active = 1",
+        "CREATE INDEX IF NOT EXISTS idx_listings_active_sector ON listings(sector, name) WHERE is_active = 1",
+        """
+        CREATE INDEX IF NOT EXISTS idx_listings_active_car_parking ON listings(name)
+        WHERE is_active = 1 AND has_car_parking = 1
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_listings_active_bike_parking ON listings(name)
+        WHERE is_active = 1 AND has_bike_parking = 1
+        """,
+        # The primary key covers lookups by listing; this one the per-type counts
+        "CREATE INDEX IF NOT EXISTS idx_listing_dwelling_types_type ON listing_dwelling_types(dwelling_type, listing_id)",
+        "CREATE INDEX IF NOT EXISTS idx_notes_listing ON notes(listing_id, created_at)",
+    ],
+    # 5: Precomputed statistics (see stats.py). Scalar counts have a NULL key;
+    # breakdowns have one row per zone, sector or dwelling type.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS listing_stats (
+            dimension TEXT NOT NULL,
+            key TEXT,
+            value INTEGER NOT NULL,
+            refreshed_at TIMESTAMP NOT NULL
+        )
+        """,
+    ],
+    # 6: Full-text index of the names, addresses and notes of active
+    # listings, one row per listing (rowid = listings.id), kept in sync by
+    # triggers. Accents and case are folded; 2- and 3-character prefixes are
+    # indexed.
+    [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS listings_fts USING fts5(
+            name, address, notes,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+        """,
+        """
+        INSERT INTO listings_fts (rowid, name, address, notes)
+        SELECT id, name, address, (SELECT GROUP_CONCAT(note, ' ') FROM notes WHERE listing_id = listings.id)
+        FROM listings WHERE is_active = 1
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS listings_fts_insert AFTER INSERT ON listings
+        WHEN new.is_active = 1 BEGIN
+            INSERT INTO listings_fts (rowid, name, address, notes)
+            VALUES (new.id, new.name, new.address,
+                    (SELECT GROUP_CONCAT(note, ' ') FROM notes WHERE listing_id = new.id));
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS listings_fts_update AFTER UPDATE OF name, address, is_active ON listings
+        WHEN old.name IS NOT new.name OR old.address IS NOT new.address OR old.is_active IS NOT new.is_active BEGIN
+            DELETE FROM listings_fts WHERE rowid = old.id;
+            INSERT INTO listings_fts (rowid, name, address, notes)
+            SELECT new.id, new.name, new.address,
+                (SELECT GROUP_CONCAT(note, ' ') FROM notes WHERE listing_id = new.id)
+            WHERE new.is_active = 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS listings_fts_delete AFTER DELETE ON listings BEGIN
+            DELETE FROM listings_fts WHERE rowid = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+            UPDATE listings_fts
+            SET notes = (SELECT GROUP_CONCAT(note, ' ') FROM notes WHERE listing_id = new.listing_id)
+            WHERE rowid = new.listing_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE OF note, listing_id ON notes BEGIN
+            UPDATE listings_fts
+            SET notes = (SELECT GROUP_CONCAT(note, ' ') FROM notes WHERE listing_id = listings_fts.rowid)
+            WHERE rowid IN (old.listing_id, new.listing_id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+            UPDATE listings_fts
+            SET notes = (SELECT GROUP_CONCAT(note, ' ') FROM notes WHERE listing_id = old.listing_id)
+            WHERE rowid = old.listing_id;
+        END
+        """,
+    ],
+    # 7: Crawl frontier (see frontier.py), so an interrupted crawl can resume.
+    # kind is 'search' (key "sector_id:dwelling_type", page = next results
+    # page) or 'listing' (key = detail page URL).
+    [
+        """
+        CREATE TABLE IF NOT EXISTS crawl_frontier (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            page INTEGER NOT NULL DEFAULT 1,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            PRIMARY KEY (kind, key)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_crawl_frontier_status ON crawl_frontier(kind, status, next_attempt)",
+        """
+        CREATE TABLE IF NOT EXISTS crawl_memberships (
+            url TEXT NOT NULL,
+            sector TEXT NOT NULL,
+            dwelling_type INTEGER NOT NULL,
+            PRIMARY KEY (url, sector, dwelling_type)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_crawl_memberships_search
+        ON crawl_memberships(sector, dwelling_type)
+        """,
+    ],
+    # 8: Several worker processes can share a crawl: each frontier item is
+    # leased to the worker processing it until lease_expires, and
+    # crawl_rate holds the request budget they share per host (the time
+    # its next request would be due without a burst).
+    [
+        "ALTER TABLE crawl_frontier ADD COLUMN lease_owner TEXT",
+        "ALTER TABLE crawl_frontier ADD COLUMN lease_expires REAL NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_crawl_frontier_lease ON crawl_frontier(lease_owner)",
+        """
+        CREATE TABLE IF NOT EXISTS crawl_rate (
+            host TEXT PRIMARY KEY,
+            next_slot REAL NOT NULL
+        )
+        """,
+    ],
+    # 9: Coordinates of the listings (see geocode.py) and the cache of
+    # geocoded addresses, keyed by normalized address (NULL coordinates:
+    # not found). listings_rtree indexes the active listings that have
+    # coordinates, one point per listing (id = listings.id), kept in sync
+    # by triggers. A listing whose address changes loses its coordinates
+    # until it is geocoded again.
+    [
+        "ALTER TABLE listings ADD COLUMN latitude REAL",
+        "ALTER TABLE listings ADD COLUMN longitude REAL",
+        """
+        CREATE TABLE IF NOT EXISTS geocode_cache (
+            address_key TEXT PRIMARY KEY,
+            latitude REAL,
+            longitude REAL,
+            provider TEXT NOT NULL,
+            geocoded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS listings_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS listings_rtree_insert AFTER INSERT ON listings
+        WHEN new.is_active = 1 AND new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+            INSERT INTO listings_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS listings_rtree_update AFTER UPDATE OF latitude, longitude, is_active ON listings
+        WHEN old.latitude IS NOT new.latitude OR old.longitude IS NOT new.longitude
+            OR old.is_active IS NOT new.is_active BEGIN
+            DELETE FROM listings_rtree WHERE id = old.id;
+            INSERT INTO listings_rtree
+            SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+            WHERE new.is_active = 1 AND new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS listings_rtree_delete AFTER DELETE ON listings BEGIN
+            DELETE FROM listings_rtree WHERE id = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS listings_address_update AFTER UPDATE OF address ON listings
+        WHEN old.address IS NOT new.address BEGIN
+            UPDATE listings SET latitude = NULL, longitude = NULL WHERE id = new.id;
+        END
+        """,
+    ],
+    # 10: History of the listings (see history.py). Each crawl is a row of
+    # crawl_runs. listings holds the latest version of every listing, and
+    # listing_history the value a field had before the run that changed
+    # it (reverse deltas), written by triggers under the latest run id (0
+    # before the first run): only the first change of a field in a run is
+    # kept. A listing created in a run gets one is_active row with a NULL
+    # value. Setting a field to its current value writes nothing, so the
+    # history grows with the changes only.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS crawl_runs (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS listing_history (
+            listing_id INTEGER NOT NULL,
+            field TEXT NOT NULL,
+            run_id INTEGER NOT NULL,
+            old_value,
+            PRIMARY KEY (listing_id, field, run_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_listing_history_run ON listing_history(run_id)",
+        """
+        CREATE TRIGGER IF NOT EXISTS listings_history_insert AFTER INSERT ON listings BEGIN
+            INSERT INTO listing_history (listing_id, field, run_id, old_value)
+            VALUES (new.id, 'is_active', (SELECT COALESCE(MAX(id), 0) FROM crawl_runs), NULL)
+            ON CONFLICT (listing_id, field, run_id) DO NOTHING;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS listings_history_update
+        AFTER UPDATE OF name, address, email, phone, zone, sector, has_car_parking, has_bike_parking, is_active
+        ON listings
+        WHEN (old.name, old.address, old.email, old.phone, old.zone, old.sector,
+              old.has_car_parking, old.has_bike_parking, old.is_active)
+          IS NOT (new.name, new.address, new.email, new.phone, new.zone, new.sector,
+                  new.has_car_parking, new.has_bike_parking, new.is_active) BEGIN
+            INSERT INTO listing_history (listing_id, field, run_id, old_value)
+            SELECT new.id, field, (SELECT COALESCE(MAX(id), 0) FROM crawl_runs), value FROM (
+                SELECT 'name' AS field, old.name AS value, old.name IS NOT new.name AS changed
+                UNION ALL SELECT 'address', old.address, old.address IS NOT new.address
+                UNION ALL SELECT 'email', old.email, old.email IS NOT new.email
+                UNION ALL SELECT 'phone', old.phone, old.phone IS NOT new.phone
+                UNION ALL SELECT 'zone', old.zone, old.zone IS NOT new.zone
+                UNION ALL SELECT 'sector', old.sector, old.sector IS NOT new.sector
+                UNION ALL SELECT 'has_car_parking', old.has_car_parking,
+                    old.has_car_parking IS NOT new.has_car_parking
+                UNION ALL SELECT 'has_bike_parking', old.has_bike_parking,
+                    old.has_bike_parking IS NOT new.has_bike_parking
+                UNION ALL SELECT 'is_active', old.is_active, old.is_active IS NOT new.is_active
+            )
+            WHERE changed
+            ON CONFLICT (listing_id, field, run_id) DO NOTHING;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS listing_dwelling_types_history_insert AFTER INSERT ON listing_dwelling_types BEGIN
+            INSERT INTO listing_history (listing_id, field, run_id, old_value)
+            SELECT new.listing_id, 'dwelling_types', (SELECT COALESCE(MAX(id), 0) FROM crawl_runs),
+                (SELECT GROUP_CONCAT(dwelling_type) FROM (
+                    SELECT dwelling_type FROM listing_dwelling_types
+                    WHERE listing_id = new.listing_id AND dwelling_type != new.dwelling_type
+                    ORDER BY dwelling_type
+                ))
+            WHERE true
+            ON CONFLICT (listing_id, field, run_id) DO NOTHING;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS listing_dwelling_types_history_delete AFTER DELETE ON listing_dwelling_types BEGIN
+            INSERT INTO listing_history (listing_id, field, run_id, old_value)
+            SELECT old.listing_id, 'dwelling_types', (SELECT COALESCE(MAX(id), 0) FROM crawl_runs),
+                (SELECT GROUP_CONCAT(dwelling_type) FROM (
+                    SELECT dwelling_type FROM listing_dwelling_types WHERE listing_id = old.listing_id
+                    UNION SELECT old.dwelling_type
+                    ORDER BY 1
+                ))
+            WHERE true
+            ON CONFLICT (listing_id, field, run_id) DO NOTHING;
+        END
+        """,
+    ],
+    # 11: Cooperatives listed more than once (see dedup.py): each duplicate
+    # listing, the listing it duplicates and the keys they matched on.
+    # Rewritten by every dedup pass.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS listing_duplicates (
+            listing_id INTEGER PRIMARY KEY,
+            canonical_id INTEGER NOT NULL,
+            matched_on TEXT NOT NULL,
+            FOREIGN KEY (listing_id) REFERENCES listings(id) ON DELETE CASCADE,
+            FOREIGN KEY (canonical_id) REFERENCES listings(id) ON DELETE CASCADE
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_listing_duplicates_canonical ON listing_duplicates(canonical_id)",
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def init_schema(conn: sqlite3.Connection):
+    """Create the base tables and apply any pending migrations."""
+    cursor = conn.cursor()
+    
+    for statement in BASE_TABLES:
+        cursor.execute(statement)
+    
+    conn.commit()
+    
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        # Each migration and its version bump are applied atomically
+        cursor.execute("BEGIN")
+        try:
+            for statement in MIGRATIONS[target - 1]:
+                cursor.execute(statement)
+            # PRAGMA does not accept bound parameters
+            cursor.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Summary statistics of the active listings.
+Every breakdown is computed in one pass over the listings and stored in the
+listing_stats table, which the crawler refreshes at the end of each run, so
+`query_db.py stats` and index.php only read a handful of precomputed rows.
+The duplicates found by dedup.py are left out of the counts, and counted
+apart.
+"""
+
+import sqlite3
+from typing import Dict, Optional
+
+from dedup import not_duplicate
+
+# Per-listing attributes grouped in a single scan; each group row carries the
+# number of listings sharing that combination.
+AGGREGATE_QUERY = f"""
+    SELECT zone, sector, has_car_parking, has_bike_parking,
+        (SELECT GROUP_CONCAT(dwelling_type) FROM listing_dwelling_types WHERE listing_id = listings.id),
+        COUNT(*)
+    FROM listings
+    WHERE is_active = 1 AND {not_duplicate()}
+    GROUP BY 1, 2, 3, 4, 5
+"""
+
+DUPLICATES_QUERY = """
+    SELECT COUNT(*) FROM listing_duplicates JOIN listings ON listings.id = listing_duplicates.listing_id
+    WHERE is_active = 1
+"""
+
+# Dimensions whose keys are stored as text but are integers
+INTEGER_KEYS = {'zone', 'dwelling_type'}
+
+
+def compute_stats(conn: sqlite3.Connection) -> Dict:
+    """Compute every breakdown of the active listings in one query."""
+    stats = {
+        'total': 0,
+        'car_parking': 0,
+        'bike_parking': 0,
+        'duplicates': conn.execute(DUPLICATES_QUERY).fetchone()[0],
+        'zone': {},
+        'sector': {},
+        'dwelling_type': {},
+    }
+    
+    for zone, sector, car, bike, dwelling_types, count in conn.execute(AGGREGATE_QUERY):
+        stats['total'] += count
+        stats['car_parking'] += count if car else 0
+        stats['bike_parking'] += count if bike else 0
+        stats['zone'][zone] = stats['zone'].get(zone, 0) + count
+        stats['sector'][sector] = stats['sector'].get(sector, 0) + count
+        # A listing counts once for each type it offers
+        for dwelling_type in (dwelling_types.split(',') if dwelling_types else ()):
+            dwelling_type = int(dwelling_type)
+            stats['dwelling_type'][dwelling_type] = stats['dwelling_type'].get(dwelling_type, 0) + count
+    
+    return stats
+
+
+def refresh_stats(conn: sqlite3.Connection) -> Dict:
+    """Recompute the statistics and replace the contents of listing_stats."""
+    stats = compute_stats(conn)
+    rows = [(name, None, stats[name]) for name in ('total', 'car_parking', 'bike_parking', 'duplicates')]
+    rows += [
+        (dimension, None if key is None else str(key), count)
+        for dimension in ('zone', 'sector', 'dwelling_type')
+        for key, count in stats[dimension].items()
+    ]
+    
+    try:
+        conn.execute("DELETE FROM listing_stats")
+        conn.executemany(
+            "INSERT INTO listing_stats (dimension, key, value, refreshed_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
+            rows
+        )
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    
+    return read_stats(conn)
+
+
+def read_stats(conn: sqlite3.Connection) -> Optional[Dict]:
+    """
+    Return the stored statistics, in the shape of compute_stats() plus
+    'refreshed_at', or None if they have never been computed.
+    """
+    rows = conn.execute("SELECT dimension, key, value, refreshed_at FROM listing_stats").fetchall()
+    if not rows:
+        return None
+    
+    stats = {'total': 0, 'car_parking': 0, 'bike_parking': 0, 'duplicates': 0,
+             'zone': {}, 'sector': {}, 'dwelling_type': {}}
+    for dimension, key, value, refreshed_at in rows:
+        stats['refreshed_at'] = refreshed_at
+        if isinstance(stats.get(dimension), dict):
+            if key is not None and dimension in INTEGER_KEYS:
+                key = int(key)
+            stats[dimension][key] = value
+        else:
+            stats[dimension] = value
+    return stats
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+HTTP transport for the crawler's requests.Session.
+A sized connection pool, retries with backoff on 429/5xx that honour
+Retry-After, compressed transfers, and per-request timing (DNS, connect,
+time to first byte, download, bytes on the wire) aggregated over the crawl,
+so that connection reuse and throughput can be checked after a run.
+"""
+
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+
+# Every encoding urllib3 can decode here: gzip and deflate, plus br and
+# zstd when the brotli / zstandard packages are installed
+ACCEPT_ENCODING = make_headers(accept_encoding=True)['accept-encoding'].replace(',', ', ')
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 2
+RETRY_BACKOFF = 0.5        # seconds; urllib3 doubles it on each further retry
+RETRY_AFTER_MAX = 60.0     # longest Retry-After the transport waits for
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Timing of the request in progress on each thread; requests are
+# synchronous, so a thread has at most one in flight
+_local = threading.local()
+
+
+class CappedRetry(Retry):
+    """Retry that waits at most RETRY_AFTER_MAX seconds for a Retry-After header."""
+    
+    def get_retry_after(self, response) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, RETRY_AFTER_MAX)
+
+
+def make_retry(retries: int = DEFAULT_RETRIES) -> Retry:
+    """
+    Retry policy for GET requests: connection errors, read errors and
+    429/5xx responses are retried `retries` times with exponential backoff,
+    or after the delay asked for by Retry-After. Once the retries are used
+    up, the last response is returned as is, so that raise_for_status()
+    reports its status.
+    """
+    return CappedRetry(
+        total=retries,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({'GET', 'HEAD'}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def _timing() -> Optional[Dict]:
+    return getattr(_local, 'timing', None)
+
+
+class _TimedConnection:
+    """
+    Records the DNS lookup, connection setup (TCP and TLS) and time to
+    first byte of each request in the timing of the current thread.
+    """
+    
+    _connected_at = 0.0
+    _request_started = 0.0
+    
+    def _new_conn(self) -> socket.socket:
+        # Resolve the host here, so that the lookup is timed apart from the
+        # TCP handshake, then connect to each address in turn
+        host = self._dns_host
+        start = time.perf_counter()
+        try:
+            addresses = list(dict.fromkeys(
+                info[4][0] for info in socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+            ))
+        except OSError:
+            addresses = [host]  # let urllib3 raise its resolution error
+        timing = _timing()
+        if timing is not None:
+            timing['dns'] += time.perf_counter() - start
+        
+        try:
+            for i, address in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except NewConnectionError:
+                    if i == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = host
+    
+    def connect(self):
+        start = time.perf_counter()
+        timing = _timing()
+        dns = timing['dns'] if timing is not None else 0.0
+        super().connect()
+        self._connected_at = time.perf_counter()
+        if timing is not None:
+            timing['new_connection'] = True
+            timing['connect'] += self._connected_at - start - (timing['dns'] - dns)
+    
+    def request(self, *args, **kwargs):
+        self._request_started = time.perf_counter()
+        return super().request(*args, **kwargs)
+    
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        timing = _timing()
+        if timing is not None:
+            # Plain HTTP connections are opened inside request()
+            timing['ttfb'] = time.perf_counter() - max(self._request_started, self._connected_at)
+        return response
+
+
+class TimedHTTPConnection(_TimedConnection, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnection, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class TransportStats:
+    """
+    Request timings collected by a TransportAdapter (thread-safe).
+    DNS and connect times are only recorded for requests that opened a
+    connection; the others reused one from the pool.
+    """
+    
+    PHASES = ('dns', 'connect', 'ttfb', 'download')
+    
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.retries = 0
+        self.errors = 0
+        self.wire_bytes = 0
+        self.content_bytes = 0
+        self.timings: Dict[str, List[float]] = {phase: [] for phase in self.PHASES}
+        self._lock = threading.Lock()
+    
+    def record(self, timing: Dict):
+        with self._lock:
+            self.requests += 1
+            self.retries += timing['retries']
+            self.wire_bytes += timing['wire_bytes']
+            self.content_bytes += timing['bytes']
+            if timing['new_connection']:
+                self.connections += 1
+                self.timings['dns'].append(timing['dns'])
+                self.timings['connect'].append(timing['connect'])
+            self.timings['ttfb'].append(timing['ttfb'])
+            self.timings['download'].append(timing['download'])
+    
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+    
+    def summary(self) -> Dict:
+        """Counters, and the mean and 95th percentile of each phase in milliseconds."""
+        with self._lock:
+            summary = {
+                'requests': self.requests,
+                'connections': self.connections,
+                'reused': self.requests - self.connections,
+                'retries': self.retries,
+                'errors': self.errors,
+                'wire_bytes': self.wire_bytes,
+                'content_bytes': self.content_bytes,
+            }
+            for phase, values in self.timings.items():
+                summary[phase] = {
+                    'mean_ms': sum(values) / len(values) * 1000 if values else 0.0,
+                    'p95_ms': _percentile(values, 0.95) * 1000 if values else 0.0,
+                }
+        return summary
+    
+    def report(self) -> str:
+        """Summary of transport activity for the end-of-run output."""
+        s = self.summary()
+        reuse = s['reused'] / s['requests'] * 100 if s['requests'] else 0
+        ratio = s['content_bytes'] / s['wire_bytes'] if s['wire_bytes'] else 1
+        phases = ", ".join(f"{phase} {s[phase]['mean_ms']:.1f}/{s[phase]['p95_ms']:.1f}" for phase in self.PHASES)
+        return (f"Transport: {s['requests']} requests over {s['connections']} connections ({reuse:.0f}% reused), "
+                f"{s['retries']} retries, {s['errors']} failed, {s['wire_bytes'] / 1024:.1f} KiB on the wire "
+                f"for {s['content_bytes'] / 1024:.1f} KiB of content ({ratio:.1f}x)\n"
+                f"  ms mean/p95: {phases}")
+
+
+class TransportAdapter(HTTPAdapter):
+    """
+    HTTPAdapter with a pool of `pool_size` connections per host, the retry
+    policy of make_retry() and per-request timing. Callers beyond the pool
+    size wait for a free connection rather than opening one that would be
+    discarded after the request. Responses carry their timing as
+    `response.timing`.
+    """
+    
+    def __init__(self, stats: Optional[TransportStats] = None, pool_size: int = DEFAULT_POOL_SIZE,
+                 retries: int = DEFAULT_RETRIES, **kwargs):
+        self.stats = stats if stats is not None else TransportStats()
+        kwargs.setdefault('max_retries', make_retry(retries))
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True, **kwargs)
+    
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+    
+    def send(self, request: requests.PreparedRequest, stream: bool = False, **kwargs) -> requests.Response:
+        timing = {'dns': 0.0, 'connect': 0.0, 'ttfb': 0.0, 'download': 0.0, 'new_connection': False,
+                  'retries': 0, 'wire_bytes': 0, 'bytes': 0}
+        _local.timing = timing
+        try:
+            response = super().send(request, stream=stream, **kwargs)
+            if not stream:
+                # Read the body here (requests would right after) to time it
+                start = time.perf_counter()
+                timing['bytes'] = len(response.content)
+                timing['download'] = time.perf_counter() - start
+                timing['wire_bytes'] = response.raw.tell()
+        except requests.RequestException:
+            self.stats.record_error()
+            raise
+        finally:
+            _local.timing = None
+        
+        if response.raw.retries is not None:
+            timing['retries'] = len(response.raw.retries.history)
+        response.timing = timing
+        self.stats.record(timing)
+        return response
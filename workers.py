@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Multi-process crawls.
+`crawler.py --workers N` runs the crawl in N worker processes
+(`crawler.py --join`) sharing one database: each claims frontier items
+under a lease (see frontier.py) that its Heartbeat renews while it works,
+and books every request in a RateBudget kept in the same database, so
+that the workers together stay within the politeness budget of a single
+crawler.
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from typing import List
+
+from frontier import Frontier
+
+# Seconds a worker waits for the database lock held by another worker
+BUSY_TIMEOUT = 30.0
+
+
+class Heartbeat:
+    """
+    Renews the leases of a frontier's owner three times per lease period,
+    from a background thread with its own connection, so that an item held
+    through a long search or a slow round is not handed to another worker.
+    """
+    
+    def __init__(self, frontier: Frontier):
+        self.frontier = frontier
+        self.path = frontier.conn.execute("PRAGMA database_list").fetchone()[2]
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+        frontier = Frontier(conn, lease=self.frontier.lease, owner=self.frontier.owner)
+        try:
+            while not self._stop.wait(self.frontier.lease / 3):
+                try:
+                    frontier.renew()
+                except sqlite3.OperationalError as e:
+                    print(f"Could not renew the leases of {frontier.owner}: {e}")
+        finally:
+            conn.close()
+    
+    def __enter__(self) -> 'Heartbeat':
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+class RateBudget:
+    """
+    `rate` requests per second per host, with bursts of up to `burst`,
+    shared by every process using the database (the generic cell rate
+    algorithm: crawl_rate holds the time the next request to each host
+    would be due without a burst). reserve() books the next slot in one
+    short transaction and returns how long to wait for it, so that nobody
+    polls. Thread-safe.
+    """
+    
+    def __init__(self, path: str, rate: float, burst: float = 1):
+        self.interval = 1 / rate
+        # How far ahead of its slot a request may go while the budget is unused
+        self.tolerance = (max(burst, 1) - 1) * self.interval
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        # In WAL mode, commits then skip the fsync; losing the last slots in
+        # a power cut is harmless
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._lock = threading.Lock()
+    
+    def reserve(self, host: str) -> float:
+        """Book the next request to `host`; returns the seconds to wait before sending it."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self._conn.execute("SELECT next_slot FROM crawl_rate WHERE host = ?", (host,)).fetchone()
+                slot = max(row[0] if row else 0.0, now)
+                self._conn.execute("""
+                    INSERT INTO crawl_rate (host, next_slot) VALUES (?, ?)
+                    ON CONFLICT (host) DO UPDATE SET next_slot = excluded.next_slot
+                """, (host, slot + self.interval))
+                self._conn.commit()
+            except sqlite3.Error:
+                self._conn.rollback()
+                raise
+        return max(0.0, slot - self.tolerance - now)
+    
+    def wait(self, host: str):
+        """Sleep until the next request to `host` may be sent."""
+        time.sleep(self.reserve(host))
+    
+    def close(self):
+        self._conn.close()
+
+
+def run_workers(count: int, argv: List[str]) -> int:
+    """
+    Run `count` crawler.py processes with the arguments `argv` (which
+    should include --join) and wait for them. Returns how many failed.
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'crawler.py')
+    processes = [subprocess.Popen([sys.executable, script, *argv]) for _ in range(count)]
+    try:
+        return sum(1 for process in processes if process.wait() != 0)
+    except KeyboardInterrupt:
+        # The workers got the interrupt too; let them release their leases
+        for process in processes:
+            process.wait()
+        raise